@@ -1,10 +1,26 @@
 import os
+import re
+import time
+import random
 import unittest
 from webchecks import Project
 from webchecks.config import config
 from webchecks.utils.constants import *
 from webchecks.access.Gateway import GateWay
 from webchecks.access.RobotsFile import RobotsFile
+from webchecks.access.RequestAsync import RequestAsync
+from webchecks.access.RobotsRules import RobotsRules
+from webchecks.access.security import JavascriptTrustTable
+from webchecks.archive.GlobalCache import GlobalCache
+from webchecks.profiles.profileDB import profiledb, fetch_profile
+from webchecks.profiles.BaseProfile import BaseProfile
+from webchecks.profiles.ProfileConstants import *
+
+try: # optional, for RequestJS
+    import seleniumwire.webdriver
+    SELENIUMWIRE = True
+except ImportError:
+    SELENIUMWIRE = False
 
 
 l = """
@@ -72,6 +88,94 @@ class URLTest(unittest.TestCase):
         self.assertFalse(rob.check_rules(rules, "/trackback/okay.txt"))
         self.assertFalse(rob.check_rules(rules, "/"))
 
+    def test_robots_longest_match(self):
+        rules = RobotsRules()
+        rules.add_rule("/p", True)
+        rules.add_rule("/", False)
+        rules.add_rule("/folder", True)
+        rules.add_rule("/folder", False)
+        rules.add_rule("/*.php$", False)
+        rules.add_rule("/page.php5", True)
+        rules.add_rule("/fish*", True)
+        rules.add_rule("/fish/salmon", False)
+        self.assertEqual(len(rules), 7)
+        self.assertTrue(rules.allows("/page"))
+        self.assertFalse(rules.allows("/other"))
+        self.assertFalse(rules.allows(""))
+        self.assertTrue(rules.allows("/folder/page")) # equally long: Allow wins
+        self.assertFalse(rules.allows("/page.php"))
+        self.assertTrue(rules.allows("/page.php5"))
+        self.assertTrue(rules.allows("/page.php?x=1")) # '$' anchors
+        self.assertTrue(rules.allows("/fish.html"))
+        self.assertFalse(rules.allows("/fish/salmon.html"))
+        self.assertTrue(RobotsRules().allows("/anything"))
+
+    def test_robots_benchmark(self):
+        """Checks the compiled rules against a plain longest match over all rules and
+        times them against the previous implementation, one regular expression per rule.
+        Only the verdicts are asserted, the timings are printed."""
+        rnd = random.Random(4)
+        words = ["wiki", "w", "index.php", "Special:", "api", "talk", "user", "edit", "a", "b"]
+        def path(n):
+            return "/" + "/".join(rnd.choice(words) for _ in range(n))
+        robots = ["User-agent: *"]
+        for i in range(400):
+            p = path(rnd.randint(1, 4))
+            if i % 10 == 0:
+                p = p.replace("/", "/*", 1)
+            if i % 25 == 0:
+                p += "$"
+            robots.append(("Allow: " if i % 3 == 0 else "Disallow: ") + p)
+        robots = "\n".join(robots)
+        paths = [path(rnd.randint(1, 6)) for _ in range(1000)]
+
+        def longest_match(path):
+            best, allow = 0, True
+            for line in robots.split("\n")[1:]:
+                field, rule = line.split(": ")
+                if re.match(RobotsRules._to_regex(rule), path):
+                    if len(rule) > best or (len(rule) == best and field == "Allow"):
+                        best, allow = len(rule), field == "Allow"
+            return allow
+
+        rob = RobotsFile()
+        rules = rob.parse_robotstxt(robots)
+
+        legacy = _legacy_parse_robotstxt(robots)
+        start = time.perf_counter()
+        for p in paths:
+            _legacy_check_rules(legacy, p)
+        legacy_time = time.perf_counter() - start
+        start = time.perf_counter()
+        verdicts = [rob.check_rules(rules, p) for p in paths]
+        compiled_time = time.perf_counter() - start
+        print(f"robots.txt with {len(rules)} rules, {len(paths)} paths: "
+            f"one regex per rule {legacy_time:.4f}s, compiled {compiled_time:.4f}s")
+        # the previous implementation let the last matching rule decide, thus the
+        # verdicts are compared with the longest match instead
+        for p, verdict in zip(paths, verdicts):
+            self.assertEqual(verdict, longest_match(p), p)
+
+
+def _legacy_parse_robotstxt(content):
+    """The rules as they were evaluated before RobotsRules: one regex per rule."""
+    rules = []
+    for line in content.split("\n")[1:]:
+        field, rl = line.replace(" ", "").split(":", 1)
+        rl = rl.replace("*", "(.*)")
+        if rl.endswith("/"):
+            rl = rl + ".*"
+        rules.append((re.compile(rl), field == "Allow"))
+    return rules
+
+def _legacy_check_rules(rules, link):
+    res = True
+    for rule, allow in rules:
+        if re.match(rule, link):
+            res = allow
+    return res
+
+
 _PROJECT_NAME = "TESTINGDRYRUNGATEWAY123123212312"
 
 class GatewayTest(unittest.TestCase):
@@ -94,13 +198,186 @@ class GatewayTest(unittest.TestCase):
         self.assertEqual(gw._ensure_https_protocol("ftp://hello.com"), "https://hello.com")
         self.assertFalse(gw._permitted_link("hello.com"))
         self.assertTrue(gw.done())
+        self.assertIsNone(gw.time_until_ready())
         # we ask for nonexistent URLs, so...
         print("THE LOGGED ERRORS YOU SEE ABOVE ARE AS EXPECTED.")
 
+        config[ENABLE_ASYNC_REQUESTS] = True
+        gw = GateWay()
+        self.assertTrue(gw.concurrent)
+        self.assertIsInstance(gw.sender, RequestAsync)
+        self.assertTrue(gw.done())
+        self.assertEqual(list(gw.process_queue()), [])
+        gw.wakeup.set() # as if a response arrived
+        self.assertTrue(gw.wait(60))
+        self.assertFalse(gw.wait(0.01))
+        gw.sender.close()
+
         for k, v in configcopy.items():
             config[k] = v
         self.delete(_PROJECT_NAME)
 
+    def test_robots_in_memory(self):
+        configcopy = config.copy()
+        config[LOGGING_LEVEL] = LOG_ERROR
+        proj = Project(_PROJECT_NAME + "ROBOTS", "website.org")
+        proj.quiet_exit()
+        glc = GlobalCache()
+        glc.__init__() # several projects are opened during testing
+        glc.store("website.org", "User-agent: *\nDisallow: /private\n", "robots.txt", 10000)
+        self.assertIsNotNone(glc.get_expiry("website.org", "robots.txt"))
+        self.assertIsNone(glc.get_expiry("website.org", "nothing.txt"))
+
+        rob = RobotsFile()
+        self.assertFalse(rob.check_robots_txt("https://website.org/private/a", None))
+        # from now on, neither the project cache nor the network may be touched
+        rob.globalcache = None
+        for i in range(1000):
+            self.assertTrue(rob.check_robots_txt(f"https://website.org/public/{i}?q=1", None))
+            self.assertFalse(rob.check_robots_txt(f"https://website.org/private/{i % 10}", None))
+        self.assertLessEqual(len(rob.verdicts), 4096)
+
+        # rules that expired are refreshed, remembered verdicts do not outlive them
+        rob.globalcache = glc
+        glc.store("website.org", "User-agent: *\nDisallow: /public\n", "robots.txt", 10000)
+        rob.rules["website.org"] = (rob.rules["website.org"][0], 0)
+        self.assertFalse(rob.check_robots_txt("https://website.org/public/1", None))
+        self.assertTrue(rob.check_robots_txt("https://website.org/private/1", None))
+
+        for k, v in configcopy.items():
+            config[k] = v
+        self.delete(_PROJECT_NAME + "ROBOTS")
+
+    def test_persistent_frontier(self):
+        configcopy = config.copy()
+        config[ENABLE_JAVASCRIPT] = False
+        config[LOGGING_LEVEL] = LOG_ERROR
+        proj = Project(_PROJECT_NAME + "FRONTIER", "website.org")
+        proj.quiet_exit()
+        proj.enable_persistent_frontier(True, window = 1)
+        glc = GlobalCache()
+        glc.__init__() # several projects are opened during testing
+        glc.store("website.org", "User-agent: *\nDisallow: /private\n", "robots.txt", 10000)
+
+        gw = GateWay()
+        self.assertTrue(gw.add_to_queue("website.org/a"))
+        self.assertTrue(gw.add_to_queue("website.org/b"))
+        self.assertTrue(gw.add_to_queue("website.org/a")) # accepted, but queued once
+        self.assertFalse(gw.add_to_queue("website.org/private"))
+        self.assertEqual(len(gw.queue), 2)
+        gw.close()
+
+        # the next gateway continues with the links left
+        gw = GateWay()
+        self.assertFalse(gw.done())
+        self.assertEqual(gw.queue.dequeue(time.time() + 1000),
+            ["website.org/a", "https://website.org/a"])
+        gw.close() # without being acknowledged
+        gw = GateWay()
+        self.assertEqual(len(gw.queue), 2)
+        gw.queue.ready = [(0, *entry[1:]) for entry in gw.queue.ready] # ready right away
+        linkpair = gw._dequeue()
+        self.assertEqual(linkpair.url, "https://website.org/a")
+        self.assertTrue(gw.add_to_queue("website.org/a")) # accepted, but not queued again
+        self.assertEqual(len(gw.queue), 1)
+        gw.acknowledge("https://website.org/a")
+        self.assertEqual(gw.handed_out, {})
+        gw.close()
+        gw = GateWay()
+        self.assertEqual(len(gw.queue), 1)
+        gw.close()
+
+        for k, v in configcopy.items():
+            config[k] = v
+        self.delete(_PROJECT_NAME + "FRONTIER")
+
+    @unittest.skipUnless(SELENIUMWIRE, "requires selenium-wire")
+    def test_redirected_page_acknowledged(self):
+        from webchecks.access.RequestJS import RequestJS
+        class Response:
+            def __init__(self, status_code, body):
+                self.status_code = status_code
+                self.body = body
+                self.headers = {"content-type" : "text/html"}
+        class Driver:
+            def __init__(self):
+                self.current_url = "https://website.org/b#top"
+                self.requests = []
+            def iter_requests(self):
+                return iter([])
+
+        configcopy = config.copy()
+        config[ENABLE_JAVASCRIPT] = False
+        config[LOGGING_LEVEL] = LOG_ERROR
+        proj = Project(_PROJECT_NAME + "FRONTIER", "website.org")
+        proj.quiet_exit()
+        proj.enable_persistent_frontier(True, window = 1)
+        glc = GlobalCache()
+        glc.__init__() # several projects are opened during testing
+        glc.store("website.org", "User-agent: *\n", "robots.txt", 10000)
+
+        gw = GateWay()
+        self.assertTrue(gw.add_to_queue("website.org/a"))
+        gw.queue.ready = [(0, *entry[1:]) for entry in gw.queue.ready] # ready right away
+        linkpair = gw._dequeue()
+        # the browser was redirected from /a to /b, which loads a frame
+        sender = RequestJS.__new__(RequestJS)
+        sender.driver = Driver()
+        sender.profile = fetch_profile("website.org")
+        sender._documents = [("https://website.org/a", Response(301, b"")),
+            ("https://website.org/frame", Response(200, b"<p>frame</p>")),
+            ("https://website.org/b", Response(200, b"<p>moved</p>"))]
+        responses = list(sender._captured(linkpair, "test"))
+        self.assertEqual([(content, link) for content, _, link in responses],
+            [(b"<p>frame</p>", "https://website.org/frame"), (b"<p>moved</p>", "website.org/a")])
+        for _, _, link in responses:
+            gw.acknowledge(link)
+        self.assertEqual(gw.handed_out, {})
+        self.assertEqual(len(gw.queue), 0)
+        gw.close()
+
+        profiledb["website.org"].quiet_exit()
+        del profiledb["website.org"]
+        for k, v in configcopy.items():
+            config[k] = v
+        self.delete(_PROJECT_NAME + "FRONTIER")
+
+    @unittest.skipUnless(SELENIUMWIRE, "requires selenium-wire")
+    def test_capture_scopes(self):
+        from webchecks.access.RequestJS import RequestJS
+        configcopy = config.copy()
+        config[LOGGING_LEVEL] = LOG_ERROR
+        proj = Project(_PROJECT_NAME + "SCOPES", "www.website.org")
+        proj.quiet_exit()
+        profile = BaseProfile("www.website.org")
+        profile.quiet_exit()
+        sender = RequestJS.__new__(RequestJS)
+        sender.js_trust = JavascriptTrustTable({"*" : TRUSTED, "evil.org" : UNTRUSTED})
+
+        self.assertEqual(sender._scopes(profile), []) # everything is captured
+        profile._set_captured_resources((RESOURCE_XHR,))
+        scopes = sender._scopes(profile)
+        def captured(url):
+            return any(re.search(scope, url) for scope in scopes)
+        self.assertFalse(captured("https://www.website.org/img/logo.PNG?v=2"))
+        self.assertFalse(captured("http://www.website.org:8080/style.css#x"))
+        for url in ("https://www.website.org/", "https://www.website.org/app.js",
+                "https://www.website.org/data.json", "https://www.website.org/page.html",
+                "https://cdn.website.org/logo.png", "https://other.org/logo.png",
+                "https://other.org/?u=https://www.website.org/logo.png"):
+            self.assertTrue(captured(url), url)
+
+        # what the interceptors might block is always seen by them
+        profile._set_resource_policy(RESOURCES_ESSENTIAL)
+        self.assertEqual(sender._scopes(profile), [])
+        profile._set_resource_policy(RESOURCES_ALL)
+        sender.js_trust = JavascriptTrustTable({"*" : TRUSTED, "website.org" : UNTRUSTED})
+        self.assertEqual(sender._scopes(profile), [])
+
+        for k, v in configcopy.items():
+            config[k] = v
+        self.delete(_PROJECT_NAME + "SCOPES")
+
     def delete(self, path):
         for base, dirs, filenames in os.walk(top=path):
             for fn in filenames:
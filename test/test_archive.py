@@ -0,0 +1,340 @@
+import os
+import gzip
+import unittest
+
+from webchecks import Project
+from webchecks.archive import warc
+from webchecks.access.AccessHead import AccessHead
+from webchecks.access.Gateway import URLPair
+from webchecks.access.RequestNoJS import RequestNoJS
+from webchecks.archive.AccessNode import AccessNode
+from webchecks.archive.FileArchive import FileArchive
+from webchecks.archive.PackArchive import PackArchive
+from webchecks.archive.GlobalCache import GlobalCache
+from webchecks.profiles.BaseProfile import BaseProfile
+from webchecks.profiles.profileDB import add_profile, profiledb
+from webchecks.utils.Error import OptionsError
+from webchecks.config import *
+
+
+_PROJECT_NAME = "TESTINGDRYRUNARCHIVE123123212312"
+
+_html = {"content-type" : "text/html"}
+_png = {"content-type" : "image/png"}
+
+
+class ArchiveTest(unittest.TestCase):
+
+    def test_pack_archive(self):
+        configcopy = config.copy()
+        config[LOGGING_LEVEL] = LOG_ERROR
+        proj = Project(_PROJECT_NAME, "website.org")
+        proj.quiet_exit()
+        GlobalCache().__init__() # several projects are opened during testing
+
+        profile = BaseProfile("website.org")
+        profile.quiet_exit()
+        add_profile(profile)
+        self.assertIsInstance(profile.get_archive(), FileArchive)
+        legacy = profile.get_archive().save_content("https://website.org/old", _html,
+            b"<html>stored as file</html>")
+
+        self.assertRaises(OptionsError, proj.set_archive_backend, "nonexistent")
+        proj.set_archive_backend("pack")
+        config[PACK_SEGMENT_SIZE] = 4096
+        archive = profile.get_archive()
+        archive.quiet_exit()
+        self.assertIsInstance(archive, PackArchive)
+
+        pages = {}
+        for i in range(50):
+            page = b"<html><p>page %d</p>%s</html>" % (i, b"x" * (i * 10))
+            pages[archive.save_content(f"https://website.org/page{i}", _html, page)] = page
+        image = bytes(range(256)) * 4
+        image_name = archive.save_content("https://website.org/image.png", _png, image)
+
+        # no file per page, several segments
+        files = os.listdir(archive.content_dir)
+        self.assertTrue(all(f.startswith("segment-") for f in files if f != legacy), files)
+        self.assertGreater(len(files), 2)
+        self.assertEqual([f for f in os.listdir(archive.meta_dir) if f.endswith(".txt")],
+            [legacy + ".txt"])
+
+        for name, page in pages.items():
+            self.assertEqual(archive.retreive_content(name), page)
+        # uncompressed content is retreived as text, like from files
+        self.assertEqual(archive._read_content(image_name, True), image)
+        self.assertIn("url : https://website.org/page3\n",
+            archive.retreive_content("page3.html", metadata = True))
+        # packed pages have no file of their own
+        self.assertRaises(ValueError, archive.retreive_content,
+            os.path.join(archive.content_dir, "page3.html"), path_only = True)
+        self.assertRaises(ValueError, AccessNode().get_content_location,
+            "https://website.org/page3")
+        self.assertEqual(archive.retreive_content(legacy, path_only = True),
+            os.path.join(archive.content_dir, legacy))
+        self.assertEqual(AccessNode().get_content("https://website.org/page7"),
+            pages["page7.html"])
+        self.assertEqual(archive.retreive_content(legacy), b"<html>stored as file</html>")
+        self.assertRaises(FileNotFoundError, archive.retreive_content, "nonexistent.html")
+
+        # overwriting appends, the latest record is returned
+        archive.save_content("https://website.org/page3", _html, b"new")
+        self.assertEqual(archive.retreive_content("page3.html"), b"new")
+
+        # the index is persistent
+        reopened = PackArchive(profile)
+        reopened.quiet_exit()
+        self.assertEqual(reopened.segment, archive.segment)
+        self.assertEqual(reopened.retreive_content("page10.html"), pages["page10.html"])
+        reopened.close()
+        archive.close()
+
+        # a lost or corrupt index is rebuilt from the segments
+        index_path = os.path.join(archive.meta_dir, "pack.db")
+        for damage in (None, b"not a database" * 100):
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(index_path + suffix):
+                    os.remove(index_path + suffix)
+            if damage is not None:
+                with open(index_path, "wb") as f:
+                    f.write(damage)
+            archive = PackArchive(profile)
+            archive.quiet_exit()
+            for name, page in pages.items():
+                if name != "page3.html":
+                    self.assertEqual(archive.retreive_content(name), page)
+            self.assertEqual(archive.retreive_content("page3.html"), b"new")
+            self.assertEqual(archive._read_content(image_name, True), image)
+            archive.close()
+        # a record cut short ends the scan
+        archive = PackArchive(profile)
+        archive.quiet_exit()
+        with open(archive._segment_path(archive.segment), "ab") as f:
+            f.write(b"WCPACK/1.0 0 1000 cut.html\r\nshort")
+        self.assertEqual(archive.rebuild_index(), 2 * len(pages) + 2 + 2)
+        self.assertEqual(archive.retreive_content("page3.html"), b"new")
+        archive.close()
+
+        proj.set_archive_backend("files")
+        self.assertIsInstance(profile.get_archive(), FileArchive)
+        profile.quiet_exit()
+        del profiledb["website.org"]
+
+        for k, v in configcopy.items():
+            config[k] = v
+        self.delete(_PROJECT_NAME)
+
+    def test_warc_roundtrip(self):
+        configcopy = config.copy()
+        config[LOGGING_LEVEL] = LOG_ERROR
+        proj = Project(_PROJECT_NAME, "website.org")
+        proj.quiet_exit()
+        GlobalCache().__init__()
+        profile = BaseProfile("website.org")
+        profile.quiet_exit()
+        add_profile(profile)
+        pages = {}
+        for i in range(30):
+            pages[f"https://website.org/page{i}"] = b"<html><p>page %d</p></html>" % i
+            profile.get_archive().save_content(f"https://website.org/page{i}", _html,
+                pages[f"https://website.org/page{i}"])
+        pages["https://website.org/image.png"] = bytes(range(256)) * 4
+        profile.get_archive().save_content("https://website.org/image.png", _png,
+            pages["https://website.org/image.png"])
+
+        files = proj.export_warc(_PROJECT_NAME + "WARC", ["website.org"], max_file_size = 2000)
+        self.assertGreater(len(files), 1)
+        with open(files[0], "rb") as f:
+            records = list(warc.read_records(f))
+        self.assertEqual(records[0][0]["warc-type"], "warcinfo")
+        self.assertEqual(records[1][0]["content-type"], "text/html")
+        self.assertIn(records[1][1], pages.values())
+        self.assertEqual(records[2][0]["warc-type"], "metadata")
+
+        # import into a fresh project
+        del profiledb["website.org"]
+        self.delete(_PROJECT_NAME)
+        for k, v in configcopy.items():
+            config[k] = v
+        config[LOGGING_LEVEL] = LOG_ERROR
+        proj = Project(_PROJECT_NAME, "website.org")
+        proj.quiet_exit()
+        GlobalCache().__init__()
+        self.assertEqual(proj.import_warc(_PROJECT_NAME + "WARC"), len(pages))
+        access = AccessNode()
+        for url, page in pages.items():
+            if not url.endswith(".png"): # uncompressed content is retreived as text
+                self.assertEqual(access.get_content(url), page)
+        name = GlobalCache().get_link_location("https://website.org/image.png")[0]
+        self.assertEqual(profiledb["website.org"].get_archive().retreive_content(name,
+            binary = True), pages["https://website.org/image.png"])
+
+        # response records as written by other tools
+        body = gzip.compress(b"<html>from elsewhere</html>")
+        http = (b"HTTP/1.1 200 OK\r\nContent-Type: text/html; charset=utf-8\r\n"
+            b"Content-Encoding: gzip\r\nTransfer-Encoding: chunked\r\n\r\n"
+            + b"%x\r\n" % 10 + body[:10] + b"\r\n"
+            + b"%x\r\n" % (len(body) - 10) + body[10:] + b"\r\n0\r\n\r\n")
+        path = os.path.join(_PROJECT_NAME + "WARC", "other.warc")
+        with open(path, "wb") as f:
+            # records without a valid target are skipped
+            for target in (b"", b"WARC-Target-URI: <not an url>\r\n"):
+                f.write(b"WARC/1.0\r\nWARC-Type: resource\r\n" + target +
+                    b"Content-Type: text/html\r\nContent-Length: 4\r\n\r\npage\r\n\r\n")
+            # neither are error responses
+            missing = b"HTTP/1.1 404 Not Found\r\nContent-Type: text/html\r\n\r\ngone"
+            latin = (b"HTTP/1.0 200 OK\r\nContent-Type: text/html; charset=iso-8859-1\r\n\r\n"
+                + "<html>Gr\u00fc\u00dfe</html>".encode("iso-8859-1"))
+            for target, block in ((b"page", http), (b"missing", missing), (b"latin", latin)):
+                f.write(b"WARC/1.0\r\nWARC-Type: response\r\n"
+                    b"WARC-Target-URI: <https://other.org/%s>\r\n" % target +
+                    b"Content-Length: %d\r\n\r\n" % len(block) + block + b"\r\n\r\n")
+        self.assertEqual(proj.import_warc(path), 2)
+        self.assertEqual(access.get_content("https://other.org/page"),
+            b"<html>from elsewhere</html>")
+        self.assertEqual(access.get_content("https://other.org/latin"),
+            "<html>Gr\u00fc\u00dfe</html>".encode("utf-8"))
+        self.assertIsNone(GlobalCache().get_link_location("https://other.org/missing"))
+        # imported pages are not crawled again
+        self.assertEqual(profiledb["other.org"].get_links("https://other.org/",
+            '<a href="https://other.org/page">page</a><a href="https://other.org/missing">'
+            'missing</a>'), ["https://other.org/missing"])
+
+        for domain in ("website.org", "other.org"):
+            profiledb[domain].quiet_exit()
+            del profiledb[domain]
+        for k, v in configcopy.items():
+            config[k] = v
+        self.delete(_PROJECT_NAME)
+        self.delete(_PROJECT_NAME + "WARC")
+
+    def test_deduplication(self):
+        configcopy = config.copy()
+        config[LOGGING_LEVEL] = LOG_ERROR
+        proj = Project(_PROJECT_NAME, "website.org")
+        proj.quiet_exit()
+        GlobalCache().__init__()
+        proj.enable_deduplication(True)
+        profiles = [BaseProfile("website.org"), BaseProfile("mirror.org")]
+        for profile in profiles:
+            profile.quiet_exit()
+            add_profile(profile)
+        page = b"<html><p>the same everywhere</p></html>"
+
+        for i in range(20):
+            profiles[0].get_archive().save_content(f"https://website.org/p?utm={i}", _html, page)
+            profiles[1].get_archive().save_content(f"https://mirror.org/{i}", _html, page)
+        profiles[0].get_archive().save_content("https://website.org/other", _html, b"other")
+
+        # two distinct contents stored, both in the archive of the domain seen first
+        archive = profiles[0].get_archive()
+        blobs = [name for name in archive.stored_names()
+            if "blob : " in archive.retreive_content(name, metadata = True)]
+        self.assertEqual(len(blobs), 2)
+        self.assertEqual(len(os.listdir(archive.content_dir)), 2)
+        self.assertEqual(os.listdir(profiles[1].get_archive().content_dir), [])
+
+        access = AccessNode()
+        self.assertEqual(access.get_content("https://website.org/p?utm=3"), page)
+        self.assertEqual(access.get_content("https://mirror.org/7"), page)
+        self.assertEqual(access.get_content("https://website.org/other"), b"other")
+        self.assertIn("ref : website.org/", profiles[1].get_archive().retreive_content(
+            "7.html", metadata = True))
+        self.assertEqual(os.path.dirname(access.get_content_location("https://mirror.org/7")),
+            archive.content_dir)
+
+        # deduplicated content is exported once per URL
+        files = proj.export_warc(_PROJECT_NAME + "WARC", ["website.org", "mirror.org"])
+        with open(files[0], "rb") as f:
+            uris = [h["warc-target-uri"] for h, _ in warc.read_records(f)
+                if h["warc-type"] == "resource"]
+        self.assertEqual(len(uris), 22)
+        self.assertEqual(len(set(uris)), 22)
+
+        for profile in profiles:
+            del profiledb[profile.get_domain()]
+        for k, v in configcopy.items():
+            config[k] = v
+        self.delete(_PROJECT_NAME)
+        self.delete(_PROJECT_NAME + "WARC")
+
+    def test_text_content(self):
+        configcopy = config.copy()
+        config[LOGGING_LEVEL] = LOG_ERROR
+        config[COMPRESS_CONTENT] = False
+        proj = Project(_PROJECT_NAME, "website.org")
+        proj.quiet_exit()
+        GlobalCache().__init__()
+        profile = BaseProfile("website.org")
+        profile.quiet_exit()
+        archive = profile.get_archive()
+
+        # decoded pages are stored UTF-8 encoded, whatever the locale
+        page = "<html>Grüße, 10 €</html>"
+        name = archive.save_content("https://website.org/umlaut", _html, page)
+        with open(os.path.join(archive.content_dir, name), "rb") as f:
+            self.assertEqual(f.read(), page.encode("utf-8"))
+        self.assertIn(f"bytes : {len(page.encode('utf-8'))}\n",
+            archive.retreive_content(name, metadata = True))
+        self.assertEqual(archive.retreive_content(name), page)
+
+        for k, v in configcopy.items():
+            config[k] = v
+        self.delete(_PROJECT_NAME)
+
+    def test_conditional_requests(self):
+        configcopy = config.copy()
+        config[LOGGING_LEVEL] = LOG_ERROR
+        proj = Project(_PROJECT_NAME, "website.org")
+        proj.quiet_exit()
+        GlobalCache().__init__()
+        profile = BaseProfile("website.org")
+        profile.quiet_exit()
+        add_profile(profile)
+        archive = profile.get_archive()
+        validated = {"content-type" : "text/html", "etag" : '"abc"',
+            "last-modified" : "Wed, 21 Oct 2015 07:28:00 GMT"}
+        request = RequestNoJS()
+        pair = URLPair("https://website.org/page?a=1", "https://website.org/page?a=1")
+
+        # disabled by default
+        archive.save_content(pair.original_url, validated, b"<html>page</html>")
+        self.assertIsNone(GlobalCache().get_validators(pair.original_url))
+        self.assertEqual(request._conditional_headers(pair), {})
+
+        proj.enable_conditional_requests(True)
+        archive.save_content(pair.original_url, validated, b"<html>page</html>")
+        self.assertEqual(request._conditional_headers(pair), {"If-None-Match" : '"abc"',
+            "If-Modified-Since" : "Wed, 21 Oct 2015 07:28:00 GMT"})
+        archive.save_content(pair.original_url, _html, b"<html>page</html>")
+        self.assertEqual(request._conditional_headers(pair), {})
+        archive.save_content(pair.original_url, {"content-type" : "text/html", "etag" : "x"},
+            b'<html><a href="/next">next</a></html>')
+        self.assertEqual(request._conditional_headers(pair), {"If-None-Match" : "x"})
+
+        # unchanged content is only searched for links again if asked for
+        head = AccessHead([])
+        self.assertEqual(head.stored_content(pair.original_url), (b"", {}))
+        proj.enable_conditional_requests(True, extract_links = True)
+        content, resp_header = head.stored_content(pair.original_url)
+        self.assertEqual(content, b'<html><a href="/next">next</a></html>')
+        self.assertEqual(resp_header, _html)
+        self.assertEqual(head.stored_content("https://website.org/nonexistent"), (b"", {}))
+
+        del profiledb["website.org"]
+        for k, v in configcopy.items():
+            config[k] = v
+        self.delete(_PROJECT_NAME)
+
+    def delete(self, path):
+        for base, dirs, filenames in os.walk(top=path):
+            for fn in filenames:
+                file = os.path.join(base, fn)
+                os.remove(file)
+
+            for d in dirs:
+
+                dirpath = os.path.join(base, d)
+                self.delete(dirpath)
+        os.rmdir(path)
@@ -2,7 +2,7 @@
 import unittest
 
 from webchecks.profiles.ProfileConstants import *
-from webchecks.utils.Error import OptionsError
+from webchecks.utils.Error import OptionsError, InputError
 from webchecks.profiles.BaseProfile import BaseProfile
 from webchecks.config import *
 
@@ -54,4 +54,35 @@ class ProjectTest(unittest.TestCase):
             set(["https://different.com", "otherdifferent.com",
                 "base.com/nice"]),
                 f"Got {links}")
-        
\ No newline at end of file
+        
+    def test_resource_policy(self):
+        profile = SomeWebsiteProfile3()
+        self.assertEqual(profile.get_resource_policy(), (RESOURCES_ALL, False))
+        profile._set_resource_policy((RESOURCE_SCRIPT,), True)
+        self.assertEqual(profile.get_resource_policy(),
+            ({RESOURCE_DOCUMENT, RESOURCE_SCRIPT}, True))
+        with self.assertRaises(InputError):
+            profile._set_resource_policy(("nonsense",))
+
+        self.assertEqual(profile.get_captured_resources(), RESOURCES_ALL)
+        profile._set_captured_resources(())
+        self.assertEqual(profile.get_captured_resources(), {RESOURCE_DOCUMENT})
+        with self.assertRaises(InputError):
+            profile._set_captured_resources(("nonsense",))
+
+    def test_register_urls(self):
+        profile = SomeWebsiteProfile3()
+        profile.links_visited = set([])
+        profile._visited_keys = set([])
+        links = profile._register_urls(["base.com/a", "base.com/a/", "base.com/a?q=1",
+            "base.com/a#Summary", "base.com/b/", "base.com/b?x=2", "base.com/c"])
+        self.assertEqual(links, ["base.com/a", "base.com/b/", "base.com/c"])
+        # already waiting
+        self.assertEqual(profile._register_urls(["base.com/a?q=2", "base.com/b"]), [])
+        profile._deregister_url("base.com/a")
+        self.assertIn("base.com/a", profile.get_urls_visited())
+        self.assertNotIn("base.com/a", profile.waiting_links)
+        # already visited
+        self.assertEqual(profile._register_urls(["base.com/a/", "base.com/d"]), ["base.com/d"])
+        self.assertFalse(profile._not_redundant_url("base.com/d?page=3"))
+        self.assertTrue(profile._not_redundant_url("base.com/e"))
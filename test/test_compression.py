@@ -0,0 +1,120 @@
+import os
+import lzma
+import unittest
+
+from webchecks import Project
+from webchecks.archive import compression
+from webchecks.archive.GlobalCache import GlobalCache
+from webchecks.profiles.BaseProfile import BaseProfile
+from webchecks.utils.Error import OptionsError
+from webchecks.config import *
+
+
+_PROJECT_NAME = "TESTINGDRYRUNCOMPRESSION123123212312"
+
+_page = (b"<html><head><title>Hello</title></head><body>"
+    + b"<p>Some text that repeats itself.</p>" * 200 + b"</body></html>")
+
+
+class CompressionTest(unittest.TestCase):
+
+    def test_codecs(self):
+        self.assertIn("lzma", compression.available_codecs())
+        self.assertIn("zlib", compression.available_codecs())
+        self.assertIn("gzip", compression.available_codecs())
+        for codec in compression.available_codecs():
+            c = compression.get_codec(codec)
+            for level in (None, c.levels[0], c.levels[1]):
+                data = compression.compress(_page, codec, level)
+                self.assertEqual(compression.decompress(data, codec), _page, codec)
+            self.assertRaises(ValueError, c.check_level, c.levels[1] + 1)
+            self.assertRaises(ValueError, c.check_level, "1")
+        self.assertRaises(OptionsError, compression.get_codec, "nonexistent")
+
+    def test_archive(self):
+        configcopy = config.copy()
+        config[LOGGING_LEVEL] = LOG_ERROR
+        proj = Project(_PROJECT_NAME, "website.org")
+        proj.quiet_exit()
+        GlobalCache().__init__() # several projects are opened during testing
+        archive = BaseProfile("website.org").get_archive()
+        archive.quiet_exit()
+        header = {"content-type" : "text/html"}
+
+        self.assertRaises(OptionsError, proj.set_compression, "nonexistent")
+        self.assertRaises(ValueError, proj.set_compression, "zlib", 10)
+        names = {}
+        for codec in compression.available_codecs():
+            proj.set_compression(codec, None)
+            url = f"https://website.org/{codec}"
+            names[codec] = archive.save_content(url, header, _page)
+            self.assertIn(f"codec : {codec}\n", archive.retreive_content(names[codec],
+                metadata = True))
+        # content written earlier stays readable with whatever codec is configured now
+        for codec, name in names.items():
+            self.assertEqual(archive.retreive_content(name), _page, codec)
+
+        # archives written before the codec was recorded are lzma compressed
+        name = archive.save_content("https://website.org/legacy", header, _page)
+        with open(os.path.join(archive.content_dir, name), "wb") as f:
+            f.write(lzma.compress(_page))
+        with open(os.path.join(archive.meta_dir, name + ".txt"), "w") as f:
+            f.write(f"compressed : True\nname : {name}.txt\nbytes : 0\n"
+                "url : https://website.org/legacy\n")
+        self.assertEqual(archive.retreive_content(name), _page)
+
+        for k, v in configcopy.items():
+            config[k] = v
+        self.delete(_PROJECT_NAME)
+
+    @unittest.skipUnless(compression.zstd_available(), "requires zstandard")
+    def test_dictionary(self):
+        configcopy = config.copy()
+        config[LOGGING_LEVEL] = LOG_ERROR
+        proj = Project(_PROJECT_NAME, "website.org")
+        proj.quiet_exit()
+        GlobalCache().__init__()
+        profile = BaseProfile("website.org")
+        archive = profile.get_archive()
+        archive.quiet_exit()
+        header = {"content-type" : "text/html"}
+        pages = [(b"<html><head><title>Website</title></head><body><nav>"
+            + b"".join(b'<a href="/section%d">Section %d</a>' % (j, j) for j in range(30))
+            + b"</nav><p>This is page %d.</p><footer>All rights reserved.</footer>"
+            b"</body></html>") % i for i in range(40)]
+
+        self.assertRaises(ValueError, proj.enable_zstd_dictionary, True, 0)
+        proj.enable_zstd_dictionary(True, n_samples = 20)
+        self.assertEqual(config[COMPRESSION_CODEC], "zstd")
+        names = [archive.save_content(f"https://website.org/{i}", header, page)
+            for i, page in enumerate(pages)]
+        self.assertTrue(os.path.exists(archive.dictionary_path))
+        dict_id = archive.dictionary.dict_id
+
+        self.assertNotIn("dictionary : ", archive.retreive_content(names[0], metadata = True))
+        self.assertIn(f"dictionary : {dict_id}\n",
+            archive.retreive_content(names[-1], metadata = True))
+        self.assertLess(os.path.getsize(os.path.join(archive.content_dir, names[-1])),
+            len(compression.compress(pages[-1], "zstd")))
+
+        # the dictionary is loaded from disk when needed
+        proj.enable_zstd_dictionary(False)
+        archive.dictionary = None
+        for name, page in zip(names, pages):
+            self.assertEqual(archive.retreive_content(name), page)
+
+        for k, v in configcopy.items():
+            config[k] = v
+        self.delete(_PROJECT_NAME)
+
+    def delete(self, path):
+        for base, dirs, filenames in os.walk(top=path):
+            for fn in filenames:
+                file = os.path.join(base, fn)
+                os.remove(file)
+
+            for d in dirs:
+
+                dirpath = os.path.join(base, d)
+                self.delete(dirpath)
+        os.rmdir(path)
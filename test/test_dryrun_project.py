@@ -41,6 +41,7 @@ class ProjectTest(unittest.TestCase):
         # Project exists... 
         proj3 = Project(_PROJECT_NAME, "website2.org")
         proj3.enable_crawl(True)
+        proj3.enable_async_requests(True, 64)
         proj3.set_timeout(200)
         proj3.sec_allow_all_websites()
         proj3.sec_set_allowed_websites(("wikipedia.org",))
@@ -53,6 +54,8 @@ class ProjectTest(unittest.TestCase):
 
         with self.assertRaises(ValueError):
             proj3.set_logging_level(10)
+        with self.assertRaises(ValueError):
+            proj3.enable_async_requests(True, 0)
 
         proj3.set_browser_driver_location("here")
         proj3.set_browser_use_profile("there")
@@ -70,6 +73,8 @@ class ProjectTest(unittest.TestCase):
 
 
         self.assertEqual(config[DO_CRAWL], True)
+        self.assertEqual(config[ENABLE_ASYNC_REQUESTS], True)
+        self.assertEqual(config[ASYNC_MAX_IN_FLIGHT], 64)
         self.assertEqual(config[DEFAULT_TIMEOUT_IN_SEC], 200)
         self.assertEqual(config[WHITELIST_DOMAINS], ("wikipedia.org",))
         self.assertEqual(config[WHITELIST_TLD], ("good",))
@@ -2,6 +2,7 @@
 import unittest
 
 from webchecks.utils.file_ops import *
+from webchecks.profiles.ProfileConstants import *
 
 class URLCase:
     def __init__(self, url, ext, fp):
@@ -65,6 +66,14 @@ class FileOpsTest(unittest.TestCase):
         case = URLCase("/ok.com/html.txt", "txt", "html.txt")
         self.assertTrue(refd_content_may_have_fileformat(case.url, case.ext))
 
+    def test_script_url(self):
+        self.assertTrue(is_script_url("https://ok.com/app.js"))
+        self.assertTrue(is_script_url("https://ok.com/app.js?v=12"))
+        self.assertFalse(is_script_url("https://ok.com/index.html"))
+        hits = is_script_url.cache_info().hits
+        self.assertTrue(is_script_url("https://ok.com/app.js?v=12"))
+        self.assertEqual(is_script_url.cache_info().hits, hits + 1)
+
     def test_hash(self):
         self.assertEqual(hash_string(b"hello"), b']A@*\xbcK*v\xb9q\x9d\x91\x10\x17\xc5\x92')
         self.assertEqual(hash_string("hello"), b']A@*\xbcK*v\xb9q\x9d\x91\x10\x17\xc5\x92')
@@ -95,4 +104,54 @@ class FileOpsTest(unittest.TestCase):
         "Content-type" : None, "Content-Type" : None}
         with self.assertRaises(KeyError):
             get_file_type_from_response_header(header, True)
-        get_file_type_from_response_header(header, False)
\ No newline at end of file
+        get_file_type_from_response_header(header, False)
+    def test_decode_content(self):
+        page = "<html><p>Grüße, café</p></html>"
+        latin = {"content-type" : "text/html; charset=ISO-8859-1"}
+        self.assertEqual(get_charset(page.encode("latin-1"), latin), "iso8859-1")
+        self.assertEqual(decode_content(page.encode("latin-1"), latin), page)
+        self.assertEqual(decode_content(page.encode("utf-8"), {"content-type" : "text/html"}),
+            page)
+        self.assertEqual(decode_content(page, latin), page)
+
+        # <meta> in the page, either form
+        sjis = '<meta charset="Shift_JIS"><p>日本語</p>'
+        self.assertEqual(decode_content(sjis.encode("shift_jis"), {}), sjis)
+        meta = ('<meta http-equiv="Content-Type" content="text/html; charset=windows-1252">'
+            '<p>€</p>')
+        self.assertEqual(decode_content(meta.encode("cp1252"), {"content-type" : "text/html"}),
+            meta)
+        # the header takes precedence over the page, the byte order mark over both
+        self.assertEqual(get_charset(sjis.encode("shift_jis"), latin), "iso8859-1")
+        self.assertEqual(get_charset(b"\xef\xbb\xbf" + sjis.encode("utf-8"), latin), "utf-8-sig")
+        # too far into the page to be considered
+        late = b" " * CHARSET_SNIFF_BYTES + b'<meta charset="latin-1">'
+        self.assertEqual(get_charset(late, {}), "utf-8")
+
+        # unknown charsets and invalid bytes do not raise
+        self.assertEqual(get_charset(b"", {"content-type" : "text/html; charset=bogus"}), "utf-8")
+        self.assertEqual(decode_content(b"caf\xe9", {}), "caf�")
+
+    def test_resource_type(self):
+        self.assertEqual(get_resource_type("https://ok.com/", "document"), RESOURCE_DOCUMENT)
+        self.assertEqual(get_resource_type("https://ok.com/api", "empty"), RESOURCE_XHR)
+        self.assertEqual(get_resource_type("https://ok.com/x.js", "Script"), RESOURCE_SCRIPT)
+        self.assertEqual(get_resource_type("https://ok.com/x", "nonsense"), RESOURCE_OTHER)
+        # guessed from the url
+        self.assertEqual(get_resource_type("https://ok.com/x.png?v=1"), RESOURCE_IMAGE)
+        self.assertEqual(get_resource_type("https://ok.com/x.css"), RESOURCE_STYLESHEET)
+        self.assertEqual(get_resource_type("https://ok.com/x.js"), RESOURCE_SCRIPT)
+        self.assertEqual(get_resource_type("https://ok.com/x.mp4"), RESOURCE_MEDIA)
+        self.assertEqual(get_resource_type("https://ok.com/x.html"), RESOURCE_DOCUMENT)
+        self.assertEqual(get_resource_type("https://ok.com/x"), RESOURCE_OTHER)
+
+    def test_resource_extensions(self):
+        types = frozenset((RESOURCE_IMAGE, RESOURCE_STYLESHEET))
+        extensions = resource_extensions(types)
+        self.assertIn(".png", extensions)
+        self.assertIn(".css", extensions)
+        self.assertNotIn(".js", extensions)
+        self.assertNotIn(".html", extensions)
+        for ext in extensions:
+            self.assertIn(get_resource_type("https://ok.com/x" + ext), types)
+        self.assertEqual(resource_extensions(frozenset()), ())
@@ -1,10 +1,11 @@
  
 import unittest
 import os
+import sqlite3
 from hashlib import md5
 
 from webchecks import Project
-from webchecks.archive.GlobalCache import GlobalCache
+from webchecks.archive.GlobalCache import GlobalCache, SCHEMA_MIGRATIONS
 from webchecks.profiles.ProfileConstants import *
 from webchecks.utils.Error import OptionsError
 from webchecks.profiles.BaseProfile import BaseProfile
@@ -30,7 +31,7 @@ class GlobalCacheTest(unittest.TestCase):
         glc.store_link_location("link_a", "link_b2")
         glc.store_link_location("link_a", "link_b3")
         glc.store_link_location("link_c", "link_d")
-        self.assertEqual(glc.get_link_location("link_a"), ("link_b",))
+        self.assertEqual(glc.get_link_location("link_a"), ("link_b3",))
         self.assertEqual(glc.get_link_location("link_c"), ("link_d",))
 
         glc.store("domain", "content", "name", 10000)
@@ -52,6 +53,87 @@ class GlobalCacheTest(unittest.TestCase):
             config[k] = v
         
 
+    def test_write_behind(self):
+        config[LOGGING_LEVEL] = LOG_ERROR
+        configcopy = config.copy()
+
+        proj = Project(_PROJECT_NAME, "website.org")
+        proj.quiet_exit()
+        glc = GlobalCache()
+        glc.__init__()
+        self.assertRaises(ValueError, proj.set_cache_write_behind, True, 0)
+        proj.set_cache_write_behind(True, batch_size = 3, interval_s = 1000)
+        self.assertEqual(glc.db.execute("PRAGMA journal_mode").fetchone(), ("wal",))
+
+        other = sqlite3.connect(glc.metadb) # sees only what was committed
+        count = lambda: other.execute("SELECT COUNT(*) FROM links").fetchone()[0]
+        glc.store_link_location("link_a", "link_b")
+        glc.store_link_location("link_c", "link_d")
+        self.assertEqual(glc.get_link_location("link_c"), ("link_d",))
+        self.assertEqual(count(), 0)
+        glc.store_link_location("link_e", "link_f") # batch full
+        self.assertEqual(count(), 3)
+        glc.store_link_location("link_g", "link_h")
+        self.assertEqual(count(), 3)
+        glc.flush()
+        self.assertEqual(count(), 4)
+        other.close()
+
+        proj.set_cache_write_behind(False)
+        self.assertEqual(glc.db.execute("PRAGMA journal_mode").fetchone(), ("delete",))
+        self.delete(_PROJECT_NAME)
+
+        for k, v in configcopy.items():
+            config[k] = v
+
+    def test_schema_migration(self):
+        config[LOGGING_LEVEL] = LOG_ERROR
+        configcopy = config.copy()
+
+        proj = Project(_PROJECT_NAME, "website.org")
+        proj.quiet_exit()
+        # a database as created by earlier versions: no indexes, duplicate rows
+        os.makedirs(config[CACHE_STORAGE_LOCATION], exist_ok = True)
+        db = sqlite3.connect(os.path.join(config[CACHE_STORAGE_LOCATION], "meta.db"))
+        db.execute("CREATE TABLE metadata(domain, name, hash, sec_before_refresh)")
+        db.execute("CREATE TABLE links(weblink, localfilelink)")
+        for i in range(3):
+            db.execute("INSERT INTO links VALUES (?, ?)", ("link_a", f"old_{i}"))
+            db.execute("INSERT INTO metadata VALUES (?, ?, ?, ?)", ("domain", "name", b"", i))
+        db.commit()
+        db.close()
+
+        glc = GlobalCache()
+        glc.__init__()
+        self.assertEqual(glc.db.execute("PRAGMA user_version").fetchone(),
+            (len(SCHEMA_MIGRATIONS),))
+        self.assertEqual(glc.db.execute("SELECT COUNT(*) FROM links").fetchone(), (1,))
+        self.assertEqual(glc.get_link_location("link_a"), ("old_2",))
+        self.assertEqual(glc.db.execute("SELECT sec_before_refresh FROM metadata").fetchall(),
+            [(2,)])
+        glc.store("domain", "content", "name", 10000)
+        self.assertEqual(glc.db.execute("SELECT COUNT(*) FROM metadata").fetchone(), (1,))
+        plan = glc.db.execute("EXPLAIN QUERY PLAN SELECT localfilelink FROM links "
+            "WHERE weblink = ?", ("link_a",)).fetchall()
+        self.assertIn("links_weblink", str(plan))
+
+        glc.__init__() # already up to date
+        self.assertEqual(glc.get_link_location("link_a"), ("old_2",))
+
+        # a step that fails halfway is rolled back entirely
+        SCHEMA_MIGRATIONS.append(("CREATE TABLE extra(a)", "NOT SQL"))
+        self.assertRaises(sqlite3.OperationalError, glc.__init__)
+        SCHEMA_MIGRATIONS.pop()
+        self.assertEqual(glc.db.execute("SELECT COUNT(*) FROM sqlite_master "
+            "WHERE name = 'extra'").fetchone(), (0,))
+        glc.__init__()
+        self.assertEqual(glc.db.execute("PRAGMA user_version").fetchone(),
+            (len(SCHEMA_MIGRATIONS),))
+        self.delete(_PROJECT_NAME)
+
+        for k, v in configcopy.items():
+            config[k] = v
+
     def delete(self, path):
         for base, dirs, filenames in os.walk(top=path):
             for fn in filenames:
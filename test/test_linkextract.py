@@ -0,0 +1,159 @@
+import os
+import time
+import random
+import unittest
+import threading
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+
+from webchecks import Project
+from webchecks.utils import linkextract
+from webchecks.access.ParsePool import ParsePool
+from webchecks.utils.Error import OptionsError
+from webchecks.profiles.BaseProfile import BaseProfile
+from webchecks.config import *
+
+
+_PROJECT_NAME = "TESTINGDRYRUNLINKEXTRACT123123212312"
+
+_pages = [
+    """<html><head></head><body>
+<p> This is some text where <a href="https://different.com">this</a>
+is <a href="//otherdifferent.com">linked</a> and thus <a href="/nice">
+there</a> are more <a href="#Summary">links</a><a href="">.</a>
+</body>""",
+    "",
+    "<a href='/a?x=1&amp;y=2'>escaped</a><A HREF=/upper>upper</A><a>none</a><a href/>",
+    "<p>unclosed <a href='/one'>one <a href='/two'>two</p><!-- <a href='/comment'> -->",
+    "<script>var s = \"<a href='/script'>\";</script><a name='x' href='/last' href='/dup'>",
+]
+
+
+def _corpus(n):
+    """Pages resembling real ones: navigation, text and many links."""
+    rnd = random.Random(7)
+    nav = "".join(f'<li><a href="/section/{i}" class="nav">Section {i}</a></li>'
+        for i in range(40))
+    pages = []
+    for i in range(n):
+        body = "".join(
+            f'<p>Paragraph {j} with <b>markup</b> and <a href="/page/{rnd.randint(0, 10**6)}">'
+            f'a link</a>, <img src="/img/{j}.png" alt="picture"> and some more text.</p>'
+            for j in range(rnd.randint(20, 80)))
+        pages.append(f"<html><head><title>Page {i}</title></head><body><nav><ul>{nav}"
+            f"</ul></nav><main>{body}</main><footer><a href='/about'>About</a></footer>"
+            "</body></html>")
+    return pages
+
+
+class LinkExtractTest(unittest.TestCase):
+
+    def test_backends_agree(self):
+        self.assertIn("stream", linkextract.available_backends())
+        self.assertIn("bs4", linkextract.available_backends())
+        self.assertEqual(linkextract.DEFAULT_BACKEND, linkextract.available_backends()[0])
+        for page in _pages + _corpus(5):
+            expected = [href for href in linkextract.extract_hrefs(page, "bs4")
+                if href not in (None, "")]
+            for backend in linkextract.available_backends():
+                hrefs = [href for href in linkextract.extract_hrefs(page, backend)
+                    if href not in (None, "")]
+                if backend == "stream": # same tokenizer as BeautifulSoup with html.parser
+                    self.assertEqual(hrefs, expected, page)
+                else:
+                    self.assertEqual(set(hrefs) - {"/comment", "/script"},
+                        set(expected) - {"/comment", "/script"}, f"{backend}: {page}")
+        self.assertEqual(linkextract.extract_hrefs(_pages[2], "stream"),
+            ["/a?x=1&y=2", "/upper", None, None])
+        self.assertRaises(OptionsError, linkextract.extract_hrefs, "", "nonexistent")
+
+    def test_project_setting(self):
+        configcopy = config.copy()
+        config[LOGGING_LEVEL] = LOG_ERROR
+        proj = Project(_PROJECT_NAME, "base.com")
+        proj.quiet_exit()
+        self.assertRaises(OptionsError, proj.set_link_extractor, "nonexistent")
+        for backend in ("auto",) + linkextract.available_backends():
+            proj.set_link_extractor(backend)
+            profile = BaseProfile("base.com")
+            profile.quiet_exit()
+            links = set(profile.get_links("https://base.com", _pages[0]))
+            self.assertEqual(links, {"https://different.com", "otherdifferent.com",
+                "base.com/nice"}, backend)
+        for k, v in configcopy.items():
+            config[k] = v
+        self.delete(_PROJECT_NAME)
+
+    def test_parse_pool(self):
+        wakeup = threading.Event()
+        pool = ParsePool(wakeup, 2)
+        pages = {f"https://base.com/{i}" : page for i, page in enumerate(_corpus(10))}
+        pages["https://base.com/first"] = _pages[0]
+        for url, page in pages.items():
+            pool.submit(url, page, "auto")
+        results = []
+        while len(results) < len(pages):
+            self.assertTrue(wakeup.wait(10))
+            wakeup.clear()
+            results += pool.collect()
+        self.assertEqual(pool.pending(), 0)
+        self.assertEqual(dict(results)["https://base.com/first"],
+            ["https://different.com", "otherdifferent.com", "base.com/nice"])
+        for url, links in results:
+            if url != "https://base.com/first":
+                self.assertEqual(links, linkextract.find_links(url, pages[url]))
+        pool.close()
+
+    def test_parse_pool_broken(self):
+        class BrokenExecutor:
+            # like a pool whose workers failed to start
+            def __init__(self):
+                self.submitted = 0
+            def submit(self, *args):
+                self.submitted += 1
+                future = Future()
+                future.set_exception(BrokenProcessPool("failed to start"))
+                return future
+            def shutdown(self, **kwargs):
+                pass
+
+        configcopy = config.copy()
+        config[LOGGING_LEVEL] = LOG_ERROR + 1
+        wakeup = threading.Event()
+        pool = ParsePool(wakeup, 1)
+        pool._executor.shutdown()
+        pool._executor = BrokenExecutor()
+        # the links are found all the same, in this process
+        for i in range(3):
+            pool.submit(f"https://base.com/{i}", _pages[0], "auto")
+        self.assertTrue(pool.broken)
+        self.assertEqual(pool._executor.submitted, 1)
+        self.assertEqual(pool.pending(), 3)
+        self.assertEqual(pool.collect(), [(f"https://base.com/{i}",
+            ["https://different.com", "otherdifferent.com", "base.com/nice"]) for i in (1, 2, 0)])
+        self.assertEqual(pool.pending(), 0)
+        pool.close()
+        for k, v in configcopy.items():
+            config[k] = v
+
+    def test_benchmark(self):
+        """Compares the backends on a corpus of pages, BeautifulSoup was used before."""
+        pages = _corpus(60)
+        timings = []
+        for backend in linkextract.available_backends():
+            t = time.perf_counter()
+            n = sum(len(linkextract.extract_hrefs(page, backend)) for page in pages)
+            timings.append(f"{backend} {time.perf_counter() - t:.4f}s")
+        print(f"link extraction, {len(pages)} pages with {n} links: " + ", ".join(timings))
+
+    def delete(self, path):
+        for base, dirs, filenames in os.walk(top=path):
+            for fn in filenames:
+                file = os.path.join(base, fn)
+                os.remove(file)
+
+            for d in dirs:
+
+                dirpath = os.path.join(base, d)
+                self.delete(dirpath)
+        os.rmdir(path)
@@ -0,0 +1,49 @@
+import os
+import unittest
+
+from webchecks.utils import messaging
+from webchecks.utils.messaging import logging, log_link, flush_logs, close_logs
+from webchecks.config import *
+
+
+_LOG = "TESTINGMESSAGING.log"
+_LINKS = "TESTINGMESSAGINGLINKS.log"
+
+
+class MessagingTest(unittest.TestCase):
+
+    def test_buffered_logging(self):
+        configcopy = config.copy()
+        config[LOGGING_FILE] = _LOG
+        config[LOGGING_LINKS] = _LINKS
+        config[LOGGING_LEVEL] = LOG_ERROR + 1 # nothing on the console
+        messaging.LOG_FLUSH_INTERVAL = 1000
+
+        for i in range(100):
+            logging(f"message {i}", LOG_INFO, where = "test")
+            log_link(f"https://website.org/{i}")
+        logging("not in the file", LOG_DEBUG)
+        logging("in the file", LOG_DEBUG, tofile = True)
+        # buffered until flushed, one handle per file
+        self.assertEqual(os.path.getsize(_LOG), 0)
+        self.assertEqual(len([p for p in messaging._files if p in (_LOG, _LINKS)]), 2)
+        flush_logs()
+        with open(_LOG) as f:
+            lines = f.readlines()
+        self.assertEqual(len(lines), 101)
+        self.assertTrue(lines[0].endswith(" [info] test: message 0\n"))
+        self.assertTrue(lines[-1].endswith("in the file\n"))
+        with open(_LINKS) as f:
+            self.assertEqual(f.read().split(), [f"https://website.org/{i}" for i in range(100)])
+
+        # errors are written right away
+        logging("failure", LOG_ERROR, where = "test")
+        with open(_LOG) as f:
+            self.assertTrue(f.readlines()[-1].endswith(" [error] test: failure\n"))
+
+        close_logs()
+        messaging.LOG_FLUSH_INTERVAL = 1
+        for k, v in configcopy.items():
+            config[k] = v
+        os.remove(_LOG)
+        os.remove(_LINKS)
@@ -1,3 +1,4 @@
+import os
 import unittest
 from webchecks.utils.url import *
 from webchecks.utils.timedqueue import *
@@ -65,3 +66,75 @@ class QueueTest(unittest.TestCase):
         self.assertTrue(q.isempty(), f"Queue empty at time {time}.")
         self.assertIsNone(q.dequeue(time))
         self.assertTrue(q.isempty(), f"Queue empty at time {time}.")
+
+    def test_time_until_ready(self):
+        q = TimedQueue()
+        self.assertIsNone(q.time_until_ready(0))
+        self.assertIsNone(q.next_ready_time())
+        q.enqueue("a", 1, 5, 0)
+        q.enqueue("b", 2, 3, 0)
+        q.enqueue("b", 3, 10, 0)
+        self.assertEqual(len(q), 3)
+        self.assertEqual(q.next_ready_time(), 3)
+        self.assertEqual(q.time_until_ready(1), 2)
+        self.assertEqual(q.time_until_ready(4), 0)
+        self.assertEqual(q.dequeue(4), 2)
+        # a is ready at 5, the next b at 4 + 10
+        self.assertEqual(q.time_until_ready(4), 1)
+        self.assertEqual(q.dequeue(6), 1)
+        self.assertEqual(q.next_ready_time(), 14)
+        self.assertIsNone(q.dequeue(13))
+        self.assertEqual(q.dequeue(14), 3)
+        self.assertIsNone(q.time_until_ready(14))
+        self.assertEqual(len(q), 0)
+
+    def test_many_domains(self):
+        q = TimedQueue()
+        for i in range(1000):
+            q.enqueue(i, i, 1000 - i, 0)
+            q.enqueue(i, -i, 1, 0)
+        # the queue that is ready the longest is served first
+        self.assertEqual([q.dequeue(1000) for _ in range(1000)], list(range(999, -1, -1)))
+        self.assertIsNone(q.dequeue(1000))
+        self.assertEqual(len(q), 1000)
+        self.assertEqual(sorted(q.dequeue(1001) for _ in range(1000)),
+            sorted(-i for i in range(1000)))
+        self.assertTrue(q.isempty())
+
+    def test_persistent(self):
+        path = "TESTINGFRONTIER.db"
+        q = PersistentTimedQueue(path, 0, window = 2)
+        for i in range(5):
+            self.assertTrue(q.enqueue("a", [f"a{i}", i], 1, 0))
+        self.assertTrue(q.enqueue("b", ["b0", 0], 2, 0))
+        self.assertFalse(q.enqueue("a", ["a3", 3], 1, 0)) # waiting already
+        self.assertEqual(len(q), 6)
+        self.assertEqual(len(q.queue["a"]), 2) # the rest stays on disk
+        self.assertEqual(q.dequeue(1), ["a0", 0])
+        self.assertEqual(q.dequeue(2), ["b0", 0])
+        self.assertEqual(q.dequeue(2), ["a1", 1])
+        self.assertEqual(q.time_until_ready(2), 1)
+        self.assertFalse(q.enqueue("b", ["b0", 0], 2, 2)) # dequeued, but not done
+        q.done("a", ["a0", 0])
+        q.done("b", ["b0", 0])
+        q.close()
+
+        # resumed, every queue is ready after the delay of its first element
+        q = PersistentTimedQueue(path, 10, window = 2)
+        self.assertEqual(len(q), 4)
+        self.assertIsNone(q.dequeue(10))
+        self.assertEqual([q.dequeue(t) for t in (11, 12, 13, 14)],
+            [["a1", 1], ["a2", 2], ["a3", 3], ["a4", 4]])
+        self.assertTrue(q.isempty())
+        for i in range(1, 5):
+            q.done("a", [f"a{i}", i])
+        self.assertTrue(q.enqueue("a", ["a3", 3], 1, 14)) # no longer waiting
+        q.close()
+        q = PersistentTimedQueue(path, 20)
+        self.assertEqual(q.dequeue(21), ["a3", 3])
+        q.done("a", ["a3", 3])
+        q.close()
+        q = PersistentTimedQueue(path)
+        self.assertTrue(q.isempty())
+        q.close()
+        os.remove(path)
@@ -67,6 +67,7 @@ class SecurityTest(unittest.TestCase):
         config[SINGLE_DOMAIN_ONLY] = False
         config[ALLOW_REDIRECT] = False
         config[WHITELIST_DOMAINS] = [r"(.*\.)?wiki(.*)\.org", r"(.*\.)?wiki\.org", "fulldomain.com"]
+        invalidate_policy()
 
         self.assertTrue(is_allowed_url("wiki.org"))
         self.assertTrue(is_allowed_url("en.wiki.org"))
@@ -97,6 +98,7 @@ class SecurityTest(unittest.TestCase):
         config[ALLOW_REDIRECT] = False
         config[WHITELIST_DOMAINS] = [r"(.*\.)?wiki(.*)\.org", r"(.*\.)?wiki\.org", "fulldomain.com"]
         config[WHITELIST_TLD] = ["org"]
+        invalidate_policy()
 
         self.assertTrue(is_allowed_url("wiki.org"))
         self.assertTrue(is_allowed_url("en.wiki.org"))
@@ -127,6 +129,7 @@ class SecurityTest(unittest.TestCase):
         config[WHITELIST_DOMAINS] = [r"(.*\.)?wiki(.*)\.org", r"(.*\.)?wiki\.org", "fulldomain.com"]
         config[WHITELIST_TLD] = ["org"]
         config[BLINDLY_TRUSTED_TLD] = ["net"]
+        invalidate_policy()
 
         self.assertTrue(is_allowed_url("wiki.org"))
         self.assertTrue(is_allowed_url("en.wiki.org"))
@@ -161,11 +164,13 @@ class SecurityTest(unittest.TestCase):
         config[WHITELIST_TLD] = ["org"]
         config[BLINDLY_TRUSTED_TLD] = ["net"]
         config[BLACKLISTED_TLD] = ["badtld"]
+        invalidate_policy()
 
         with self.assertRaises(InputError):
             is_allowed_url("wiki.org")
 
         config[SINGLE_DOMAIN_ONLY] = r"(.*\.)?wiki\.org"
+        invalidate_policy()
 
         self.assertTrue(is_allowed_url("wiki.org"))
         self.assertTrue(is_allowed_url("en.wiki.org"))
@@ -224,3 +229,62 @@ class SecurityTest(unittest.TestCase):
     #    self.assertEqual(len(expect), j)
 
 
+
+    def test_compiled_policy(self):
+        config[WHITELISTED_DOMAINS_ONLY] = True
+        config[WHITELISTED_TLD_ONLY] = False
+        config[ENABLE_BLINDLY_TRUSTED_TLD] = False
+        config[SINGLE_DOMAIN_ONLY] = False
+        config[ALLOW_REDIRECT] = False
+        config[BLACKLISTED_TLD] = ()
+        config[WHITELIST_DOMAINS] = [r"(.*\.)?wiki\.org", "fulldomain.com"]
+
+        policy = compile_policy()
+        self.assertIs(get_policy(), policy)
+        self.assertTrue(is_allowed_url("en.wiki.org/page"))
+        self.assertFalse(is_allowed_url("en.wiki.org/page?to=https%3A%2F%2Fother.com"))
+        self.assertTrue(is_allowed_url("en.wiki.org/other"))
+        self.assertEqual(policy.host_verdict.cache_info().hits, 2)
+        self.assertFalse(is_allowed_url("other.com"))
+
+        # changes of config directly are noticed once the policy is invalidated
+        config[WHITELIST_DOMAINS].append(r"(.*\.)?other\.com")
+        self.assertFalse(is_allowed_url("other.com"))
+        invalidate_policy()
+        self.assertTrue(is_allowed_url("other.com"))
+        self.assertIsNot(get_policy(), policy)
+        config[ALLOW_REDIRECT] = True
+        invalidate_policy()
+        self.assertTrue(is_allowed_url("en.wiki.org/page?to=https%3A%2F%2Fother.com"))
+
+        # patterns that cannot be merged into one expression
+        config[WHITELIST_DOMAINS] = [r"(?i)WIKI\.org", r"(a)\1\.org"]
+        invalidate_policy()
+        self.assertTrue(is_allowed_url("wiki.org"))
+        self.assertTrue(is_allowed_url("aa.org"))
+        self.assertFalse(is_allowed_url("ab.org"))
+        config[WHITELIST_DOMAINS] = []
+        invalidate_policy()
+        self.assertFalse(is_allowed_url("wiki.org"))
+        config[WHITELISTED_DOMAINS_ONLY] = False
+        invalidate_policy()
+
+    def test_javascript_trust_table(self):
+        table = JavascriptTrustTable({"*": UNTRUSTED, "goodsite.com": TRUSTED,
+            "ads.goodsite.com": UNTRUSTED, "cdn.org": TRUSTED})
+        self.assertTrue(table.allows("https://goodsite.com/app.js"))
+        self.assertTrue(table.allows("https://www.goodsite.com/app.js?v=3"))
+        self.assertTrue(table.allows("static.cdn.org/lib.js"))
+        # the most specific entry decides
+        self.assertFalse(table.allows("https://ads.goodsite.com/track.js"))
+        self.assertFalse(table.allows("https://x.ads.goodsite.com:8080/track.js"))
+        # only whole labels match
+        self.assertFalse(table.allows("https://notgoodsite.com/app.js"))
+        self.assertFalse(table.allows("https://goodsite.com.evil.net/app.js"))
+        self.assertFalse(table.allows("not a url"))
+        self.assertTrue(table.allows("https://www.goodsite.com/other.js"))
+        self.assertEqual(table.host_verdict.cache_info().hits, 1)
+
+        table = JavascriptTrustTable({"*": TRUSTED, "evil.net": UNTRUSTED})
+        self.assertTrue(table.allows("https://goodsite.com/app.js"))
+        self.assertFalse(table.allows("https://cdn.evil.net/app.js"))
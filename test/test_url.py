@@ -157,6 +157,21 @@ class URLTest(unittest.TestCase):
             lpna = extract_local_path_without_args(url)
 
 
+    def test_parse_url(self):
+        p = parse_url("https://en.wiki.org/page?q=1#Summary")
+        self.assertEqual((p.protocol, p.subdomains, p.domain_name, p.tld, p.domain, p.fqdn),
+            ("https", "en.", "wiki", "org", "wiki.org", "en.wiki.org"))
+        self.assertEqual(p.path_and_args, "/page?q=1#Summary")
+        self.assertEqual(p.path, "/page")
+        # parsed only once
+        self.assertIs(parse_url("https://en.wiki.org/page?q=1#Summary"), p)
+        with self.assertRaises(AttributeError):
+            p.other = 1
+        with self.assertRaises(InputError):
+            parse_url(["wiki.org"])
+        with self.assertRaises(InputError):
+            parse_url("/no/url")
+
     def test_URL_manipulate(self):
         self.assertEqual(change_protocol("ftp", "hi.net/ok.ok/yes"), "ftp://hi.net/ok.ok/yes",
             "Test url.py: Change protocol on basic test failed.")
@@ -1,14 +1,20 @@
 """This module provides the Project class, the main interface to the user."""
 import os
 import atexit
-from typing import Type, Union, Collection, Callable
+from typing import Type, Union, Collection, Callable, List
 
 from webchecks.access import AccessHead, Gateway
-from webchecks.profiles.BaseProfile import BaseProfile
+from webchecks.access.security import compile_policy, invalidate_policy
+from webchecks.access.ParsePool import check_main_process
+from webchecks.profiles.BaseProfile import BaseProfile, ARCHIVE_BACKENDS
 from webchecks.profiles.profileDB import add_profile, profiledb
 from webchecks.monitor.Report import Report
 from webchecks.archive.AccessNode import AccessNode
+from webchecks.archive.GlobalCache import GlobalCache
+from webchecks.archive import compression, warc
 from webchecks.utils.messaging import logging, LOG_INFO, LOG_WARNING, LOG_ERROR
+from webchecks.utils.Error import OptionsError
+from webchecks.utils import linkextract
 
 # almost all constants and we need many of them
 # pylint: disable-next=wildcard-import
@@ -49,6 +55,7 @@ class Project:
         self.keywords = None
         self.profiles = []
         self.reporter = Report(project_root, project_root, initial_seed_urls)
+        invalidate_policy() # config may have changed since the last project
         self._setup()
         self.acc_node = AccessNode()
         atexit.register(self.__report)
@@ -127,9 +134,14 @@ class Project:
             Number of seconds to crawl.
         """
 
+        if config[PARSE_IN_PROCESSES]:
+            check_main_process() # before any request is sent
         gateway = Gateway.GateWay() # new Gateway, in case of multiple runs...
         accesshead = AccessHead.AccessHead(self.initial_seed_urls)
-        accesshead.run(gateway, n_seconds)
+        try:
+            accesshead.run(gateway, n_seconds)
+        finally:
+            gateway.close()
 
     def enable_javascript(self, enable : bool):
         """Enable Javascript. This requires Seleniumwire. 
@@ -141,6 +153,40 @@ class Project:
         """
         config[ENABLE_JAVASCRIPT] = enable
 
+    def enable_async_requests(self, enable : bool, max_in_flight : int = 256):
+        """Send requests concurrently: While waiting for the response of one domain,
+        requests to other domains are already sent. The wait time between two accesses
+        to the same domain still holds. Only has an effect if Javascript is disabled.
+
+        Parameters
+        ---------
+        enable : bool
+            Boolean value whether to send requests concurrently. Default value is False.
+        max_in_flight : int
+            Maximum number of requests in flight at the same time. Default value is 256.
+        """
+        if max_in_flight < 1:
+            raise ValueError("max_in_flight should be at least 1.")
+        config[ENABLE_ASYNC_REQUESTS] = enable
+        config[ASYNC_MAX_IN_FLIGHT] = max_in_flight
+
+    def enable_conditional_requests(self, enable : bool, extract_links : bool = False):
+        """Revalidate pages stored in an earlier run instead of downloading them again:
+        The ETag and Last-Modified headers of the responses are kept, and later requests
+        for the same URL ask the server to only send the content if it changed.
+        Unchanged pages are not stored again. Only has an effect if Javascript is disabled.
+
+        Parameters
+        ---------
+        enable : bool
+            Boolean value whether to send conditional requests. Default value is False.
+        extract_links : bool
+            Whether to search unchanged HTML pages for links, using the content stored.
+            Default value is False, i.e. links are only found on pages that changed.
+        """
+        config[CONDITIONAL_REQUESTS] = enable
+        config[CONDITIONAL_REQUESTS_EXTRACT_LINKS] = extract_links
+
     def enable_crawl(self, enable : bool):
         """Whether to visit links found in retreived HTML pages. By default, 
         it is enabled. If false, then only the seed URLs are visited.
@@ -153,6 +199,60 @@ class Project:
         """
         config[DO_CRAWL] = enable
 
+    def set_link_extractor(self, backend : str):
+        """Specify how links are found on retreived HTML pages by profiles that do not
+        override get_links. All backends find the same links, they differ in speed.
+
+        Parameters
+        ---------
+        backend : str
+            'selectolax' and 'lxml' if the respective package is installed, 'stream'
+            (pure Python) or 'bs4' (BeautifulSoup, slowest). Default value is 'auto',
+            the fastest one available.
+        """
+        if backend != "auto" and backend not in linkextract.available_backends():
+            raise OptionsError("link extractor", ("auto",) + linkextract.available_backends())
+        config[LINK_EXTRACTOR] = backend
+
+    def enable_parse_processes(self, enable : bool, n_processes : Union[None, int] = None):
+        """Search retreived pages for links in other processes, such that parsing
+        does not hold up sending requests. Only applies to profiles that do not
+        override get_links.
+
+        The processes import the main module of your script. Thus it must only set up
+        and run the project under 'if __name__ == "__main__":', otherwise run raises a
+        RuntimeError in them and pages are searched in the main process instead.
+
+        Parameters
+        ---------
+        enable : bool
+            Boolean value whether to parse in other processes. Default value is False.
+        n_processes : int or None
+            Number of processes. Default value is None, one per CPU.
+        """
+        if n_processes is not None and n_processes < 1:
+            raise ValueError("n_processes should be at least 1.")
+        config[PARSE_IN_PROCESSES] = enable
+        config[PARSE_PROCESSES] = n_processes
+
+    def enable_persistent_frontier(self, enable : bool, window : int = 100):
+        """Keep the links waiting to be accessed on disk, in the project directory. When a
+        run ends (or the program is stopped), the next run continues with them rather
+        than only with the initial seed urls. This also allows for more waiting links than
+        fit into memory.
+
+        Parameters
+        ---------
+        enable : bool
+            Boolean value whether to keep the waiting links on disk. Default value is False.
+        window : int
+            Number of waiting links per domain kept in memory. Default value is 100.
+        """
+        if window < 1:
+            raise ValueError("window should be at least 1.")
+        config[PERSISTENT_FRONTIER] = enable
+        config[FRONTIER_WINDOW] = window
+
     def set_timeout(self, timeout_s : int):
         """Set the timeout value in seconds.
         
@@ -185,6 +285,7 @@ class Project:
         """
         config[WHITELISTED_DOMAINS_ONLY] = True
         config[WHITELIST_DOMAINS] = whitelisted_domains
+        compile_policy()
 
     def sec_allow_all_websites(self):
         """Part of the security policy.
@@ -200,6 +301,7 @@ class Project:
         config[WHITELISTED_TLD_ONLY] = []
         config[WHITELIST_DOMAINS] = []
         config[BLINDLY_TRUSTED_TLD] = []
+        compile_policy()
 
     def sec_whitelisted_tld_only(self, whitelisted_tld : Collection[str]):
         """Part of the security policy.
@@ -216,6 +318,7 @@ class Project:
         """
         config[WHITELISTED_TLD_ONLY] = True
         config[WHITELIST_TLD] = whitelisted_tld
+        compile_policy()
 
     def sec_blindly_trusted_tld(self, blindly_trusted_tlds : Collection[str]):
         """Part of the security policy.
@@ -234,6 +337,7 @@ class Project:
         """
         config[ENABLE_BLINDLY_TRUSTED_TLD] = True
         config[BLINDLY_TRUSTED_TLD] = blindly_trusted_tlds
+        compile_policy()
 
     def sec_single_domain_only(self, single_domain_only : str):
         """Part of the security policy.
@@ -242,6 +346,7 @@ class Project:
         """
         logging("sec_single_domain_only is deprecated. Use sec_set_allowed_websites", LOG_WARNING)
         config[SINGLE_DOMAIN_ONLY] = single_domain_only
+        compile_policy()
 
     def sec_allow_generic_redirect(self, allow_redirect : bool):
         """Part of the security policy.
@@ -260,6 +365,7 @@ class Project:
             Boolean value whether to allow generic (URL driven) redirect. Default value is False.
         """
         config[ALLOW_REDIRECT] = allow_redirect
+        compile_policy()
 
     def set_compress_text(self, compress_text : bool):
         """Specify whether html results should be compressed if they are stored.
@@ -271,6 +377,133 @@ class Project:
         """
         config[COMPRESS_CONTENT] = compress_text
 
+    def set_cache_write_behind(self, enable : bool, batch_size : int = 1000,
+            interval_s : Union[int, float] = 5):
+        """Group the writes to the project cache (content/.cache/meta.db) into transactions
+        instead of committing each one. Much faster, but if the process is killed, the
+        writes of up to interval_s seconds may be lost. Pending writes are committed at the
+        end of each run and at shutdown.
+
+        Parameters
+        ---------
+        enable : bool
+            Whether to enable write-behind mode. Default value is False.
+        batch_size : int
+            Commit as soon as this many writes are pending. Default value is 1000.
+        interval_s : int or float
+            Commit as soon as this many seconds passed since the last commit.
+            Default value is 5.
+        """
+        if batch_size < 1:
+            raise ValueError("batch_size should be at least 1.")
+        if interval_s < 0:
+            raise ValueError("interval_s should not be negative.")
+        config[CACHE_WRITE_BEHIND] = enable
+        config[CACHE_COMMIT_BATCH_SIZE] = batch_size
+        config[CACHE_COMMIT_INTERVAL] = interval_s
+        GlobalCache().set_write_behind(enable)
+
+    def set_archive_backend(self, backend : str):
+        """Specify how the results are stored. 'files' stores each page in a file and its
+        metadata in another. 'pack' appends them to large segment files instead, which
+        scales to millions of pages. Either way, the results are accessed the same way.
+
+        Parameters
+        ---------
+        backend : str
+            Either 'files' or 'pack'. Default value is 'files'.
+        """
+        if backend not in ARCHIVE_BACKENDS:
+            raise OptionsError("backend", tuple(ARCHIVE_BACKENDS))
+        config[ARCHIVE_BACKEND] = backend
+        for (_, profile) in profiledb.items():
+            profile.update_archive_backend()
+
+    def export_warc(self, location : str, domains : Union[None, Collection[str]] = None,
+            max_file_size : int = 1 << 30) -> List[str]:
+        """Export the results to gzip compressed WARC files. Returns the files written.
+
+        Parameters
+        ---------
+        location : str
+            The directory to write the WARC files to.
+        domains : collection of str or None
+            The domains to export. Default value None exports all of them.
+        max_file_size : int
+            A new file is started once one exceeds this many bytes. Default value is 1 GiB.
+        """
+        return warc.export_warc(location, domains, max_file_size)
+
+    def import_warc(self, location : str) -> int:
+        """Import the pages in WARC files as if they had been retreived, such that they are
+        accessible using the access_node. Returns the number of pages imported.
+
+        Parameters
+        ---------
+        location : str
+            A WARC file (.warc or .warc.gz) or a directory containing such files.
+        """
+        return warc.import_warc(location)
+
+    def enable_deduplication(self, enable : bool):
+        """Store identical content only once in the project, e.g. pages that did not change
+        since the last run or are available under several URLs. The metadata of each URL
+        refers to where the content is stored. The results are accessed the same way.
+
+        Parameters
+        ---------
+        enable : bool
+            Whether to deduplicate content. Default value is False.
+        """
+        config[DEDUPLICATE_CONTENT] = enable
+
+    def set_compression(self, codec : str, level : Union[None, int] = None):
+        """Specify how text results are compressed if compression is enabled
+        (see set_compress_text). Content stored earlier remains readable, the codec
+        is recorded in its metadata.
+
+        Parameters
+        ---------
+        codec : str
+            One of 'lzma', 'zlib', 'gzip' and, if the zstandard package is installed, 'zstd'.
+            Default value is 'lzma'.
+        level : int or None
+            The compression level, higher compresses better but slower. Ranges from 0 to 9,
+            for zstd from 1 to 22. None means the default level of the codec.
+        """
+        level = compression.get_codec(codec).check_level(level)
+        config[COMPRESSION_CODEC] = codec
+        config[COMPRESSION_LEVEL] = level
+
+    def enable_zstd_dictionary(self, enable : bool, n_samples : int = 100,
+            dictionary_size : int = 112640):
+        """Compress the pages of each domain using a zstd dictionary that is trained on
+        its first pages. Pages of one website share most of their markup, so this
+        compresses much better than compressing each page on its own.
+        Requires the zstandard package and implies set_compression('zstd').
+
+        Parameters
+        ---------
+        enable : bool
+            Whether to use dictionaries. Default value is False.
+        n_samples : int
+            Number of pages after which the dictionary of a domain is trained.
+            Default value is 100.
+        dictionary_size : int
+            Maximum size of a dictionary in bytes. Default value is 112640.
+        """
+        if enable and not compression.zstd_available():
+            raise ValueError("zstd dictionaries require the zstandard package.")
+        if n_samples < 1:
+            raise ValueError("n_samples should be at least 1.")
+        if dictionary_size < 256:
+            raise ValueError("dictionary_size should be at least 256.")
+        if enable and config[COMPRESSION_CODEC] != "zstd":
+            self.set_compression("zstd")
+        config[ZSTD_DICTIONARY] = enable
+        config[ZSTD_DICTIONARY_SAMPLES] = n_samples
+        config[ZSTD_DICTIONARY_SIZE] = dictionary_size
+
     def install_profile(self, profile : Type[BaseProfile]):
         """Install the user defined profile that you have written.
         Currently this will not remember the profile after shutdown.
@@ -308,6 +541,41 @@ class Project:
         """
         config[LOCATION_FIREFOX_DRIVER] = path
 
+    def set_browser_pool(self, size : int, headless : bool = True):
+        """If you enable Javascript: Render several pages at the same time, each in
+        its own browser. The wait time between two accesses to the same domain still holds,
+        so this speeds up crawls spanning several domains. A browser that crashes is
+        restarted. Do not combine it with set_browser_use_profile, as Firefox does not
+        allow several instances to use the same profile.
+
+        Parameters
+        ---------
+        size : int
+            Number of browsers. Default value is 1.
+        headless : bool
+            Whether to run the browsers without a window. Default value is True.
+        """
+        if size < 1:
+            raise ValueError("size should be at least 1.")
+        config[BROWSER_POOL_SIZE] = size
+        config[BROWSER_HEADLESS] = headless
+
+    def set_browser_max_stored_requests(self, max_requests : Union[None, int]):
+        """If you enable Javascript: The browser goes through a proxy that keeps the
+        responses of all requests of the page loaded. This keeps them in memory and
+        bounds their number, the oldest ones are discarded. The page itself is always kept.
+        To not load some resources at all, see
+        BaseProfile._set_resource_policy.
+
+        Parameters
+        ---------
+        max_requests : int or None
+            Maximum number of requests kept. Default value is None, no limit.
+        """
+        if max_requests is not None and max_requests < 1:
+            raise ValueError("max_requests should be at least 1.")
+        config[BROWSER_MAX_STORED_REQUESTS] = max_requests
+
     def set_browser_use_profile(self, path : str):
         """If you enable Javascript: Can specify the location of the used profile.
         Note that you usually do not need to specify this - unless you are on Ubuntu, 
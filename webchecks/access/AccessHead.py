@@ -1,20 +1,34 @@
 """This module provides the AccessHead class."""
 
 import time
-from typing import Union, Set
+from typing import Union, Set, Tuple
 
 from webchecks.access.Gateway import GateWay
+from webchecks.access.RequestNoJS import NOT_MODIFIED_HEADER
+from webchecks.access.ParsePool import ParsePool
+from webchecks.profiles.BaseProfile import BaseProfile
 from webchecks.profiles.profileDB import fetch_profile
-from webchecks.utils.url import extract_fully_qualified_domain_name
-from webchecks.utils.file_ops import get_file_type_from_response_header
+from webchecks.archive.GlobalCache import GlobalCache
+from webchecks.utils.url import extract_fully_qualified_domain_name, strong_strip_query_from_url
+from webchecks.utils.file_ops import get_file_type_from_response_header, decode_content
 from webchecks.utils.messaging import logging
-from webchecks.config import config, LOG_INFO, DO_CRAWL
+from webchecks.config import config, LOG_INFO, DO_CRAWL, CONDITIONAL_REQUESTS_EXTRACT_LINKS, \
+    LINK_EXTRACTOR, PARSE_IN_PROCESSES, PARSE_PROCESSES
 
 
 class AccessHead:
-    """Accesshead maintains the run and initiates accesses."""
+    """Accesshead maintains the run and initiates accesses.
+
+    With config[PARSE_IN_PROCESSES], pages are searched for links on a ParsePool
+    while further requests are sent. The links found are added to the queue as they
+    arrive. This only applies to profiles that do not override get_links.
+
+    A response is acknowledged to the gateway (see GateWay.acknowledge) once the links
+    found on it are queued."""
     def __init__(self, initial_seed_urls):
         self.gateway = None
+        self.parse_pool = None
+        self.parsing = set() # links of the pages on the parse pool
         self.initial_seed_urls = \
             [initial_seed_urls] if isinstance(initial_seed_urls, str) else initial_seed_urls
 
@@ -38,36 +52,95 @@ class AccessHead:
 					"you may change LOGGING_LEVEL."
 				)
 
+        if config[PARSE_IN_PROCESSES]:
+            self.parse_pool = ParsePool(gateway.wakeup, config[PARSE_PROCESSES])
+        try:
+            self._loop(gateway, max_time_s)
+        finally:
+            if self.parse_pool is not None:
+                self.parse_pool.close() # the pages left are not acknowledged
+                self.parse_pool = None
+                self.parsing.clear()
+        GlobalCache().flush()
+
+    def _loop(self, gateway : GateWay, max_time_s : Union[int, float]): # pragma: no cover
         start_timestamp = time.time()
         while True:
 
             links = []
+            handled = []
             for content, resp_header, link in gateway.process_queue():
                 domain = extract_fully_qualified_domain_name(link)
                 profile = fetch_profile(domain)
+                if get_file_type_from_response_header(resp_header, False)[0] == "text":
+                    # once, for both the profile and the archive
+                    content = decode_content(content, resp_header)
                 profile.consume_retreived_content(link, resp_header, content)
+                if NOT_MODIFIED_HEADER in resp_header:
+                    content, resp_header = self.stored_content(link)
                 links += self.fetch_links(content, resp_header, link) ## seeking links...
+                if link not in self.parsing:
+                    handled.append(link)
+
+            if self.parse_pool is not None:
+                for link, found in self.parse_pool.collect():
+                    profile = fetch_profile(extract_fully_qualified_domain_name(link))
+                    # what get_links does after finding them
+                    links += profile._register_urls(found) # pylint: disable=protected-access
+                    self.parsing.discard(link)
+                    handled.append(link)
 
             for sublink in links:
                 gateway.add_to_queue(sublink)
+            for link in handled:
+                gateway.acknowledge(link)
 
-            if gateway.done():
+            if gateway.done() and (self.parse_pool is None or self.parse_pool.pending() == 0):
                 logging("Done: No more links to process. Early terminating.", LOG_INFO)
                 break
 
-            if time.time() - start_timestamp >= max_time_s:
+            remaining = max_time_s - (time.time() - start_timestamp)
+            if remaining <= 0:
                 logging("Maximum time reached. Aborting the process.", LOG_INFO)
                 break
-            time.sleep(0.1)
 
+            # Sleep until the next link becomes ready. If only responses (or parsed pages)
+            # are outstanding, the gateway wakes us up as soon as they arrive.
+            wait = gateway.time_until_ready()
+            if wait is None:
+                wait = remaining
+            if wait > 0:
+                gateway.wait(min(wait, remaining))
+
+    def stored_content(self, link : str) -> Tuple[Union[str, bytes], dict]:
+        """Get the content stored for a link the server reported unchanged, along with a
+        response header for it, to search it for links once more. Only HTML pages and only
+        if config[CONDITIONAL_REQUESTS_EXTRACT_LINKS], otherwise (b"", {}).
+
+        Parameters:
+        --------------
+        link : str
+            The original link.
+        """
+        if not config[CONDITIONAL_REQUESTS_EXTRACT_LINKS]:
+            return b"", {}
+        name = GlobalCache().get_link_location(strong_strip_query_from_url(link))
+        if name is None or not name[0].endswith(".html"):
+            return b"", {}
+        profile = fetch_profile(extract_fully_qualified_domain_name(link))
+        try:
+            content = profile.get_archive().retreive_content(name[0])
+        except (FileNotFoundError, ValueError):
+            return b"", {}
+        return content, {"content-type" : "text/html"}
 
-    def fetch_links(self, text : bytes, resp_header : dict, link: str) -> Set[str]:
+    def fetch_links(self, text : Union[str, bytes], resp_header : dict, link: str) -> Set[str]:
         """Get links to enter next given a finished request.
 
         Parameters:
         --------------
-        text : bytes
-            The data of the response.
+        text : str or bytes
+            The data of the response. Bytes are decoded, see decode_content.
         resp_header : dict
             The header of the response.
         link : str
@@ -80,9 +153,12 @@ class AccessHead:
         # fetching further links currently only supported from html files.
         if get_file_type_from_response_header(resp_header)[1] != ".html":
             return []
-        if isinstance(text, bytes):
-            text = text.decode("utf-8") # to str
 
-        profile = fetch_profile(extract_fully_qualified_domain_name(link))
+        text = decode_content(text, resp_header)
 
+        profile = fetch_profile(extract_fully_qualified_domain_name(link))
+        if self.parse_pool is not None and type(profile).get_links is BaseProfile.get_links:
+            self.parse_pool.submit(link, text, config[LINK_EXTRACTOR])
+            self.parsing.add(link)
+            return [] # collected in run once parsed
         return profile.get_links(link, text)
@@ -1,18 +1,23 @@
 """Provides the Gateway class. It does all access filtering, implementing the security policy."""
 
+import os
 import time
-from typing import Tuple, Collection
+import threading
+from typing import Tuple, Collection, Union
 
 from webchecks.profiles.profileDB import fetch_profile
 from webchecks.utils.url import extract_fully_qualified_domain_name, \
 	change_protocol, is_url, extract_protocol
-from webchecks.utils.timedqueue import TimedQueue
+from webchecks.utils.timedqueue import TimedQueue, PersistentTimedQueue
 from webchecks.utils.messaging import logging, log_link
 from webchecks.config import config, ENABLE_JAVASCRIPT, LOG_INFO, LOG_ERROR, \
-	LOG_DEBUG, ENFORCE_HTTPS
+	LOG_DEBUG, ENFORCE_HTTPS, ENABLE_ASYNC_REQUESTS, BROWSER_POOL_SIZE, \
+	PERSISTENT_FRONTIER, FRONTIER_WINDOW, CACHE_STORAGE_LOCATION, CACHE_COMMIT_BATCH_SIZE, \
+	CACHE_COMMIT_INTERVAL
 
 from .security import is_allowed_url
 from .RequestNoJS import RequestNoJS
+from .RequestAsync import RequestAsync
 from .RobotsFile import RobotsFile
 
 class URLPair:
@@ -31,15 +36,47 @@ class GateWay:
     they are checked and restricted (as much as possible, given the security policy).
 
     If enforce_https is true, it will ensure any link accessed uses the https protocol.
+
+    If the sender is concurrent (see RequestAsync and RequestJSPool), links released by the queue are
+    submitted without waiting for the response and process_queue yields whatever
+    responses have arrived in the meantime.
+
+    With config[PERSISTENT_FRONTIER], the queue is kept in the project cache (frontier.db)
+    and a new Gateway continues with the links the previous one did not finish: A link
+    stays in the queue until acknowledge is called for it. Call close once done.
     """
 
 
     def __init__(self):
-        self.queue = TimedQueue()
+        if config[PERSISTENT_FRONTIER]:
+            self.queue = PersistentTimedQueue(
+                os.path.join(config[CACHE_STORAGE_LOCATION], "frontier.db"), time.time(),
+                config[FRONTIER_WINDOW], config[CACHE_COMMIT_BATCH_SIZE],
+                config[CACHE_COMMIT_INTERVAL])
+            if not self.queue.isempty():
+                logging(f"Resuming with {len(self.queue)} links in the queue.", LOG_INFO)
+        else:
+            self.queue = TimedQueue()
+        # url and original url -> URLPair dequeued but not yet acknowledged
+        self.handed_out = {}
         self.robotsfile = RobotsFile()
-        if not config[ENABLE_JAVASCRIPT]:
+        self.concurrent = False
+        self.wakeup = threading.Event() # set whenever something arrives that needs processing
+        if not config[ENABLE_JAVASCRIPT] and config[ENABLE_ASYNC_REQUESTS]:
+            logging("Javascript is disabled. Sending requests concurrently.", LOG_INFO)
+            self.sender = RequestAsync()
+            self.sender.results_ready = self.wakeup
+            self.concurrent = True
+        elif not config[ENABLE_JAVASCRIPT]:
             logging("Javascript is disabled.", LOG_INFO)
             self.sender = RequestNoJS()
+        elif config[BROWSER_POOL_SIZE] > 1:
+            logging(f"Javascript is enabled. Using {config[BROWSER_POOL_SIZE]} browsers.",
+                LOG_INFO)
+            from .RequestJSPool import RequestJSPool # pylint: disable=import-outside-toplevel
+            self.sender = RequestJSPool(config[BROWSER_POOL_SIZE])
+            self.sender.results_ready = self.wakeup
+            self.concurrent = True
         else:
             logging("Javascript is enabled.", LOG_INFO)
             from .RequestJS import RequestJS
@@ -69,9 +106,12 @@ class GateWay:
 
         domain = extract_fully_qualified_domain_name(link)
         profile = fetch_profile(domain)
-        self.queue.enqueue(domain, URLPair(original_url, link),
-            profile.get_wait_time(), time.time())
-        logging(f"Added to queue {link}")
+        # a pair of str rather than URLPair, such that a PersistentTimedQueue can store it
+        if self.queue.enqueue(domain, (original_url, link), profile.get_wait_time(),
+                time.time()):
+            logging(f"Added to queue {link}")
+        else:
+            logging(f"Waiting in queue already {link}")
         return True
 
     def process_queue(self) -> Tuple[bytes, dict, str]: # pragma: no cover
@@ -82,16 +122,79 @@ class GateWay:
         
         Yields (retreived_content, response_header, link)."""
 
-        elt = self.queue.dequeue(time.time())
+        if self.concurrent:
+            elt = self._dequeue()
+            while elt is not None:
+                log_link(elt.url)
+                self.sender.submit(elt)
+                elt = self._dequeue()
+            yield from self.sender.collect()
+            return
+
+        elt = self._dequeue()
         while elt is not None:
             responses = self._request_resource(elt)
             yield from responses
-            elt = self.queue.dequeue(time.time())
+            elt = self._dequeue()
+
+    def _dequeue(self) -> Union[None, URLPair]:
+        elt = self.queue.dequeue(time.time())
+        if elt is None:
+            return None
+        linkpair = URLPair(*elt)
+        if isinstance(self.queue, PersistentTimedQueue):
+            self.handed_out[linkpair.original_url] = self.handed_out[linkpair.url] = linkpair
+        return linkpair
+
+    def acknowledge(self, link : str):
+        """Tell that the response for the link was handled, the links found on it included.
+        Only then a persistent queue (see PERSISTENT_FRONTIER) forgets the link, otherwise
+        the next run requests it again. Links that were not dequeued are ignored.
+
+        Parameters:
+        -------------
+        link : str
+            The link of the response, as yielded by process_queue.
+        """
+        linkpair = self.handed_out.pop(link, None)
+        if linkpair is None:
+            return
+        self.handed_out.pop(linkpair.original_url, None)
+        self.handed_out.pop(linkpair.url, None)
+        self.queue.done(extract_fully_qualified_domain_name(linkpair.url),
+            (linkpair.original_url, linkpair.url))
+
+    def close(self):
+        """Store what is left in the queue, if it is persistent (see PERSISTENT_FRONTIER).
+        Links not acknowledged are kept too."""
+        if isinstance(self.queue, PersistentTimedQueue):
+            self.queue.close()
+        self.handed_out.clear()
 
     def done(self) -> bool:
         """Returns true if there is nothing more to process."""
+        if self.concurrent and self.sender.pending() > 0:
+            return False
         return self.queue.isempty()
 
+    def time_until_ready(self) -> Union[None, int, float]:
+        """Returns the number of seconds until process_queue has the next link to
+        process. 0 if it has one already and None if the queue is empty."""
+        return self.queue.time_until_ready(time.time())
+
+    def wait(self, timeout : Union[int, float]) -> bool: # pragma: no cover
+        """Blocks for at most timeout seconds. Returns earlier, namely True,
+        as soon as responses of a concurrent sender arrive.
+
+        Parameters:
+        -------------
+        timeout : int or float
+            Maximum number of seconds to block.
+        """
+        woken = self.wakeup.wait(timeout)
+        self.wakeup.clear()
+        return woken
+
     def _request_resource(self, linkpair : str) -> Collection[Tuple[bytes, dict, str]]: # pragma: no cover
         link = linkpair.url
         log_link(link)
@@ -152,7 +255,7 @@ class GateWay:
             logging(f"Link not permitted. Not allowing as express_request: {link}", LOG_DEBUG)
             return (b"", {}, original_url)
 
-        ret = self._request_resource(URLPair(original_url, link))
+        ret = list(self._request_resource(URLPair(original_url, link)))
         # now get single request corresponding to user request
         for req in ret:
             if req[2] in (original_url, link):
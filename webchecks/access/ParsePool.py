@@ -0,0 +1,142 @@
+"""Provides the ParsePool class which searches retreived pages for links in other processes."""
+
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Tuple, Union
+
+from webchecks.utils.linkextract import find_links
+from webchecks.utils.messaging import logging
+from webchecks.config import LOG_ERROR
+
+
+def check_main_process():
+    """Raises RuntimeError if called while a worker process imports the main module,
+    i.e. if the script starts the run outside of 'if __name__ == "__main__":'.
+    multiprocessing checks the same before starting processes."""
+    if getattr(multiprocessing.current_process(), "_inheriting", False):
+        raise RuntimeError("A worker process of the ParsePool started a run. Only start "
+            "it under 'if __name__ == \"__main__\":' when parsing in other processes.")
+
+
+def _parse(url : str, content : str, backend : str) -> List[str]:
+    """Runs in a worker process."""
+    return find_links(url, content, backend)
+
+
+class ParsePool:
+    """Finds the links on retreived pages on a pool of processes, such that
+    parsing does not hold up sending requests. Pages are handed over using submit and the
+    links found are picked up using collect. Whenever a result arrives, the wakeup event
+    is set.
+
+    Only the link extraction of BaseProfile.get_links can run in another process. The links
+    collected still need to be registered with the profile, see AccessHead.
+
+    The worker processes are not forked from this one, which runs threads (e.g. those of
+    the sender) whose locks a forked child could inherit while held. Instead, they import
+    the main module of the program, thus the script must only start the run under
+    'if __name__ == "__main__":'. Pages a worker failed on are searched in this process
+    by collect. If the workers cannot be started at all, pages are searched in this
+    process from then on.
+
+    Parameters:
+    -------------
+    wakeup : threading.Event
+        Set when a result arrives.
+    n_processes : int or None
+        Number of worker processes. None means one per CPU.
+    """
+
+    def __init__(self, wakeup : threading.Event, n_processes : Union[None, int] = None):
+        check_main_process()
+        self.wakeup = wakeup
+        self.results = deque()
+        self.failed = deque() # (url, content, backend) of pages the workers failed on
+        self.in_flight = 0
+        self.broken = False
+        self._lock = threading.Lock()
+        method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() \
+            else "spawn"
+        self._executor = ProcessPoolExecutor(max_workers = n_processes,
+            mp_context = multiprocessing.get_context(method))
+
+    def submit(self, url : str, content : str, backend : str):
+        """Start searching the page for links. Returns immediately, unless the
+        workers failed to start (see above).
+
+        Parameters:
+        -------------
+        url : str
+            The original link of the page.
+        content : str
+            The page, decoded.
+        backend : str
+            The link extractor to use, see linkextract.
+        """
+        if not self.broken:
+            with self._lock:
+                self.in_flight += 1
+            try:
+                future = self._executor.submit(_parse, url, content, backend)
+            except (BrokenProcessPool, RuntimeError):
+                with self._lock:
+                    self.in_flight -= 1
+                self._broke()
+            else:
+                future.add_done_callback(lambda f: self._done(url, content, backend, f))
+                return
+        links = find_links(url, content, backend)
+        with self._lock:
+            self.results.append((url, links))
+        self.wakeup.set()
+
+    def _done(self, url, content, backend, future):
+        if future.cancelled(): # by close
+            return
+        try:
+            links = future.result()
+        except (BrokenProcessPool, RuntimeError):
+            self._broke()
+            links = None
+        except Exception: # pylint: disable=broad-exception-caught
+            logging(f"Failed to search {url} for links in another process. "
+                "Searching it here.", LOG_ERROR, where = "ParsePool")
+            links = None
+        with self._lock:
+            if links is None:
+                self.failed.append((url, content, backend))
+            else:
+                self.results.append((url, links))
+            self.in_flight -= 1
+        self.wakeup.set()
+
+    def _broke(self):
+        if not self.broken:
+            logging("The worker processes failed. Is the run started outside of "
+                "'if __name__ == \"__main__\":'? Searching pages for links in this "
+                "process from now on.", LOG_ERROR, where = "ParsePool")
+        self.broken = True
+
+    def collect(self) -> List[Tuple[str, List[str]]]:
+        """Returns the results that arrived since the last call as list of
+        (original_url, links). Does not block, except for searching the
+        pages the workers failed on."""
+        with self._lock:
+            ret = list(self.results)
+            self.results.clear()
+            failed = list(self.failed)
+            self.failed.clear()
+        return ret + [(url, find_links(url, content, backend))
+            for url, content, backend in failed]
+
+    def pending(self) -> int:
+        """Number of pages that were submitted but whose links were not yet collected."""
+        with self._lock:
+            return self.in_flight + len(self.results) + len(self.failed)
+
+    def close(self):
+        """Stop the worker processes. Pages not yet parsed are dropped."""
+        self._executor.shutdown(wait = True, cancel_futures = True)
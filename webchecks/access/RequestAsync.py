@@ -0,0 +1,90 @@
+"""Provides the RequestAsync class which sends requests without any realtime
+rendering of the result, like RequestNoJS, but keeps many of them in flight at once."""
+
+import atexit
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Tuple, List
+
+from webchecks.utils.Error import InputError
+from webchecks.utils.url import extract_domain
+from webchecks.utils.messaging import logging
+from webchecks.config import config, ASYNC_MAX_IN_FLIGHT, LOG_ERROR
+
+from .RequestNoJS import RequestNoJS
+
+
+class RequestAsync(RequestNoJS): # pragma: no cover
+    """Sessionmanager for concurrent NonJS requests.
+
+    Requests are handed over using submit and do not block the caller. An asyncio
+    event loop running in a background thread drives them, the blocking transfer
+    itself runs on a thread pool so that up to config[ASYNC_MAX_IN_FLIGHT] requests
+    are in flight at the same time. Finished responses are picked up using collect.
+
+    Note that this does not decide WHEN a request may be sent. The Gateway only
+    submits links that the queue releases, so the wait time of each profile still holds.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.results = deque()
+        self.results_ready = threading.Event()
+        self.in_flight = 0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers = config[ASYNC_MAX_IN_FLIGHT])
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target = self._loop.run_forever, daemon = True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def submit(self, linkpair):
+        """Start requesting a resource. Returns immediately, the result
+        will be available through collect once the response arrived.
+
+        Parameters:
+        ------------
+        linkpair : URLPair
+            A linkpair object containing the URL to request and the URL originally entered by the
+            user.
+        """
+        # profiles (and their archives) are only ever touched from the caller's thread
+        self._get_session(extract_domain(linkpair.url))
+        headers = self._conditional_headers(linkpair) # so is the project cache
+        with self._lock:
+            self.in_flight += 1
+        asyncio.run_coroutine_threadsafe(self._fetch(linkpair, headers), self._loop)
+
+    def collect(self) -> List[Tuple[bytes, dict, str]]:
+        """Returns the responses that arrived since the last call, as list of
+        (content, response_header, original_url). Does not block."""
+        with self._lock:
+            ret = list(self.results)
+            self.results.clear()
+            self.results_ready.clear()
+        return ret
+
+    def pending(self) -> int:
+        """Number of requests that were submitted but whose result was not yet collected."""
+        with self._lock:
+            return self.in_flight + len(self.results)
+
+    def close(self):
+        """Stop the event loop and the worker threads."""
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._executor.shutdown(wait = False)
+
+    async def _fetch(self, linkpair, headers : dict):
+        try:
+            res = await self._loop.run_in_executor(
+                self._executor, self.request_resource, linkpair, headers)
+        except (Exception, InputError): # pylint: disable=broad-exception-caught
+            logging(f"Unexpected failure requesting {linkpair.url}", LOG_ERROR,
+                where = "RequestAsync._fetch")
+            res = [(b"", {}, linkpair.original_url)]
+        with self._lock:
+            self.results.extend(res)
+            self.in_flight -= 1
+            self.results_ready.set()
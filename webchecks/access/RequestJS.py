@@ -4,23 +4,28 @@ rendering of the result, thus executing (and requesting) Javascript."""
 import re
 import time
 import atexit
-from typing import Tuple, Collection
+from typing import Tuple, Iterator, List, Union
+from urllib.parse import urlsplit
 from bs4 import BeautifulSoup
 
 
 from webchecks.config import * # pylint: disable=wildcard-import
 from webchecks.monitor.Report import Report
-from webchecks.utils.file_ops import refd_content_may_have_fileformat
-from webchecks.utils.messaging import logging, logging_push_where, logging_pop_where
-from webchecks.utils.url import remove_args_from_url
-from .security import is_allowed_url
+from webchecks.profiles.profileDB import fetch_profile
+from webchecks.profiles.ProfileConstants import RESOURCE_DOCUMENT, RESOURCE_STYLESHEET, \
+    RESOURCE_IMAGE, RESOURCE_FONT, RESOURCE_MEDIA, RESOURCES_ALL
+from webchecks.utils.file_ops import is_script_url, get_resource_type, resource_extensions
+from webchecks.utils.messaging import logging
+from webchecks.utils.url import extract_domain, \
+    extract_fully_qualified_domain_name
+from .security import is_allowed_url, JavascriptTrustTable
 
 try: # optional requirements .. here they go
     from seleniumwire import webdriver
     from seleniumwire.utils import decode as sw_decode
     from selenium.webdriver.firefox.service import Service as FirefoxService
     from selenium.webdriver.firefox.options import Options
-    from selenium.common.exceptions import TimeoutException
+    from selenium.common.exceptions import TimeoutException, WebDriverException
 except ImportError:
     print("Enabling JavaScript requires selenium and selenium-wire. Please install both \
 using 'pip3 install selenium, selenium-wire'.")
@@ -39,8 +44,10 @@ class RequestJS: # pragma: no cover
     def __init__(self):
         self.reporter = Report() # pylint: disable=no-value-for-parameter
         self._requests = []
-        self.js_checktable = {}
+        self.js_trust = None
         self.compiled_js = False
+        self.profile = None # of the page being loaded, for its resource policy
+        self._documents = [] # (url, response) of the pages loaded, see _resp_interceptor
 
         logging("Initiating Firefox...", LOG_INFO)
         if config[LOCATION_FIREFOX_DRIVER] != "":
@@ -49,10 +56,20 @@ class RequestJS: # pragma: no cover
             s = FirefoxService()
 
         options = Options()
+        if config[BROWSER_HEADLESS]:
+            options.add_argument("-headless")
         if config[PROFILE_FIREFOX_BROWSER] != "":
             options.add_argument("-profile")
             options.add_argument(config[PROFILE_FIREFOX_BROWSER])
-        self.driver = webdriver.Firefox(service=s, options=options)
+        # responses captured are kept until the next page, bound their number. The proxy
+        # only honours the bound if it keeps them in memory. It drops the oldest first,
+        # thus documents are kept apart (see _resp_interceptor).
+        sw_options = {}
+        if config[BROWSER_MAX_STORED_REQUESTS] is not None:
+            sw_options["request_storage"] = "memory"
+            sw_options["request_storage_max_size"] = config[BROWSER_MAX_STORED_REQUESTS]
+        self.driver = webdriver.Firefox(service=s, options=options,
+            seleniumwire_options=sw_options)
 
         self.driver.request_interceptor = self._requ_interceptor
         self.driver.response_interceptor = self._resp_interceptor
@@ -61,80 +78,173 @@ class RequestJS: # pragma: no cover
         if config[BROWSER_CLEAN_SHEET_SETUP]:
             self.driver.delete_all_cookies()
 
-        atexit.register(self.driver.close)
+        atexit.register(self.quit)
 
         ## Wait for startup to complete.
         time.sleep(1)
         logging("Firefox initialization complete.", LOG_INFO)
 
-    def request_resource(self, linkpair : URLPair) -> Collection[Tuple[bytes, dict, str]]:
-        """Request a resource.
+    def alive(self) -> bool:
+        """Whether the browser still responds. False e.g. if it crashed."""
+        try:
+            self.driver.current_url # pylint: disable=pointless-statement
+            return True
+        except WebDriverException:
+            return False
+
+    def quit(self):
+        """Close the browser."""
+        atexit.unregister(self.quit)
+        try:
+            self.driver.quit()
+        except WebDriverException:
+            pass # gone already
+
+    def request_resource(self, linkpair : URLPair,
+            profile = None) -> Iterator[Tuple[bytes, dict, str]]:
+        """Request a resource. Returns the responses captured while loading the page,
+        those of the resource types the profile captures (see
+        BaseProfile._set_captured_resources). They are decoded one at a time
+        as the result is iterated over, and released from the proxy afterwards.
+        The page itself is returned with the original url of the linkpair,
+        even if the browser was redirected, as does RequestNoJS.
 
         Parameters:
         -------------
         linkpair : URLPair
             The user supplied link and the link which has potentially added the https protocol.
+        profile : BaseProfile or None
+            The profile of the link. None means it is looked up, which must not happen
+            off the main thread (see RequestJSPool).
         """
         if not self.compiled_js:
             self._last_minute_js_table_compile()
         link = linkpair.url
-        logging_push_where("RequestJS.request_resource")
-        logging(f"About to access {link}", LOG_INFO)
+        # explicit location rather than the logging stack: RequestJSPool
+        # calls this from several threads at once.
+        where = "RequestJS.request_resource"
+        logging(f"About to access {link}", LOG_INFO, where = where)
         self.reporter.report(link)
+        if profile is None:
+            profile = fetch_profile(extract_fully_qualified_domain_name(link))
+        self.profile = profile
+        self.driver.scopes = self._scopes(profile)
         del self.driver.requests
+        self._documents = []
         try:
             self.driver.get(link)
         except TimeoutException:
-            logging(f"Timeout Exception accessing {link}", LOG_WARNING)
+            logging(f"Timeout Exception accessing {link}", LOG_WARNING, where = where)
         except:
-            logging(f"Seems link there is a connection issue for {link}", LOG_ERROR)
-            logging_pop_where()
-            return [(b"", {}, linkpair.original_url)]
+            logging(f"Seems link there is a connection issue for {link}", LOG_ERROR,
+                where = where)
+            return iter([(b"", {}, linkpair.original_url)])
 
         ## Primarily for Ubuntu systems using the snap version of Firefox
         ## weird selenium-wire bug loading but not showing requests
-        if len(self.driver.requests) == 0:
-            logging("No requests visible. Refresh...")
+        if self.driver.last_request is None:
+            logging("No requests visible. Refresh...", where = where)
             time.sleep(2)
             self.driver.refresh()
-            if len(self.driver.requests) == 0:
-                logging(f"Seems link there is a connection issue for {link}", LOG_ERROR)
-                return [(b"", {}, linkpair.original_url)]
-
-        ret = []
-        for req in self.driver.requests:
-            if req.response is None:
-                logging(f"Internal problem: Dubious request {req.url}")
-                continue
-
-            if req.response.status_code == 304:
-                # redirecting
-                pass # can do some logging later but that will do for now
-            elif req.response.status_code == 429:
-                logging(f"Exceeding ratelimit for {link} and corresponding domain.", LOG_ERROR)
-                # this means that the user has exceeded the rate that the
-                # server officially wants to allow...
-            elif req.response.status_code != 200:
-                logging(f"Request error {req.response.status_code} accessing {req.url}")
-                #ret.append((b"", {}, req.url))
-            else: # 200, yes
-                response = req.response
-                # https://stackoverflow.com/questions/67306915/selenium-wire-response-object-way-to-get-response-body-as-string-rather-than-b
-                res_entry = (
-                    sw_decode(
-                        req.response.body,
-                        req.response.headers.get('Content-Encoding', 'identity')
-                        ),
-                    response.headers,
-                    req.url
-                    )
-                ret.append(res_entry)
-        logging_pop_where()
-        return ret
+            if self.driver.last_request is None:
+                logging(f"Seems link there is a connection issue for {link}", LOG_ERROR,
+                    where = where)
+                return iter([(b"", {}, linkpair.original_url)])
+
+        return self._captured(linkpair, where)
+
+    def _captured(self, linkpair : URLPair,
+            where : str) -> Iterator[Tuple[bytes, dict, str]]:
+        """Yields the responses captured for the page, see request_resource."""
+        link = linkpair.url
+        captured = self.profile.get_captured_resources()
+        documents, self._documents = self._documents, []
+        try:
+            page = self._page_index(documents)
+            for i, (url, response) in enumerate(documents):
+                # the page under the url it was queued with, such that it is acknowledged
+                entry = self._entry(linkpair.original_url if i == page else url,
+                    response, link, where)
+                if entry is not None:
+                    yield entry
+            for req in self.driver.iter_requests():
+                if req.response is None:
+                    logging(f"Internal problem: Dubious request {req.url}", where = where)
+                    continue
+                kind = get_resource_type(req.url, req.headers.get("Sec-Fetch-Dest"))
+                if kind == RESOURCE_DOCUMENT or kind not in captured:
+                    continue # documents were yielded already
+                entry = self._entry(req.url, req.response, link, where)
+                if entry is not None:
+                    yield entry
+        finally:
+            del self.driver.requests # do not keep the bodies until the next page
+
+    def _scopes(self, profile) -> List[str]:
+        """Scopes of the proxy for pages of the profile: Requests out of scope are neither
+        stored nor seen by the interceptors. Thus only responses that are not captured
+        (see BaseProfile._set_captured_resources) and that the interceptors would let
+        through anyway are left out: Those from the host of the page, if it may run
+        Javascript and its resource policy allows everything, whose url says they are
+        stylesheets, images, fonts or media that are not captured. Others, e.g. data
+        fetched by scripts, cannot be told apart by their url. Those left out are not
+        reported. _captured still filters what is stored, e.g. resources from other hosts.
+        """
+        resources, _ = profile.get_resource_policy()
+        if resources != RESOURCES_ALL or not self._allow_running_js(
+                f"https://{profile.get_domain()}/"):
+            return []
+        skipped = resource_extensions(frozenset((RESOURCE_STYLESHEET, RESOURCE_IMAGE,
+            RESOURCE_FONT, RESOURCE_MEDIA)) - profile.get_captured_resources())
+        if not skipped:
+            return []
+        host = re.escape(profile.get_domain())
+        extensions = "|".join(re.escape(ext[1:]) for ext in skipped)
+        return [rf"(?i)^(?!https?://{host}(:\d+)?/[^?#]*\.({extensions})([?#]|$))"]
+
+    def _page_index(self, documents) -> Union[None, int]:
+        """Index of the page requested among the documents loaded (frames and redirects
+        are documents too): The first that succeeded at the url the browser shows.
+        None if no document succeeded."""
+        shown = self.driver.current_url.partition("#")[0]
+        succeeded = [i for i, (_, response) in enumerate(documents)
+            if response.status_code == 200]
+        for i in succeeded:
+            if documents[i][0].partition("#")[0] == shown:
+                return i
+        return succeeded[0] if succeeded else None
+
+    def _entry(self, url : str, response, link : str,
+            where : str) -> Union[None, Tuple[bytes, dict, str]]:
+        """(content, response_header, url) of a captured response, None unless it succeeded."""
+        if response.status_code == 304:
+            # redirecting
+            pass # can do some logging later but that will do for now
+        elif response.status_code == 429:
+            logging(f"Exceeding ratelimit for {link} and corresponding domain.",
+                LOG_ERROR, where = where)
+            # this means that the user has exceeded the rate that the
+            # server officially wants to allow...
+        elif response.status_code != 200:
+            logging(f"Request error {response.status_code} accessing {url}", where = where)
+        else: # 200, yes
+            # https://stackoverflow.com/questions/67306915/selenium-wire-response-object-way-to-get-response-body-as-string-rather-than-b
+            return (
+                sw_decode(
+                    response.body,
+                    response.headers.get('Content-Encoding', 'identity')
+                    ),
+                response.headers,
+                url
+                )
+        return None
 
     def _requ_interceptor(self, request):
 
         url = request.url
+        if self._blocked_resource(request):
+            request.abort()
+            return
         # if url fetches from bad source, it will abort no matter what
         # if not is_allowed_url(url):
         #     #request.url = ""
@@ -145,9 +255,7 @@ class RequestJS: # pragma: no cover
         ## if it is a JS from source that is JS-blacklisted,
         ## it will not even request it
 
-        a = refd_content_may_have_fileformat(url, "js")
-        b = refd_content_may_have_fileformat(remove_args_from_url(url), "js")
-        if a or b:
+        if is_script_url(url):
             ## note may have false negative: so content that is javascript
             ## but does not have .js ending may not be checked. Will be detected later
             if not self._allow_running_js(url):
@@ -156,6 +264,27 @@ class RequestJS: # pragma: no cover
                 return
         
 
+    def _blocked_resource(self, request) -> bool:
+        """Whether the resource policy of the profile of the page being loaded
+        (see BaseProfile._set_resource_policy) rules out the request."""
+        profile = self.profile
+        if profile is None:
+            return False
+        resources, first_party_only = profile.get_resource_policy()
+        kind = get_resource_type(request.url, request.headers.get("Sec-Fetch-Dest"))
+        if kind == RESOURCE_DOCUMENT:
+            return False
+        if kind not in resources:
+            return True
+        if not first_party_only:
+            return False
+        # not extract_domain: the url may have a port or an ip address as host
+        try:
+            host = urlsplit(request.url).hostname or ""
+        except ValueError: # malformed, thus not first party
+            return True
+        return host.split(".")[-2:] != extract_domain(profile.get_domain()).split(".")
+
     def _resp_interceptor(self, request, response):
         ## just making sure that even if there is a request that slipped
         ## through the request_interceptor by concealing the file type using
@@ -164,6 +293,9 @@ class RequestJS: # pragma: no cover
         if response.headers is None:
             logging(f"NONE HEADERS {request.url}")
             return
+        if get_resource_type(url, request.headers.get("Sec-Fetch-Dest")) == RESOURCE_DOCUMENT:
+            # kept apart from the storage of the proxy, which may drop it on a busy page
+            self._documents.append((url, response))
         # if not is_allowed_url(url):
         #     response.headers["content-length"] = 0
         #     response.headers.set_payload(b"")
@@ -172,9 +304,7 @@ class RequestJS: # pragma: no cover
 
         if response.headers["content-type"] is None:
             logging(f"No content type {request.url}")
-            a = refd_content_may_have_fileformat(url, "js")
-            b = refd_content_may_have_fileformat(remove_args_from_url(url), "js")
-            if a or b:
+            if is_script_url(url):
             ## note may have false negative: so content that is javascript
             ## but does not have .js ending may not be checked. Will be detected later
                 if not self._allow_running_js(url):
@@ -219,15 +349,7 @@ class RequestJS: # pragma: no cover
     def _last_minute_js_table_compile(self):
         """Compile the js allowed table right before the run."""
         self.compiled_js = True
-        for (key, is_trusted) in javascript_checklist.items():
-            if key == "*":
-                continue
-            k = r"(.*\.)*" + key
-            self.js_checktable[re.compile(k)] = is_trusted
+        self.js_trust = JavascriptTrustTable(javascript_checklist)
 
     def _allow_running_js(self, url):
-
-        for (key, is_trusted) in self.js_checktable.items():
-            if re.search(key, url):
-                return is_trusted == TRUSTED
-        return javascript_checklist["*"] == TRUSTED
+        return self.js_trust.allows(url)
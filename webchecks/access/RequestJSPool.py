@@ -0,0 +1,142 @@
+"""Provides the RequestJSPool class which renders several pages at once, each in its
+own browser."""
+
+import queue
+import atexit
+import threading
+from collections import deque
+from typing import Collection, List, Tuple
+
+from webchecks.profiles.profileDB import fetch_profile
+from webchecks.utils.Error import InputError, OptionsError
+from webchecks.utils.url import extract_fully_qualified_domain_name
+from webchecks.utils.messaging import logging
+from webchecks.config import config, PROFILE_FIREFOX_BROWSER, LOG_ERROR, LOG_WARNING
+
+from .RequestJS import RequestJS
+
+
+class RequestJSPool: # pragma: no cover
+    """Sessionmanager for concurrent requests where JS is enabled.
+
+    A number of workers, each one a thread driving its own browser (RequestJS, with its
+    own interceptors), take the submitted links as they become free. Like RequestAsync,
+    requests are handed over using submit and the responses are picked up using collect.
+    The Gateway only submits links that the queue releases, so pages of different domains
+    render at the same time while the wait time of each profile still holds.
+
+    A browser that stops responding is replaced by a new one. Browsers are started
+    when first needed. Profiles are looked up by the caller rather than the workers,
+    as the profile database is not thread safe.
+
+    Unlike RequestJS.request_resource, whose responses are decoded one at a time, a
+    worker decodes all responses captured for a page before handing them over. Thus they
+    are held in memory together, limit them using BaseProfile._set_captured_resources.
+
+    Parameters:
+    -------------
+    size : int
+        Number of browsers.
+    """
+
+    def __init__(self, size : int):
+        if size > 1 and config[PROFILE_FIREFOX_BROWSER] != "":
+            logging("Firefox locks its profile, a browser pool should not use one.",
+                LOG_WARNING)
+        self.results = deque()
+        self.results_ready = threading.Event()
+        self.in_flight = 0
+        self._lock = threading.Lock()
+        self._tasks = queue.Queue()
+        self._workers = [threading.Thread(target = self._work, args = (i,), daemon = True)
+            for i in range(size)]
+        for worker in self._workers:
+            worker.start()
+        atexit.register(self.close)
+
+    def submit(self, linkpair):
+        """Start requesting a resource. Returns immediately, the result
+        will be available through collect once the page was rendered.
+
+        Parameters:
+        ------------
+        linkpair : URLPair
+            A linkpair object containing the URL to request and the URL originally entered by the
+            user.
+        """
+        profile = self._profile(linkpair)
+        with self._lock:
+            self.in_flight += 1
+        self._tasks.put((linkpair, profile, self._done))
+
+    def _done(self, res : List[Tuple[bytes, dict, str]]):
+        with self._lock:
+            self.results.extend(res)
+            self.in_flight -= 1
+            self.results_ready.set()
+
+    def request_resource(self, linkpair) -> Collection[Tuple[bytes, dict, str]]:
+        """Request a resource and wait for the result, see RequestJS.request_resource.
+
+        Parameters:
+        ------------
+        linkpair : URLPair
+            A linkpair object containing the URL to request and the URL originally entered by the
+            user.
+        """
+        finished = threading.Event()
+        ret = []
+        def done(res):
+            ret.extend(res)
+            finished.set()
+        self._tasks.put((linkpair, self._profile(linkpair), done))
+        finished.wait()
+        return ret
+
+    def _profile(self, linkpair):
+        """The profile of the link, looked up in the caller's thread."""
+        return fetch_profile(extract_fully_qualified_domain_name(linkpair.url))
+
+    def collect(self) -> List[Tuple[bytes, dict, str]]:
+        """Returns the responses that arrived since the last call, as list of
+        (content, response_header, original_url). Does not block."""
+        with self._lock:
+            ret = list(self.results)
+            self.results.clear()
+            self.results_ready.clear()
+        return ret
+
+    def pending(self) -> int:
+        """Number of requests that were submitted but whose result was not yet collected."""
+        with self._lock:
+            return self.in_flight + len(self.results)
+
+    def close(self):
+        """Stop the workers and close the browsers once they finished the current page."""
+        for _ in self._workers:
+            self._tasks.put(None)
+
+    def _work(self, index : int):
+        """Main loop of a worker."""
+        where = f"RequestJSPool.worker{index}"
+        browser = None
+        while True:
+            task = self._tasks.get()
+            if task is None:
+                break
+            linkpair, profile, done = task
+            res = [(b"", {}, linkpair.original_url)]
+            try:
+                if browser is None:
+                    browser = RequestJS()
+                res = list(browser.request_resource(linkpair, profile)) # decoded in this thread
+            except (Exception, InputError, OptionsError): # pylint: disable=broad-exception-caught
+                logging(f"Browser failed rendering {linkpair.url}", LOG_ERROR, where = where)
+            finally:
+                done(res)
+            if browser is not None and not browser.alive():
+                logging("Browser stopped responding. Restarting it.", LOG_ERROR, where = where)
+                browser.quit()
+                browser = None
+        if browser is not None:
+            browser.quit()
@@ -1,18 +1,21 @@
 """Provides the RequestNoJS class which sends requests without any realtime
 rendering of the result, thus not executing (or even requesting) Javascript."""
 
-from typing import Tuple, Collection
+from typing import Tuple, Collection, Union
 
 import requests
 
 from webchecks.profiles.profileDB import fetch_profile
 from webchecks.monitor.Report import Report
-from webchecks.utils.url import extract_domain
-from webchecks.utils.messaging import logging, logging_push_where, logging_pop_where
-
-from webchecks.config import config, DEFAULT_TIMEOUT_IN_SEC, LOG_ERROR, LOG_INFO
+from webchecks.archive.GlobalCache import GlobalCache
+from webchecks.utils.url import extract_domain, strong_strip_query_from_url
+from webchecks.utils.messaging import logging
 
+from webchecks.config import config, DEFAULT_TIMEOUT_IN_SEC, LOG_ERROR, LOG_INFO, \
+    CONDITIONAL_REQUESTS
 
+# added to the response header of a 304: the content stored earlier is still valid
+NOT_MODIFIED_HEADER = "x-webchecks-not-modified"
 
 
 class RequestNoJS: # pragma: no cover
@@ -33,38 +36,72 @@ class RequestNoJS: # pragma: no cover
             self.sessions[domain] = s
             return s
 
-    def request_resource(self, linkpair) -> Collection[Tuple[bytes, dict, str]]:
+    def _conditional_headers(self, linkpair) -> dict:
+        """Headers asking the server to send the content only if it changed since it was
+        stored, using the validators of its response back then. Empty unless
+        config[CONDITIONAL_REQUESTS]. Uses the project cache, so call it from the main thread."""
+        if not config[CONDITIONAL_REQUESTS]:
+            return {}
+        cache = GlobalCache()
+        validators = cache.get_validators(linkpair.original_url)
+        if validators is None or \
+                cache.get_link_location(strong_strip_query_from_url(linkpair.original_url)) is None:
+            return {}
+        etag, last_modified = validators
+        headers = {}
+        if etag is not None:
+            headers["If-None-Match"] = etag
+        if last_modified is not None:
+            headers["If-Modified-Since"] = last_modified
+        return headers
+
+    def request_resource(self, linkpair,
+            headers : Union[None, dict] = None) -> Collection[Tuple[bytes, dict, str]]:
         """Request a resource. Returns a list containing the 
         response content in bytes, the response header and the original URL provided by the user.
 
+        If the server answers that the content stored earlier did not change (304), the
+        content is empty and the header contains NOT_MODIFIED_HEADER.
+
         Parameters:
         ------------
         linkpair : URLPair
             A linkpair object containing the URL to request and the URL originally entered by the 
             user. Remember they may be different as the Gateway may have needed to add the protocol.
+        headers : dict or None
+            Additional request headers. None means the conditional headers, if enabled.
         """
         link = linkpair.url
         domain = extract_domain(link)
         session = self._get_session(domain)
-        logging_push_where("RequestNoJS.request_resource")
-        logging(f"About to access {link}", LOG_INFO)
+        if headers is None:
+            headers = self._conditional_headers(linkpair)
+        # explicit location rather than the logging stack: RequestAsync
+        # calls this from several threads at once.
+        where = "RequestNoJS.request_resource"
+        logging(f"About to access {link}", LOG_INFO, where = where)
         #log_link(link)
         self.reporter.report(link)
         try:
             if config[DEFAULT_TIMEOUT_IN_SEC] > 0:
-                response = session.get(link, timeout = config[DEFAULT_TIMEOUT_IN_SEC])
+                response = session.get(link, headers = headers,
+                    timeout = config[DEFAULT_TIMEOUT_IN_SEC])
             else:
-                response = session.get(link)
+                response = session.get(link, headers = headers)
             #logging(f"{response.request.headers}")
         except:
-            logging(f"Seems link there is a connection issue for {link}", LOG_ERROR)
-            logging_pop_where()
+            logging(f"Seems link there is a connection issue for {link}", LOG_ERROR,
+                where = where)
             return [(b"", {}, linkpair.original_url)]
 
+        if response.status_code == 304: # only sent if asked for, see _conditional_headers
+            logging(f"Not modified: {link}", LOG_INFO, where = where)
+            response.headers[NOT_MODIFIED_HEADER] = "1"
+            return [(b"", response.headers, linkpair.original_url)]
+
         if response.status_code//100 != 2: # status not 20x
-            logging(f"Request error {response.status_code} accessing {link}", LOG_INFO)
-            logging_pop_where()
+            logging(f"Request error {response.status_code} accessing {link}", LOG_INFO,
+                where = where)
             return [(b"", {}, linkpair.original_url)]
 
-        logging_pop_where()
         return [(response.content, response.headers, linkpair.original_url)]
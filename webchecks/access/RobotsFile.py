@@ -1,25 +1,37 @@
 """Provides the RobotsFile class which manages robots.txt files for any domain required."""
 
 import os
-import re
-from functools import partial
-from typing import List, Callable
+import time
+from typing import Union
+from collections import OrderedDict
 
 from webchecks.archive.GlobalCache import GlobalCache, DURATION_DAY
-from webchecks.utils.url import extract_local_path_without_args, extract_fully_qualified_domain_name
+from webchecks.utils.url import extract_local_path_without_args, parse_url
 from webchecks.config import config, UNGUIDED_ACCESS_POLICY, LOG_ERROR, AGENT_NAME, LOG_INFO
 from webchecks.utils.messaging import logging
 
+from .RobotsRules import RobotsRules
+
+
+
+# how long to wait before trying again if the robots.txt file could not be fetched
+RETRY_AFTER_FAILURE = 60 * 10
+# number of (domain, path) pairs whose verdict is remembered
+VERDICT_CACHE_SIZE = 1 << 12
 
 
 class RobotsFile:
     """Class that manages Robots.txt file. Provides the check_robots_txt method
-    that allows to check if a given link is allowed to be accessed by the policy."""
+    that allows to check if a given link is allowed to be accessed by the policy.
+
+    The rules of each domain are kept in memory until the robots.txt file expires,
+    only then the project cache (GlobalCache) is consulted or the file is fetched again.
+    Verdicts for recently checked paths are remembered too."""
 
     def __init__(self):
         self.globalcache = GlobalCache() # this is a singleton
-        self.robots_txt_hashes = {}
-        self.rules = {}
+        self.rules = {} # domain -> (RobotsRules or None if not available, valid until timestamp)
+        self.verdicts = OrderedDict() # (domain, path) -> (RobotsRules, verdict)
 
     def check_robots_txt(self, link : str, gateway) -> bool:
         """For a given link, return whether it is allowed.
@@ -30,43 +42,62 @@ class RobotsFile:
             The URL in question.
         gateway : 
             The gateway to potentially request accessing the robots.txt file. 
-            The latter will be cached for a week."""
-        domain = extract_fully_qualified_domain_name(link)
-        path = extract_local_path_without_args(link)
+            The latter will be cached for a day."""
+        parsed = parse_url(link)
+        domain = parsed.fqdn
+        path = parsed.path
 
         if path == "/robots.txt": # allowed by tautological requirement
             return True
 
-        # okay so we need to get the robots.txt file...
-        filehash = self.globalcache.get_hash(domain, "robots.txt")
-        recent_hash = self._get_hash(domain)
-        if filehash == recent_hash: ## okay is still up to date
-            return self.check_rules(self.rules[domain], path)
-        if recent_hash == b"" and filehash is not None: # hash not None means okay still up to date
-            logging(f"Successfully loaded cached robots.txt for domain {domain}.", LOG_INFO)
-            self.robots_txt_hashes[domain] = filehash
-            self.rules[domain] = self.parse_robotstxt(
-                self.globalcache.load(domain, "robots.txt")[0]
-                )
-            return self.check_rules(self.rules[domain], path)
-
-        # else the content is out of date.
-        content, filehash = self._get_file(domain, gateway)
-        self.robots_txt_hashes[domain] = filehash
-        if content in ("", b""):
-            logging(f"Failed to fetch robots.txt: {domain}. "
-                "Applying unguided_access_policy.", LOG_ERROR)
+        rules = self._get_rules(domain, gateway)
+        if rules is None:
             return config[UNGUIDED_ACCESS_POLICY] == "free"
-        self.rules[domain] = self.parse_robotstxt(content)
-        return self.check_rules(self.rules[domain], path)
 
-    def _get_hash(self, domain):
+        key = (domain, path)
+        try:
+            cached_rules, verdict = self.verdicts[key]
+            if cached_rules is rules: # else the robots.txt file was refreshed since
+                self.verdicts.move_to_end(key)
+                return verdict
+        except KeyError:
+            pass
+        verdict = self.check_rules(rules, path)
+        self.verdicts[key] = (rules, verdict)
+        if len(self.verdicts) > VERDICT_CACHE_SIZE:
+            self.verdicts.popitem(last = False)
+        return verdict
+
+    def _get_rules(self, domain : str, gateway) -> Union[None, RobotsRules]:
+        """Rules for the domain, from memory if they are still up to date.
+        None if the robots.txt file could not be fetched."""
         try:
-            return self.robots_txt_hashes[domain]
+            rules, expiry = self.rules[domain]
+            if time.time() < expiry:
+                return rules
         except KeyError:
-            self.robots_txt_hashes[domain] = b''
-            return b''
+            pass
+
+        # not in memory or out of date: the project cache may have a more recent copy
+        expiry = self.globalcache.get_expiry(domain, "robots.txt")
+        if expiry is not None:
+            content = self.globalcache.load(domain, "robots.txt")[0]
+            if content is not None:
+                logging(f"Successfully loaded cached robots.txt for domain {domain}.", LOG_INFO)
+                rules = self.parse_robotstxt(content)
+                self.rules[domain] = (rules, expiry)
+                return rules
 
+        # else the content is out of date.
+        content, _ = self._get_file(domain, gateway)
+        if content in ("", b""):
+            logging(f"Failed to fetch robots.txt: {domain}. "
+                "Applying unguided_access_policy.", LOG_ERROR)
+            self.rules[domain] = (None, time.time() + RETRY_AFTER_FAILURE)
+            return None
+        rules = self.parse_robotstxt(content)
+        self.rules[domain] = (rules, time.time() + DURATION_DAY)
+        return rules
 
     def _get_file(self, domain : str, gateway):
         robolink = os.path.join(domain, "robots.txt")
@@ -76,9 +107,9 @@ class RobotsFile:
         filehash = self.globalcache.store(domain, content, "robots.txt", DURATION_DAY)
         return (content, filehash)
 
-    def parse_robotstxt(self, content : str) -> List[Callable[str, bool]]:
-        """Parse the robots.txt file. Returns a list of functions that take some
-        URL and return True of False. Use check_rules to use effectively.
+    def parse_robotstxt(self, content : str) -> RobotsRules:
+        """Parse the robots.txt file. Returns the compiled rules that apply
+        to this agent. Use check_rules to use effectively.
 
         Parameters:
         -------------
@@ -88,7 +119,7 @@ class RobotsFile:
 
         file = content.split("\n")
         agent = None
-        rules = []
+        rules = RobotsRules()
 
         for line in file:
             line = line.strip() # remove leading and trailing whitespace
@@ -100,48 +131,36 @@ class RobotsFile:
             if "#" in line:
                 line = line.split("#")[0]
 
-            if line.startswith("User-agent:"): # agent declaration
-                agent = line.split(":")[1].strip()
+            if ":" not in line:
+                continue
+            field, value = line.split(":", 1)
+            field = field.lower()
+
+            if field == "user-agent": # agent declaration
+                agent = value
+                continue
+
+            if agent not in ("*", config[AGENT_NAME]):
                 continue
 
             # relevant allow clause
-            if agent in ("*", config[AGENT_NAME]) and line.startswith("Allow:"):
-                rl = line.split(":")[1].strip()
-                if rl == "":
-                    continue
-                rl = rl.replace("*", "(.*)") # get it into re form
-                if rl.endswith("/"): # implicit wildcard made explicit
-                    rl = rl + ".*"
-                def check(s, rule):
-                    if re.match(rule, s):
-                        return True, "!"
-                    return True, ""
-                rules.append(partial(check, rule = re.compile(rl)))
+            if field == "allow":
+                rules.add_rule(value, True)
 
             # relevant disallow clause
-            if agent in ("*", config[AGENT_NAME]) and line.startswith("Disallow:"):
-                rl = line.split(":")[1].strip()
-                if rl == "":
-                    continue
-                rl = rl.replace("*", "(.*)")
-                if rl.endswith("/"):
-                    rl = rl + ".*"
-                def check(s, rule):
-                    if re.match(rule, s):
-                        return False, "!"
-                    return True, ""
-                rules.append(partial(check, rule = re.compile(rl)))
+            if field == "disallow":
+                rules.add_rule(value, False)
 
         return rules
 
-    def check_rules(self, rules : List[Callable[str, bool]], link : str,
+    def check_rules(self, rules : RobotsRules, link : str,
             is_full_url : bool = False) -> bool:
         """Check if the robots.txt rules allow a URL given
         the return from parse_robots_txt.
 
         Parameters:
         -------------
-        rules : List of functions
+        rules : RobotsRules
             The output from the parsing run.
         link : str
             The url in question.
@@ -151,10 +170,4 @@ class RobotsFile:
 
         if is_full_url:
             link = extract_local_path_without_args(link)
-        res = True
-        for rule in rules:
-            l = rule(link)
-            res &= l[0]
-            if l[1] == "!":
-                res = l[0]
-        return res
+        return rules.allows(link)
@@ -0,0 +1,116 @@
+"""Provides the RobotsRules class, the compiled form of the rules in a robots.txt file."""
+
+import re
+from typing import Tuple
+
+_VERDICT = None # key under which a trie node stores the verdict of the rule ending there
+
+
+class RobotsRules:
+    """Allow and Disallow rules of a robots.txt file, compiled for fast lookups.
+
+    Decides like RFC 9309: Of all rules matching a path, the longest one wins and
+    if an Allow and a Disallow rule are equally long, Allow wins. No matching rule
+    means the path is allowed.
+
+    Plain rules are stored in a prefix trie that is walked once along the path. Rules
+    with wildcards ('*' or a trailing '$') are merged into one regular expression whose
+    alternatives are ordered such that the first one that matches is the longest one.
+    Either way, the cost depends on the length of the path, not the number of rules.
+    """
+
+    def __init__(self):
+        self.trie = {}
+        self.wildcard_rules = [] # (length, allow, pattern)
+        self._wildcard = None
+        self._wildcard_verdicts = []
+
+    def __len__(self):
+        return self._count(self.trie) + len(self.wildcard_rules)
+
+    def add_rule(self, pattern : str, allow : bool):
+        """Add an Allow (allow is True) or Disallow rule.
+
+        Parameters:
+        -------------
+        pattern : str
+            The path pattern of the rule as written in the robots.txt file.
+        allow : bool
+            Whether it is an Allow rule.
+        """
+        if pattern == "":
+            return # an empty rule has no effect
+        if "*" in pattern or pattern.endswith("$"):
+            self.wildcard_rules.append((len(pattern), allow, pattern))
+            self._wildcard = None
+            return
+
+        node = self.trie
+        for ch in pattern:
+            try:
+                node = node[ch]
+            except KeyError:
+                node[ch] = {}
+                node = node[ch]
+        node[_VERDICT] = node.get(_VERDICT, False) or allow
+
+    def allows(self, path : str) -> bool:
+        """Returns whether the rules allow accessing the given path.
+
+        Parameters:
+        -------------
+        path : str
+            The local path, starting with '/'.
+        """
+        if path == "":
+            path = "/"
+
+        best_length, best_allow = 0, True
+        node = self.trie
+        depth = 0
+        for ch in path:
+            node = node.get(ch)
+            if node is None:
+                break
+            depth += 1
+            verdict = node.get(_VERDICT)
+            if verdict is not None:
+                best_length, best_allow = depth, verdict
+
+        if self.wildcard_rules:
+            length, allow = self._match_wildcard(path)
+            if length > best_length or (length == best_length and allow):
+                best_allow = allow
+        return best_allow
+
+    def _match_wildcard(self, path : str) -> Tuple[int, bool]:
+        """Length and verdict of the longest matching wildcard rule. (0, True) if none matches."""
+        if self._wildcard is None:
+            self._compile_wildcard()
+        m = self._wildcard.match(path)
+        if m is None:
+            return 0, True
+        return self._wildcard_verdicts[m.lastindex - 1]
+
+    def _compile_wildcard(self):
+        # longest first, on equal length Allow first. re tries the alternatives in order.
+        rules = sorted(self.wildcard_rules, key = lambda r: (-r[0], not r[1]))
+        self._wildcard = re.compile("|".join(f"({self._to_regex(r[2])})" for r in rules))
+        self._wildcard_verdicts = [(r[0], r[1]) for r in rules]
+
+    @staticmethod
+    def _to_regex(pattern : str) -> str:
+        anchored = pattern.endswith("$")
+        if anchored:
+            pattern = pattern[:-1]
+        regex = ".*".join(re.escape(part) for part in pattern.split("*"))
+        if anchored:
+            regex += r"\Z"
+        return regex
+
+    def _count(self, node : dict) -> int:
+        n = 1 if _VERDICT in node else 0
+        for (key, child) in node.items():
+            if key is not _VERDICT:
+                n += self._count(child)
+        return n
@@ -2,10 +2,11 @@
 
 
 import re
-from urllib.parse import unquote
+from functools import lru_cache
+from typing import Callable, Collection, Union
+from urllib.parse import unquote, urlsplit
 
-from webchecks.utils.url import is_legal_domain, is_legal_tld, extract_local_path_and_args, \
-    is_url, extract_domain
+from webchecks.utils.url import extract_local_path_and_args, parse_url
 from webchecks.utils.check import input_check
 from webchecks.config import * # pylint: disable=wildcard-import
 
@@ -13,6 +14,9 @@ from webchecks.config import * # pylint: disable=wildcard-import
 
 SUBLINK = re.compile(r"(([a-z]*)://)?(([a-zA-Z0-9\-]+\.)*)([a-zA-Z0-9\-]+)\.([a-z]+)(/.*)?")
 
+# number of distinct hosts whose verdict is remembered
+HOST_CACHE_SIZE = 1 << 14
+
 
 def is_allowed_url(url : str) -> bool:
     """For a given url returns whether it is in the allowed_domains set/tuple/list.
@@ -42,42 +46,169 @@ def is_allowed_url(url : str) -> bool:
         If not None but a URL, then only URLs that have the 
         same domain are allowed.
     """
+    return get_policy().is_allowed_url(url)
+
+
+class SecurityPolicy:
+    """The security policy from config, compiled. Each list of patterns is merged into a
+    single regular expression and the verdict for a host is cached, only the check for
+    generic redirects depends on the rest of the URL and is done for every URL.
+
+    Do not create it yourself, use get_policy. See is_allowed_url for the settings used."""
+
+    def __init__(self):
+        single_domain_only = config[SINGLE_DOMAIN_ONLY]
+        self.single_domain = None
+        if single_domain_only:
+            input_check(isinstance(single_domain_only, str),
+            # and is_url(single_domain_only), allows re
+            "security.py: Restricting to single domain requires single_domain_only to be "
+            "the corresponding URL of that allowed domain.")
+            self.single_domain = _compile_patterns((single_domain_only,))
+
+        ## TODO allow only explicitly allowed fileextensions
+        self.whitelisted_domains = _compile_patterns(config[WHITELIST_DOMAINS]) \
+            if config[WHITELISTED_DOMAINS_ONLY] else None
+        self.whitelisted_tld = _compile_patterns(config[WHITELIST_TLD]) \
+            if config[WHITELISTED_TLD_ONLY] else None
+        self.blindly_trusted_tld = _compile_patterns(config[BLINDLY_TRUSTED_TLD]) \
+            if config[ENABLE_BLINDLY_TRUSTED_TLD] else None
+        self.blacklisted_tld = _compile_patterns(config[BLACKLISTED_TLD])
+        self.allow_redirect = config[ALLOW_REDIRECT]
+        self.host_verdict = lru_cache(maxsize = HOST_CACHE_SIZE)(self._host_verdict)
+
+    def is_allowed_url(self, url : str) -> bool:
+        """For a given url returns whether the policy allows it. See is_allowed_url.
+
+        Parameters:
+        -------------
+        url: str
+            The URL to be checked.
+        """
+        parsed = parse_url(url)
+        verdict = self.host_verdict(parsed.fqdn, parsed.tld)
+        if verdict is not None:
+            return verdict
+        ## prevent generic redirects. These may be created by any webuser using a comment functionality
+        return not is_generic_redirect(url)
+
+    def _host_verdict(self, fqdn : str, tld : str) -> Union[None, bool]:
+        """Verdict for all URLs of that host. None if it depends on the generic redirect check."""
+        ## avoid explicitly forbidden tlds
+        if self.blacklisted_tld(tld):
+            return False
+        ## blindly trusted tlds
+        if self.blindly_trusted_tld is not None and self.blindly_trusted_tld(tld):
+            return True
 
-    whitelisted_domains_only = config[WHITELISTED_DOMAINS_ONLY]
-    whitelisted_tld_only = config[WHITELISTED_TLD_ONLY]
-    enable_blindly_trusted_tld = config[ENABLE_BLINDLY_TRUSTED_TLD]
-    single_domain_only = config[SINGLE_DOMAIN_ONLY]
-    allow_redirect = config[ALLOW_REDIRECT]
-
-    res = True
-
-    if single_domain_only:
-        input_check(isinstance(single_domain_only, str),
-        # and is_url(single_domain_only), allows re
-        "security.py: Restricting to single domain requires single_domain_only to be "
-        "the corresponding URL of that allowed domain.")
-        res = is_legal_domain(url, (single_domain_only,))
-        # extract_domain(single_domain_only) == extract_domain(url)
-
-    ## TODO allow only explicitly allowed fileextensions
-
-    ## allow only explicitly allowed websites
-    if whitelisted_domains_only:
-        res &= is_legal_domain(url, config[WHITELIST_DOMAINS])
-
-    ## allow only explicitly allowed TLDs
-    if whitelisted_tld_only:
-        res &=  is_legal_tld(url, config[WHITELIST_TLD])
-    ## prevent generic redirects. These may be created by any webuser using a comment functionality
-    if not allow_redirect:
-        res &= not is_generic_redirect(url)
-    ## blindly trusted tlds
-    if enable_blindly_trusted_tld and is_legal_tld(url, config[BLINDLY_TRUSTED_TLD]):
         res = True
-    ## avoid explicitly forbidden tlds
-    if is_legal_tld(url, config[BLACKLISTED_TLD]):
-        res = False
-    return res
+        if self.single_domain is not None:
+            res = self.single_domain(fqdn)
+        ## allow only explicitly allowed websites
+        if self.whitelisted_domains is not None:
+            res &= self.whitelisted_domains(fqdn)
+        ## allow only explicitly allowed TLDs
+        if self.whitelisted_tld is not None:
+            res &= self.whitelisted_tld(tld)
+
+        if not res:
+            return False
+        if self.allow_redirect:
+            return True
+        return None
+
+
+_BACKREFERENCE = re.compile(r"\\[1-9]|\(\?P=")
+
+def _compile_patterns(patterns : Collection[str]) -> Callable[[str], bool]:
+    """Returns a function telling whether any of the patterns matches (re.match) a string."""
+    patterns = tuple(patterns)
+    if len(patterns) == 0:
+        return lambda s: False
+    # numbered backreferences would point to the wrong group once merged
+    if not any(_BACKREFERENCE.search(p) for p in patterns):
+        try:
+            merged = re.compile("|".join(f"(?:{p})" for p in patterns))
+            return lambda s: merged.match(s) is not None
+        except re.error: # e.g. inline flags, these need to stay separate
+            pass
+    compiled = [re.compile(p) for p in patterns]
+    return lambda s: any(c.match(s) for c in compiled)
+
+
+class JavascriptTrustTable:
+    """javascript_checklist compiled into a trie over the labels of host names, from the
+    top level domain down. The most specific entry for a host decides: With 'site.com'
+    untrusted and 'cdn.site.com' trusted, 'a.cdn.site.com' is trusted while
+    'www.site.com' is not. Hosts without an entry get the verdict of '*'.
+    The verdict for a host is cached.
+
+    Parameters:
+    -------------
+    checklist: dict
+        Domain -> TRUSTED or UNTRUSTED, like javascript_checklist.
+    """
+
+    _VERDICT = None # key of the verdict in a trie node, labels are strings
+
+    def __init__(self, checklist : dict):
+        self.default = checklist.get("*", TRUSTED) == TRUSTED
+        self.root = {}
+        for domain, trust in checklist.items():
+            if domain == "*":
+                continue
+            node = self.root
+            for label in reversed(domain.lower().strip(".").split(".")):
+                node = node.setdefault(label, {})
+            node[self._VERDICT] = trust == TRUSTED
+        self.host_verdict = lru_cache(maxsize = HOST_CACHE_SIZE)(self._host_verdict)
+
+    def allows(self, url : str) -> bool:
+        """Whether Javascript from that url may run.
+
+        Parameters:
+        -------------
+        url: str
+            The URL of the script.
+        """
+        try:
+            host = urlsplit(url if "://" in url else "//" + url).hostname
+        except ValueError: # malformed
+            host = None
+        return self.host_verdict(host or "")
+
+    def _host_verdict(self, host : str) -> bool:
+        verdict = self.default
+        node = self.root
+        for label in reversed(host.split(".")):
+            node = node.get(label)
+            if node is None:
+                break
+            verdict = node.get(self._VERDICT, verdict)
+        return verdict
+
+
+_policy = None
+
+def compile_policy() -> SecurityPolicy:
+    """Compile the security policy from the current configuration. Called whenever
+    the security policy is changed through the Project interface."""
+    global _policy # pylint: disable=global-statement
+    _policy = SecurityPolicy()
+    return _policy
+
+def invalidate_policy():
+    """Forget the compiled security policy, it is compiled from the configuration again
+    once needed. Call this after changing the security policy in config directly,
+    rather than through the Project interface."""
+    global _policy # pylint: disable=global-statement
+    _policy = None
+
+def get_policy() -> SecurityPolicy:
+    """Get the compiled security policy, see compile_policy and invalidate_policy."""
+    if _policy is None:
+        return compile_policy()
+    return _policy
 
 
 def is_generic_redirect(url : str):
@@ -91,12 +222,14 @@ def is_generic_redirect(url : str):
         The URL to be checked.
     """
     url = extract_local_path_and_args(url)
+    if "%" not in url: # nothing escaped, nothing to decode
+        return False
     dec_url = unquote(url)
     ## Note that a link may be escaped multiple times. (Example youtube link
     ## to sign in.)
     iteration = 0
     while url != dec_url:
-        if re.search(SUBLINK, url) is not None:
+        if SUBLINK.search(url) is not None:
             return True
         url = dec_url
         dec_url = unquote(dec_url)
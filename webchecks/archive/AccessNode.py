@@ -36,7 +36,8 @@ class AccessNode:
         return profile.get_archive().retreive_content(name)
 
     def get_content_location(self, url : str) -> str:
-        """Get the local file location where the content behind the given URL is stored."""
+        """Get the local file location where the content behind the given URL is stored.
+        Raises ValueError if there is none, e.g. if the archive backend is 'pack'."""
         name = self.cache.get_link_location(strong_strip_query_from_url(url))
         if name is None:
             raise ValueError(f"Url {url} was not found in the cache. Was it really retreived?")
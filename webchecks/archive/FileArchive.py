@@ -4,8 +4,9 @@
 import os
 import pickle
 import atexit
-from typing import Callable, Any, Union, Set
-from lzma import compress, decompress, LZMAError
+from hashlib import blake2b
+from typing import Callable, Any, Union, Set, Iterator
+from lzma import LZMAError
 
 from webchecks.utils.file_ops import get_file_name_from_url, get_file_type_from_response_header, \
     text_to_binary
@@ -13,17 +14,31 @@ from webchecks.monitor.Report import Report
 from webchecks.utils.url import strong_strip_query_from_url
 from webchecks.utils.messaging import logging
 from webchecks.config import config, COMPRESS_CONTENT, RESULT_STORAGE_LOCATION, \
-        DEFAULT_PER_PROFILE_CONTENT_STORAGE_LOCATION, LOG_ERROR
+        DEFAULT_PER_PROFILE_CONTENT_STORAGE_LOCATION, LOG_ERROR, LOG_INFO, COMPRESSION_CODEC, \
+        COMPRESSION_LEVEL, ZSTD_DICTIONARY, ZSTD_DICTIONARY_SAMPLES, ZSTD_DICTIONARY_SIZE, \
+        DEDUPLICATE_CONTENT, CONDITIONAL_REQUESTS
 from .GlobalCache import GlobalCache
+from . import compression
 
 
 class FileArchive:
     """Manages an isolated storage location for a profile (domain).
     Handles organisation, storing and retreiving of content and metadata using the filesystem.
     Also allows to store other data relevant for the profile such as the set of visited links.
-    Allows for compression."""
+    Allows for compression, the codec used is recorded in the metadata.
 
-    METADATA_DEFAULT = "compressed : {0}\nname : {1}\nbytes : {2}\nurl : {3}\n"
+    With config[ZSTD_DICTIONARY] and the zstd codec, the first pages of the domain are
+    compressed independently and used to train a dictionary (zstd.dict, next to the
+    metadata directory) which is then used for all later pages.
+
+    With config[DEDUPLICATE_CONTENT], identical content is stored only once in the project,
+    see _store_deduplicated."""
+
+    METADATA_DEFAULT = "compressed : {0}\nname : {1}\nbytes : {2}\nurl : {3}\ncodec : {4}\n"
+    METADATA_DICTIONARY = "dictionary : {0}\n"
+    METADATA_REF = "ref : {0}/{1}\n" # deduplicated, the content is stored elsewhere
+    METADATA_BLOB = "blob : {0}\n" # content stored under its hash
+    LEGACY_CODEC = "lzma" # content with no codec in its metadata
 
     def __init__(self, profile):
         root = os.path.join(
@@ -36,6 +51,9 @@ class FileArchive:
         self.content_dir = os.path.join(root, "content")
         self.meta_dir = os.path.join(root, "metadata")
         self.visited_links_path = os.path.join(self.meta_dir, "store_visited_links.dump")
+        self.dictionary_path = os.path.join(root, "zstd.dict")
+        self.dictionary = None # loaded lazily
+        self.dictionary_samples = []
         self._locate_dir(self.content_dir)
         self._locate_dir(self.meta_dir)
         self.profile = profile
@@ -99,35 +117,48 @@ class FileArchive:
         atexit.register(self._save_at_shutdown, func, location)
 
     def compress(self, text : bytes) -> bytes:
-        """Compress some sequence of bytes.
+        """Compress some sequence of bytes using the codec and level configured
+        (see Project.set_compression).
         
         Parameters:
         -------------
         text: bytes
             The text to be compressed.
         """
-        return compress(text)
+        return compression.compress(text, config[COMPRESSION_CODEC], config[COMPRESSION_LEVEL])
 
-    def decompress(self, text : bytes) -> bytes:
+    def decompress(self, text : bytes, codec : str = LEGACY_CODEC,
+            dictionary_id : Union[None, str] = None) -> bytes:
         """
         Decompress sequence of bytes.
         Parameters:
         -------------
         text: bytes
             The text to be decompressed.
+        codec: str
+            The codec it was compressed with, as recorded in the metadata.
+        dictionary_id: str or None
+            The id of the zstd dictionary it was compressed with, as recorded in the metadata.
         """
 
+        if dictionary_id is not None:
+            dictionary = self._load_dictionary()
+            if dictionary is None or str(dictionary.dict_id) != dictionary_id:
+                raise ValueError(f"The zstd dictionary {dictionary_id} is not available "
+                    f"at {self.dictionary_path}.")
+            return dictionary.decompress(text)
+
         try: # for all reasons, text should be bytes... optimistic try
-            return decompress(text)
+            return compression.decompress(text, codec)
         except TypeError: # unless user at profile level did some ops...
             if isinstance(text, str):
-                return decompress(text.encode("utf-8"))
+                return compression.decompress(text.encode("utf-8"), codec)
             raise
         except LZMAError: # some legacy support
-            return decompress(bytes.fromhex(text))
+            return compression.decompress(bytes.fromhex(text), codec)
 
     def retreive_content(self, fpath : str, path_only : bool = False,
-            metadata : bool = False) -> str:
+            metadata : bool = False, binary : bool = False) -> str:
         """
         Retreive some content at a given file path. 
         Raises FileNotFoundError if the file cannot be found.
@@ -142,28 +173,39 @@ class FileArchive:
             if it exists. (FileNotFoundError if not.)
         matadata : bool
             Return (project) metadata of that file.
+        binary : bool
+            Return the content as bytes, even if it was not compressed.
         """
         fpath = self._sanitize_fpath(fpath)
-        if path_only:
+        if path_only and self._has_content(fpath):
             return fpath
 
-        meta_dir = fpath.split("content/")
-        meta_dir = "".join(
-            (meta_dir[0],"content/", meta_dir[1], "metadata/",
-            "content/".join(meta_dir[2:]), ".txt")
-            )
-        md = self._read(meta_dir)
+        md = self._read_metadata(fpath)
         if metadata:
             return md
 
+        ref = self._header_field(md, "ref")
+        if ref is not None:
+            return self._retreive_ref(ref, path_only, binary)
+        if path_only:
+            return fpath
+
         do_decompress = self._says_compressed(md)
 
         if do_decompress:
-            return self.decompress(self._read(fpath, "rb"))
-        return self._read(fpath)
+            return self.decompress(self._read_content(fpath, True), self._says_codec(md),
+                self._header_field(md, "dictionary"))
+        return self._read_content(fpath, binary)
 
+    def stored_names(self) -> Iterator[str]:
+        """Names of all content stored, as accepted by retreive_content."""
+        with os.scandir(self.meta_dir) as entries:
+            for entry in entries:
+                if entry.name.endswith(".txt"):
+                    yield entry.name[:-len(".txt")]
 
-    def save_content(self, url : str, resp_header : dict, content : bytes,
+
+    def save_content(self, url : str, resp_header : dict, content : Union[str, bytes],
             metadata : str = "") -> Union[None, str]:
         """Save the content retreived from a given URL.
         Returns the filename under which it is stored. If type cannot be
@@ -175,8 +217,9 @@ class FileArchive:
             The url for that content.
         resp_header : dict
             The response header of that request.
-        content : bytes
-            The data retreived.
+        content : bytes or str
+            The data retreived. Text that was decoded already (see decode_content)
+            is stored UTF-8 encoded.
         metadata : str
             Additional metadata that should be included.
 
@@ -188,24 +231,66 @@ class FileArchive:
                 LOG_ERROR, where = "FileArchive.save_content")
             return None# do not save, not yet supported.
         name = get_file_name_from_url(url, fext)
-        fn = os.path.join(self.content_dir, name)
         self.cache.store_link_location(strong_strip_query_from_url(url), name)
+        if config[CONDITIONAL_REQUESTS]: # to revalidate it next time, see RequestNoJS
+            self.cache.store_validators(url, resp_header.get("etag"),
+                resp_header.get("last-modified"))
         #self.reporter.report_received(url, resp_header, content, fn, fext)
 
+        if config[DEDUPLICATE_CONTENT]:
+            self._store_deduplicated(url, name, ftype, fext, content, metadata)
+        else:
+            self._store(url, name, ftype, content, metadata)
+        return name
+
+    def _store(self, url : str, name : str, ftype : str, content : Union[str, bytes],
+            metadata : str):
+        """Write content and metadata under the name, compressing if configured."""
         compressed = False
+        codec = ""
+        dictionary = None
 
+        if isinstance(content, str): # decoded, stored UTF-8 encoded whatever the locale
+            content = text_to_binary(content)
         if config[COMPRESS_CONTENT] and ftype == "text":
-            if isinstance(content, str):
-                content = text_to_binary(content)
-            content = compress(content)
+            codec = config[COMPRESSION_CODEC]
+            if codec == "zstd" and config[ZSTD_DICTIONARY]:
+                dictionary = self._get_dictionary(content)
+            if dictionary is None:
+                content = self.compress(content)
+            else:
+                content = dictionary.compress(content, config[COMPRESSION_LEVEL])
             compressed = True
 
-        wtype = "w" if isinstance(content, str) else "wb"
-        with open(fn, wtype) as f:
-            fsize = f.write(content)
-
-        self._save_metadata(url, metadata, name + ".txt", compressed, fsize)
-        return name
+        fsize = self._write_content(name, content)
+
+        if dictionary is not None:
+            metadata = self.METADATA_DICTIONARY.format(dictionary.dict_id) + metadata
+        self._save_metadata(url, metadata, name + ".txt", compressed, fsize, codec)
+
+    def _store_deduplicated(self, url : str, name : str, ftype : str, fext : str,
+            content : Union[str, bytes], metadata : str):
+        """Store the content once per project: Under its hash, in the archive of the domain
+        where it was first seen. The metadata under the name refers to it."""
+        data = text_to_binary(content) if isinstance(content, str) else content
+        digest = blake2b(data, digest_size = 16).digest()
+        blob = self.cache.get_blob_location(digest)
+        if blob is None:
+            blob = (self.profile.get_domain(), digest.hex() + fext)
+            self._store(url, blob[1], ftype, content, self.METADATA_BLOB.format(digest.hex()))
+            self.cache.store_blob_location(digest, *blob)
+        metadata = self.METADATA_REF.format(*blob) + metadata
+        self._save_metadata(url, metadata, name + ".txt", False, 0)
+
+    def _retreive_ref(self, ref : str, path_only : bool, binary : bool) -> Union[str, bytes]:
+        """Retreive deduplicated content, ref as recorded in the metadata."""
+        domain, name = ref.split("/", 1)
+        archive = self
+        if domain != self.profile.get_domain():
+            # pylint: disable-next=import-outside-toplevel
+            from webchecks.profiles.profileDB import fetch_profile # circular otherwise
+            archive = fetch_profile(domain).get_archive()
+        return archive.retreive_content(name, path_only = path_only, binary = binary)
 
     def _says_compressed(self, md : str) -> bool:
         """Given metadata content returns whether it says the content is compressed."""
@@ -218,21 +303,94 @@ class FileArchive:
                 "Assuming False. If you have overwritten metadata files, make "
                 "sure that 'compressed : bool ' is at the beginning if you "
                 "want automatic decompression. Else you can do it manually "
-                "by applying lzma.decompress on the content.",
+                "using webchecks.archive.compression.decompress on the content.",
                 LOG_ERROR)
             return False
         return "True" in md.split("\n", maxsplit=1)[0]
 
-    def _save_metadata(self, url : str, msg : str, fname : str, compressed : bool, fsize : int):
-        header = self.METADATA_DEFAULT.format(compressed, fname, fsize, url)
+    def _says_codec(self, md : str) -> str:
+        """Given metadata content returns the codec the content was compressed with."""
+        codec = self._header_field(md, "codec")
+        return self.LEGACY_CODEC if codec is None else codec
+
+    def _header_field(self, md : str, field : str) -> Union[None, str]:
+        """Value of a field in the header of the metadata, None if it is not there."""
+        prefix = field + " : "
+        for line in md.split("\n", 6)[:6]: # the header only
+            if line.startswith(prefix):
+                return line[len(prefix):].strip()
+        return None
+
+    def _load_dictionary(self) -> Union[None, "compression.ZstdDictionary"]:
+        """The zstd dictionary of this domain, None if there is none (yet)."""
+        if self.dictionary is None and os.path.exists(self.dictionary_path):
+            self.dictionary = compression.ZstdDictionary(self._read(self.dictionary_path, "rb"))
+        return self.dictionary
+
+    def _get_dictionary(self, sample : bytes) -> Union[None, "compression.ZstdDictionary"]:
+        """The zstd dictionary to compress with. Until there is one, collects
+        samples and trains it once there are config[ZSTD_DICTIONARY_SAMPLES]."""
+        if self._load_dictionary() is not None:
+            return self.dictionary
+        self.dictionary_samples.append(sample)
+        if len(self.dictionary_samples) < config[ZSTD_DICTIONARY_SAMPLES]:
+            return None
+        samples, self.dictionary_samples = self.dictionary_samples, []
+        try:
+            dictionary = compression.ZstdDictionary.train(samples, config[ZSTD_DICTIONARY_SIZE])
+        except compression.zstandard.ZstdError as e:
+            logging(f"Failed to train zstd dictionary for {self.profile.get_domain()}: {e}",
+                LOG_ERROR, where = "FileArchive._get_dictionary")
+            return None
+        with open(self.dictionary_path, "wb") as f:
+            f.write(dictionary.data)
+        logging(f"Trained zstd dictionary {dictionary.dict_id} for "
+            f"{self.profile.get_domain()}.", LOG_INFO)
+        self.dictionary = dictionary
+        return dictionary
+
+    def _save_metadata(self, url : str, msg : str, fname : str, compressed : bool, fsize : int,
+            codec : str = ""):
+        header = self.METADATA_DEFAULT.format(compressed, fname, fsize, url, codec)
         msg = "".join((header, msg))
-        fname = os.path.join(self.meta_dir, fname)
-        with open(fname, "w") as f:
-            f.write(msg)
+        self._write_metadata(fname, msg)
+
+    # Storage primitives: where content and metadata are kept. Another backend
+    # (see PackArchive) overrides these along with _sanitize_fpath.
+
+    def _write_content(self, name : str, content : Union[str, bytes]) -> int:
+        """Store the content under the name, returns its size in bytes."""
+        if isinstance(content, str):
+            content = text_to_binary(content)
+        with open(os.path.join(self.content_dir, name), "wb") as f:
+            return f.write(content)
+
+    def _write_metadata(self, fname : str, text : str):
+        """Store the metadata under the name (the content name with .txt appended)."""
+        with open(os.path.join(self.meta_dir, fname), "w", encoding = "utf-8") as f:
+            f.write(text)
+
+    def _has_content(self, fpath : str) -> bool:
+        """Whether content (not only metadata) is stored, fpath as returned by _sanitize_fpath."""
+        return os.path.isfile(fpath)
+
+    def _read_content(self, fpath : str, binary : bool) -> Union[str, bytes]:
+        """Read the content, fpath as returned by _sanitize_fpath."""
+        return self._read(fpath, "rb" if binary else "r")
+
+    def _read_metadata(self, fpath : str) -> str:
+        """Read the metadata of the content, fpath as returned by _sanitize_fpath."""
+        meta_dir = fpath.split("content/")
+        meta_dir = "".join(
+            (meta_dir[0],"content/", meta_dir[1], "metadata/",
+            "content/".join(meta_dir[2:]), ".txt")
+            )
+        return self._read(meta_dir)
 
     def _read(self, fpath, mode = "r"):
         base = "" if mode == "r" else b""
-        with open(fpath, mode) as f:
+        encoding = "utf-8" if mode == "r" else None
+        with open(fpath, mode, encoding = encoding) as f:
             return base.join(f.readlines())
 
     def _sanitize_fpath(self, fpath):
@@ -243,6 +401,8 @@ class FileArchive:
             try2 = os.path.join(self.meta_dir, fpath)
             if os.path.exists(try2):
                 return try2
+            if os.path.exists(try2 + ".txt"): # only metadata, deduplicated content
+                return try1
             raise FileNotFoundError(
                 f"Cannot find file {fpath} for domain {self.profile.get_domain()}"
                 )
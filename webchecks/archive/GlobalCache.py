@@ -2,21 +2,49 @@
 
 import os
 import time
+import atexit
 import sqlite3
 from typing import Tuple, Union
 from webchecks.utils.file_ops import hash_string
 from webchecks.utils.singleton import singleton
-from webchecks.config import config, CACHE_STORAGE_LOCATION
+from webchecks.config import config, CACHE_STORAGE_LOCATION, CACHE_WRITE_BEHIND, \
+    CACHE_COMMIT_BATCH_SIZE, CACHE_COMMIT_INTERVAL
 
 DURATION_DAY = 60 * 60 * 24
 
+# Entry i brings the database from schema version i to i + 1.
+# The version of a database is kept in PRAGMA user_version.
+SCHEMA_MIGRATIONS = [
+    ( # 1: one row per key, the most recent one of duplicates is kept
+        "DELETE FROM links WHERE rowid NOT IN (SELECT MAX(rowid) FROM links GROUP BY weblink)",
+        "DELETE FROM metadata WHERE rowid NOT IN "
+            "(SELECT MAX(rowid) FROM metadata GROUP BY domain, name)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS links_weblink ON links(weblink)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS metadata_domain_name ON metadata(domain, name)",
+    ),
+    ( # 2: location of deduplicated content by its hash, see FileArchive
+        "CREATE TABLE IF NOT EXISTS blobs(hash PRIMARY KEY, domain, name)",
+    ),
+    ( # 3: validators of stored content for conditional requests, see RequestNoJS
+        "CREATE TABLE IF NOT EXISTS validators(weblink PRIMARY KEY, etag, last_modified)",
+    ),
+]
+
 
 @singleton
 class GlobalCache:
     """Persistent file cache singleton service that is to be used for all profiles. Allows to
-    cache files spanning multiple runs."""
+    cache files spanning multiple runs.
+
+    By default, every write is committed right away. In write-behind mode
+    (config[CACHE_WRITE_BEHIND]) the database uses WAL journaling and writes are grouped
+    into one transaction until config[CACHE_COMMIT_BATCH_SIZE] of them are pending or
+    config[CACHE_COMMIT_INTERVAL] seconds passed since the last commit. Use flush to
+    commit explicitly, this is done at shutdown too."""
 
     def __init__(self):
+        if hasattr(self, "db"): # reinitialized, do not lose pending writes
+            self.flush()
         self.root = config[CACHE_STORAGE_LOCATION]
         self._locate_dir()
         self.metadb = os.path.join(self.root, "meta.db")
@@ -25,11 +53,55 @@ class GlobalCache:
         if create_db:
             #print("Creating DB")
             self._create_db()
+        self._migrate()
+        self.pending_writes = 0
+        self.last_commit = time.time()
+        self.write_behind = False
+        if config[CACHE_WRITE_BEHIND]:
+            self.set_write_behind(True)
+        atexit.unregister(self.flush)
+        atexit.register(self.flush)
 
     def __del__(self):
         self.db.commit()
         self.db.close()
 
+    def set_write_behind(self, enable : bool):
+        """
+        Enable or disable write-behind mode. Pending writes are committed first.
+
+        Parameters:
+        -------------
+        enable : bool
+            Whether to group writes into transactions and use WAL journaling.
+        """
+        self.flush()
+        self.write_behind = enable
+        if enable:
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")
+        else:
+            self.db.execute("PRAGMA journal_mode=DELETE")
+            self.db.execute("PRAGMA synchronous=FULL")
+
+    def flush(self):
+        """
+        Commit all pending writes.
+        """
+        self.db.commit()
+        self.pending_writes = 0
+        self.last_commit = time.time()
+
+    def _commit(self):
+        """Commit now or, in write-behind mode, once enough writes are pending."""
+        if not self.write_behind:
+            self.db.commit()
+            return
+        self.pending_writes += 1
+        if self.pending_writes >= config[CACHE_COMMIT_BATCH_SIZE] or \
+                time.time() - self.last_commit >= config[CACHE_COMMIT_INTERVAL]:
+            self.flush()
+
     def _locate_dir(self):
         try:
             os.makedirs(self.root)
@@ -41,10 +113,20 @@ class GlobalCache:
         cu.execute("CREATE TABLE metadata(domain, name, hash, sec_before_refresh)")
         cu.execute("CREATE TABLE links(weblink, localfilelink)")
 
+    def _migrate(self):
+        """Bring the database schema up to date, one version at a time."""
+        version = self.db.execute("PRAGMA user_version").fetchone()[0]
+        for i in range(version, len(SCHEMA_MIGRATIONS)):
+            with self.db: # each step is one transaction
+                self.db.execute("BEGIN") # not opened implicitly for DDL
+                for statement in SCHEMA_MIGRATIONS[i]:
+                    self.db.execute(statement)
+                self.db.execute(f"PRAGMA user_version = {i + 1}")
+
     def store_link_location(self, weblink : str, localfilelink : str):
         """
         Store a mapping between the URL and the corresponding local link where
-        the content retreived is stored.
+        the content retreived is stored. Replaces an earlier mapping for that URL.
 
         Parameters:
         -------------
@@ -54,9 +136,9 @@ class GlobalCache:
             The location where the content is stored.
         """
         cu = self.db.cursor()
-        cu.execute("INSERT INTO links VALUES (?, ?)",
+        cu.execute("INSERT OR REPLACE INTO links VALUES (?, ?)",
             (weblink, localfilelink))
-        self.db.commit()
+        self._commit()
 
     def get_link_location(self, weblink : str) -> str:
         """
@@ -73,10 +155,77 @@ class GlobalCache:
             return link
         return None
 
+    def store_blob_location(self, digest : bytes, domain : str, name : str):
+        """
+        Store where content with the given hash is stored.
+
+        Parameters:
+        -------------
+        digest : bytes
+            The hash of the content.
+        domain : str
+            The domain in whose archive it is stored.
+        name : str
+            The name under which it is stored there.
+        """
+        self.db.execute("INSERT OR REPLACE INTO blobs VALUES (?, ?, ?)", (digest, domain, name))
+        self._commit()
+
+    def get_blob_location(self, digest : bytes) -> Union[None, Tuple[str, str]]:
+        """
+        Get (domain, name) where content with the given hash is stored. None if it is not.
+
+        Parameters:
+        -------------
+        digest : bytes
+            The hash of the content.
+        """
+        for location in self.db.execute("SELECT domain, name FROM blobs WHERE hash = ?",
+                (digest,)):
+            return location
+        return None
+
+    def store_validators(self, weblink : str, etag : Union[None, str],
+            last_modified : Union[None, str]):
+        """
+        Store the validators the server sent along with the content of the URL,
+        replacing earlier ones. Nothing is stored if there are none.
+
+        Parameters:
+        -------------
+        weblink : str
+            The URL.
+        etag : str or None
+            The ETag header of the response.
+        last_modified : str or None
+            The Last-Modified header of the response.
+        """
+        if etag is None and last_modified is None:
+            self.db.execute("DELETE FROM validators WHERE weblink = ?", (weblink,))
+        else:
+            self.db.execute("INSERT OR REPLACE INTO validators VALUES (?, ?, ?)",
+                (weblink, etag, last_modified))
+        self._commit()
+
+    def get_validators(self, weblink : str) -> Union[None, Tuple[str, str]]:
+        """
+        Get (etag, last_modified) stored for the URL, either may be None.
+        None if there are none.
+
+        Parameters:
+        -------------
+        weblink : str
+            The URL.
+        """
+        for validators in self.db.execute(
+                "SELECT etag, last_modified FROM validators WHERE weblink = ?", (weblink,)):
+            return validators
+        return None
+
     def store(self, domain : str, content : Union[str, bytes], name : str,
             sec_before_refresh : Union[int, float]) -> Union[None, str]:
         """
-        Store (cache) some content.
+        Store (cache) some content, replacing what was stored under that name before.
         Returns the hash of the content stored or None if not stored.
         (It refuses to store if sec_before_refresh <= 0, see below.)
 
@@ -109,9 +258,9 @@ class GlobalCache:
         with open(filepath, mode) as f:
             f.write(content)
         cu = self.db.cursor()
-        cu.execute("INSERT INTO metadata VALUES (?, ?, ?, ?)",
+        cu.execute("INSERT OR REPLACE INTO metadata VALUES (?, ?, ?, ?)",
             (domain, name, filehash, sec_before_refresh))
-        self.db.commit()
+        self._commit()
         return filehash
 
     def load(self, domain : str, name : str,
@@ -140,7 +289,7 @@ class GlobalCache:
                     "DELETE FROM metadata WHERE name = ? AND domain = ?",
                     (name, domain)
                 )
-                self.db.commit()
+                self._commit()
                 return (None, None)
 
         filepath = os.path.join(self.root, domain, name)
@@ -174,7 +323,30 @@ class GlobalCache:
                     "DELETE FROM metadata WHERE name = ? AND domain = ?",
                     (name, domain)
                 )
-                self.db.commit()
+                self._commit()
                 return None
             return filehash
         return None
+
+    def get_expiry(self, domain : str, name : str) -> Union[None, float]:
+        """
+        Get the timestamp (as time.time()) until which some content that was stored
+        previously is valid. None if it is not stored or no longer valid.
+
+        Parameters:
+        -------------
+        domain : str
+            The domain name under which this was stored.
+        name : str
+            The name of the content itself.
+        """
+        cu = self.db.cursor()
+        query = cu.execute(
+            "SELECT sec_before_refresh FROM metadata WHERE name = ? AND domain = ?",
+            (name, domain)
+            )
+        for (sbr,) in query:
+            if time.time() > sbr:
+                return None
+            return sbr
+        return None
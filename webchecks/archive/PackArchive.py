@@ -0,0 +1,216 @@
+"""Provides the PackArchive class."""
+
+import os
+import mmap
+import atexit
+import sqlite3
+from typing import Union, Tuple, Iterator
+
+from webchecks.utils.messaging import logging
+from webchecks.config import config, PACK_SEGMENT_SIZE, LOG_ERROR, LOG_WARNING
+from .FileArchive import FileArchive
+
+KIND_CONTENT = 0
+KIND_METADATA = 1
+
+
+class PackArchive(FileArchive):
+    """FileArchive that does not create two files per page. Instead, content and metadata
+    are appended as records to large segment files (content/segment-XXXXXX.pack) and
+    an index in SQLite (metadata/pack.db) remembers where each record is. Records are
+    read via mmap.
+
+    Each record starts with a header line 'WCPACK/1.0 <kind> <length> <name>', followed
+    by the data and an empty line, such that the segments can be inspected without the
+    index. If the index is lost or corrupt, it is rebuilt from these headers, see
+    rebuild_index.
+
+    The API is the one of the FileArchive. Names returned by save_content and accepted by
+    retreive_content are the record names. Content that was stored as files before
+    (by FileArchive) remains readable. Packed content has no file of its own, thus
+    retreive_content raises ValueError for it if path_only is set."""
+
+    RECORD_HEADER = "WCPACK/1.0 {0} {1} {2}\r\n"
+    RECORD_TRAILER = b"\r\n\r\n"
+
+    def __init__(self, profile):
+        super().__init__(profile)
+        index_path = os.path.join(self.meta_dir, "pack.db")
+        rebuild = not os.path.exists(index_path)
+        try:
+            self.index = self._open_index(index_path)
+        except sqlite3.DatabaseError:
+            logging(f"Index {index_path} is corrupt. Rebuilding it.", LOG_ERROR,
+                where = "PackArchive")
+            self.index.close()
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(index_path + suffix):
+                    os.remove(index_path + suffix)
+            self.index = self._open_index(index_path)
+            rebuild = True
+        self.segment = self._last_segment()
+        if rebuild and os.path.exists(self._segment_path(0)):
+            self.rebuild_index()
+        self.segment_file = None # opened for appending on the first write
+        self.maps = {} # segment -> mmap
+        atexit.register(self.close)
+
+    def _open_index(self, path : str) -> sqlite3.Connection:
+        self.index = sqlite3.connect(path)
+        self.index.execute("PRAGMA journal_mode=WAL")
+        self.index.execute("PRAGMA synchronous=NORMAL")
+        self.index.execute("CREATE TABLE IF NOT EXISTS records(name TEXT, kind INTEGER, "
+            "segment INTEGER, offset INTEGER, length INTEGER, PRIMARY KEY (name, kind)) "
+            "WITHOUT ROWID")
+        self.index.commit()
+        return self.index
+
+    def rebuild_index(self) -> int:
+        """Rebuild the index from the record headers in the segments. Of several records
+        under one name, the last one is indexed. A record that was cut short, e.g. because
+        the program stopped while writing it, ends the scan of its segment.
+        Returns the number of records indexed."""
+        magic = self.RECORD_HEADER.split(" ", 1)[0]
+        self.index.execute("DELETE FROM records")
+        n_records = 0
+        for segment in range(self._last_segment() + 1):
+            path = self._segment_path(segment)
+            if not os.path.exists(path):
+                continue
+            with open(path, "rb") as f:
+                while True:
+                    line = f.readline()
+                    if not line:
+                        break
+                    try:
+                        start, kind, length, name = \
+                            line.decode("utf-8").rstrip("\r\n").split(" ", 3)
+                        kind, length = int(kind), int(length)
+                    except ValueError:
+                        start = None
+                    offset = f.tell()
+                    f.seek(length if start == magic else 0, os.SEEK_CUR)
+                    if start != magic or f.read(len(self.RECORD_TRAILER)) != self.RECORD_TRAILER:
+                        logging(f"Segment {path} is damaged at offset {offset}. "
+                            "Records after it are not indexed.", LOG_WARNING,
+                            where = "PackArchive.rebuild_index")
+                        break
+                    self.index.execute("INSERT OR REPLACE INTO records VALUES (?, ?, ?, ?, ?)",
+                        (name, kind, segment, offset, length))
+                    n_records += 1
+        self.index.commit()
+        logging(f"Rebuilt index of {self.profile.get_domain()}: {n_records} records.",
+            where = "PackArchive.rebuild_index")
+        return n_records
+
+    def quiet_exit(self):
+        super().quiet_exit()
+        atexit.unregister(self.close)
+
+    def close(self):
+        """Close the segment files and the index. Done at exit, unless quiet_exit was called."""
+        atexit.unregister(self.close)
+        if self.segment_file is not None:
+            self.segment_file.close()
+            self.segment_file = None
+        for mm in self.maps.values():
+            mm.close()
+        self.maps = {}
+        if self.index is not None:
+            self.index.commit()
+            self.index.close()
+            self.index = None
+
+    def _segment_path(self, segment : int) -> str:
+        return os.path.join(self.content_dir, f"segment-{segment:06d}.pack")
+
+    def _last_segment(self) -> int:
+        segment = 0
+        while os.path.exists(self._segment_path(segment + 1)):
+            segment += 1
+        return segment
+
+    def _append(self, name : str, kind : int, data : bytes) -> int:
+        """Append a record to the current segment and index it. Returns its length."""
+        if self.segment_file is None:
+            self.segment_file = open(self._segment_path(self.segment), "ab")
+        if self.segment_file.tell() >= config[PACK_SEGMENT_SIZE]: # full, start the next one
+            self.segment_file.close()
+            self.segment += 1
+            self.segment_file = open(self._segment_path(self.segment), "ab")
+
+        header = self.RECORD_HEADER.format(kind, len(data), name).encode("utf-8")
+        offset = self.segment_file.tell() + len(header)
+        self.segment_file.write(b"".join((header, data, self.RECORD_TRAILER)))
+        self.segment_file.flush() # readable through mmap right away
+        self.index.execute("INSERT OR REPLACE INTO records VALUES (?, ?, ?, ?, ?)",
+            (name, kind, self.segment, offset, len(data)))
+        return len(data)
+
+    def _lookup(self, name : str, kind : int) -> Union[None, Tuple[int, int, int]]:
+        """(segment, offset, length) of the record, None if there is none."""
+        for row in self.index.execute(
+                "SELECT segment, offset, length FROM records WHERE name = ? AND kind = ?",
+                (name, kind)):
+            return row
+        return None
+
+    def _read_record(self, segment : int, offset : int, length : int) -> bytes:
+        mm = self.maps.get(segment)
+        if mm is None or len(mm) < offset + length: # not mapped or grown since
+            if mm is not None:
+                mm.close()
+            with open(self._segment_path(segment), "rb") as f:
+                mm = self.maps[segment] = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+        return mm[offset : offset + length]
+
+    def _write_content(self, name : str, content : Union[str, bytes]) -> int:
+        if isinstance(content, str):
+            content = content.encode("utf-8")
+        return self._append(name, KIND_CONTENT, content)
+
+    def _write_metadata(self, fname : str, text : str):
+        # stored under the content name, the metadata is the last record of a page
+        self._append(fname[:-len(".txt")], KIND_METADATA, text.encode("utf-8"))
+        self.index.commit()
+
+    def _has_content(self, fpath : str) -> bool:
+        return self._lookup(fpath, KIND_CONTENT) is not None or super()._has_content(fpath)
+
+    def _read_content(self, fpath : str, binary : bool) -> Union[str, bytes]:
+        record = self._lookup(fpath, KIND_CONTENT)
+        if record is None:
+            return super()._read_content(fpath, binary)
+        content = self._read_record(*record)
+        return content if binary else content.decode("utf-8")
+
+    def _read_metadata(self, fpath : str) -> str:
+        record = self._lookup(fpath, KIND_METADATA)
+        if record is None:
+            return super()._read_metadata(fpath)
+        return self._read_record(*record).decode("utf-8")
+
+    def stored_names(self) -> Iterator[str]:
+        for (name,) in self.index.cursor().execute(
+                "SELECT name FROM records WHERE kind = ?", (KIND_METADATA,)):
+            yield name
+        for name in super().stored_names(): # stored as files before
+            if self._lookup(name, KIND_METADATA) is None:
+                yield name
+
+    def retreive_content(self, fpath : str, path_only : bool = False,
+            metadata : bool = False, binary : bool = False) -> Union[str, bytes]:
+        if path_only:
+            name = self._sanitize_fpath(fpath)
+            if self._lookup(name, KIND_CONTENT) is not None:
+                raise ValueError(f"{name} of {self.profile.get_domain()} is stored in a "
+                    "segment, it has no file of its own.")
+        return super().retreive_content(fpath, path_only, metadata, binary)
+
+    def _sanitize_fpath(self, fpath):
+        name = fpath
+        if name.startswith(self.content_dir + os.sep):
+            name = name[len(self.content_dir) + 1:]
+        if self._lookup(name, KIND_METADATA) is not None:
+            return name
+        return super()._sanitize_fpath(fpath)
@@ -0,0 +1,209 @@
+"""Provides the registry of compression codecs that FileArchive can use."""
+
+import lzma
+import zlib
+import gzip
+from functools import lru_cache
+from typing import Callable, Dict, Tuple, Union, List
+
+from webchecks.utils.Error import OptionsError
+
+try:
+    import zstandard
+except ImportError: # optional
+    zstandard = None
+
+
+class Codec:
+    """A compression codec: how to compress at a given level and how to decompress.
+
+    Parameters:
+    -------------
+    name : str
+        The name under which it is registered and recorded in the metadata.
+    compress : Callable (bytes, int) -> bytes
+        Compresses the data at the given level.
+    decompress : Callable bytes -> bytes
+        Inverse of compress.
+    levels : (int, int)
+        Smallest and largest level supported.
+    default_level : int
+        The level used if none is specified.
+    """
+
+    __slots__ = ("name", "compress", "decompress", "levels", "default_level")
+
+    def __init__(self, name : str, compress : Callable[[bytes, int], bytes],
+            decompress : Callable[[bytes], bytes], levels : Tuple[int, int],
+            default_level : int):
+        self.name = name
+        self.compress = compress
+        self.decompress = decompress
+        self.levels = levels
+        self.default_level = default_level
+
+    def check_level(self, level : Union[None, int]) -> int:
+        """Returns the level to use. Raises ValueError if it is not supported.
+
+        Parameters:
+        -------------
+        level : int or None
+            The level asked for. None means the default level.
+        """
+        if level is None:
+            return self.default_level
+        if not isinstance(level, int) or not self.levels[0] <= level <= self.levels[1]:
+            raise ValueError(f"Compression level for {self.name} should be an integer "
+                f"from {self.levels[0]} to {self.levels[1]}.")
+        return level
+
+
+_codecs : Dict[str, Codec] = {}
+
+
+def register_codec(codec : Codec):
+    """Make a codec available, replacing one registered under the same name.
+
+    Parameters:
+    -------------
+    codec : Codec
+        The codec.
+    """
+    _codecs[codec.name] = codec
+
+
+def get_codec(name : str) -> Codec:
+    """Returns the codec registered under the given name. Raises OptionsError if there is none.
+
+    Parameters:
+    -------------
+    name : str
+        Name of the codec, e.g. 'lzma'.
+    """
+    try:
+        return _codecs[name]
+    except KeyError:
+        raise OptionsError("codec", available_codecs()) from None
+
+
+def available_codecs() -> Tuple[str]:
+    """Names of all registered codecs."""
+    return tuple(_codecs)
+
+
+def zstd_available() -> bool:
+    """Whether the zstandard package is installed, i.e. the zstd codec and
+    ZstdDictionary can be used."""
+    return zstandard is not None
+
+
+def compress(data : bytes, codec : str, level : Union[None, int] = None) -> bytes:
+    """Compress data with the given codec.
+
+    Parameters:
+    -------------
+    data : bytes
+        The data to be compressed.
+    codec : str
+        Name of the codec.
+    level : int or None
+        The compression level. None means the default level of the codec.
+    """
+    c = get_codec(codec)
+    return c.compress(data, c.check_level(level))
+
+
+def decompress(data : bytes, codec : str) -> bytes:
+    """Decompress data that was compressed with the given codec.
+
+    Parameters:
+    -------------
+    data : bytes
+        The data to be decompressed.
+    codec : str
+        Name of the codec.
+    """
+    return get_codec(codec).decompress(data)
+
+
+register_codec(Codec("lzma",
+    lambda data, level: lzma.compress(data, preset = level),
+    lzma.decompress, (0, 9), 6))
+register_codec(Codec("zlib",
+    zlib.compress, zlib.decompress, (0, 9), 6))
+register_codec(Codec("gzip",
+    lambda data, level: gzip.compress(data, compresslevel = level, mtime = 0),
+    gzip.decompress, (0, 9), 6))
+
+if zstandard is not None:
+    @lru_cache(maxsize = None)
+    def _zstd_compressor(level : int):
+        return zstandard.ZstdCompressor(level = level)
+
+    _zstd_decompressor = zstandard.ZstdDecompressor()
+
+    register_codec(Codec("zstd",
+        lambda data, level: _zstd_compressor(level).compress(data),
+        _zstd_decompressor.decompress, (1, 22), 3))
+
+
+class ZstdDictionary:
+    """A zstd dictionary, trained on samples of similar data such as pages of one website.
+    Small pieces of data sharing most of their content (markup, navigation, footers)
+    compress much better and faster with it than independently.
+    Requires the zstandard package.
+
+    Parameters:
+    -------------
+    data : bytes
+        The dictionary as returned by ZstdDictionary.train(...).data.
+    """
+
+    def __init__(self, data : bytes):
+        self.data = data
+        self._dict = zstandard.ZstdCompressionDict(data)
+        self.dict_id = self._dict.dict_id()
+        self._compressors = {}
+        self._decompressor = zstandard.ZstdDecompressor(dict_data = self._dict)
+
+    @classmethod
+    def train(cls, samples : List[bytes], size : int) -> "ZstdDictionary":
+        """Train a dictionary of at most size bytes on the samples.
+        Raises zstandard.ZstdError if the samples do not suffice.
+
+        Parameters:
+        -------------
+        samples : list of bytes
+            The data the dictionary is trained on.
+        size : int
+            Maximum size of the dictionary in bytes.
+        """
+        return cls(zstandard.train_dictionary(size, samples).as_bytes())
+
+    def compress(self, data : bytes, level : Union[None, int] = None) -> bytes:
+        """Compress data using the dictionary.
+
+        Parameters:
+        -------------
+        data : bytes
+            The data to be compressed.
+        level : int or None
+            The compression level. None means the default level of the zstd codec.
+        """
+        level = get_codec("zstd").check_level(level)
+        try:
+            compressor = self._compressors[level]
+        except KeyError:
+            compressor = self._compressors[level] = \
+                zstandard.ZstdCompressor(level = level, dict_data = self._dict)
+        return compressor.compress(data)
+
+    def decompress(self, data : bytes) -> bytes:
+        """Decompress data that was compressed using this dictionary.
+
+        Parameters:
+        -------------
+        data : bytes
+            The data to be decompressed.
+        """
+        return self._decompressor.decompress(data)
@@ -0,0 +1,239 @@
+"""Provides export of the project's archives to WARC files and import from them.
+
+Both work record by record: Only one page at a time is held in memory, whatever
+the size of the archive. Exported files are compressed with one gzip member per
+record, as is common for WARC files, such that they can be read from any offset."""
+
+import os
+import gzip
+import zlib
+import uuid
+import base64
+import hashlib
+import mimetypes
+from datetime import datetime, timezone
+from typing import BinaryIO, Collection, Dict, Iterator, List, Tuple, Union
+
+from webchecks.profiles.profileDB import profiledb, fetch_profile
+from webchecks.utils.url import extract_fully_qualified_domain_name
+from webchecks.utils.file_ops import get_file_type_from_response_header, decode_content
+from webchecks.utils.Error import InputError
+from webchecks.utils.messaging import logging
+from webchecks.config import LOG_ERROR, LOG_WARNING, LOG_INFO
+
+WARC_VERSION = b"WARC/1.0"
+# file extensions recognized when importing a directory
+WARC_EXTENSIONS = (".warc", ".warc.gz")
+
+
+def write_record(f : BinaryIO, warc_type : str, payload : bytes,
+        headers : Dict[str, str]) -> int:
+    """Write a single WARC record as its own gzip member. Returns the number of bytes written.
+
+    Parameters:
+    -------------
+    f : binary file object
+        The file to append to.
+    warc_type : str
+        The WARC-Type, e.g. 'resource'.
+    payload : bytes
+        The content block of the record.
+    headers : dict
+        Further WARC header fields, e.g. WARC-Target-URI.
+    """
+    digest = base64.b32encode(hashlib.sha1(payload).digest()).decode("ascii")
+    fields = {
+        "WARC-Type" : warc_type,
+        "WARC-Record-ID" : f"<urn:uuid:{uuid.uuid4()}>",
+        "WARC-Date" : datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "WARC-Block-Digest" : f"sha1:{digest}",
+    }
+    fields.update(headers)
+    fields["Content-Length"] = str(len(payload))
+    head = "".join(f"{k}: {v}\r\n" for k, v in fields.items()).encode("utf-8")
+    record = b"".join((WARC_VERSION, b"\r\n", head, b"\r\n", payload, b"\r\n\r\n"))
+    return f.write(gzip.compress(record, compresslevel = 6, mtime = 0))
+
+
+def read_records(f : BinaryIO) -> Iterator[Tuple[Dict[str, str], bytes]]:
+    """Iterate over the records of a WARC file, as (header, payload).
+    Header field names are lower case. The file may be gzip compressed or not.
+
+    Parameters:
+    -------------
+    f : binary file object
+        The WARC file, opened for reading (buffered, as by open(path, "rb")).
+    """
+    if f.peek(2)[:2] == b"\x1f\x8b":
+        f = gzip.GzipFile(fileobj = f)
+    while True:
+        line = f.readline()
+        if not line:
+            return
+        if not line.strip(): # blank lines between records
+            continue
+        if not line.startswith(b"WARC/"):
+            raise ValueError(f"Not a WARC record: {line[:50]}")
+        header = {}
+        for line in iter(f.readline, b""):
+            line = line.strip()
+            if not line:
+                break
+            key, _, value = line.decode("utf-8", "replace").partition(":")
+            header[key.strip().lower()] = value.strip()
+        payload = f.read(int(header.get("content-length", 0)))
+        yield header, payload
+
+
+def export_warc(location : str, domains : Union[None, Collection[str]] = None,
+        max_file_size : int = 1 << 30) -> List[str]:
+    """Export the content stored for the given domains to WARC files in the given
+    directory. Every page becomes a 'resource' record followed by a 'metadata' record
+    holding its WebChecks metadata. A new file is started once one exceeds max_file_size.
+    Returns the paths of the files written.
+
+    Parameters:
+    -------------
+    location : str
+        The directory to write to. Created if it does not exist.
+    domains : collection of str or None
+        The domains to export. None means all domains of the project.
+    max_file_size : int
+        Approximate maximum size of one WARC file in bytes.
+    """
+    os.makedirs(location, exist_ok = True)
+    if domains is None:
+        domains = sorted(profiledb.keys())
+    files = []
+    f = None
+    size = 0
+
+    try:
+        for domain in domains:
+            archive = fetch_profile(domain).get_archive()
+            for name in archive.stored_names():
+                try:
+                    md = archive.retreive_content(name, metadata = True)
+                    payload = archive.retreive_content(name, binary = True)
+                except (FileNotFoundError, ValueError) as e:
+                    logging(f"Not exporting {name} of {domain}: {e}", LOG_ERROR,
+                        where = "warc.export_warc")
+                    continue
+                # pylint: disable=protected-access
+                if archive._header_field(md, "blob") is not None:
+                    continue # deduplicated content, exported with the URLs referring to it
+                url = archive._header_field(md, "url")
+
+                if f is None or size >= max_file_size:
+                    if f is not None:
+                        f.close()
+                    files.append(os.path.join(location,
+                        f"webchecks-{len(files):05d}.warc.gz"))
+                    f = open(files[-1], "wb") # pylint: disable=consider-using-with
+                    size = write_record(f, "warcinfo", b"software: webchecks\r\n",
+                        {"Content-Type" : "application/warc-fields"})
+
+                mime = mimetypes.guess_type(name)[0] or "application/octet-stream"
+                size += write_record(f, "resource", payload,
+                    {"WARC-Target-URI" : url, "Content-Type" : mime})
+                size += write_record(f, "metadata", md.encode("utf-8"),
+                    {"WARC-Target-URI" : url, "Content-Type" : "text/plain"})
+    finally:
+        if f is not None:
+            f.close()
+    logging(f"Exported to {len(files)} WARC files at {location}.", LOG_INFO)
+    return files
+
+
+def import_warc(location : str) -> int:
+    """Import the 'resource' and 'response' records of WARC files into the archives of
+    the project as if the pages had been retreived: They count as visited, thus are not
+    requested again by a crawl. Records without a valid target URI and responses other
+    than 2xx are skipped. Text is decoded as for retreived pages, see decode_content.
+    Returns the number of pages imported.
+
+    Parameters:
+    -------------
+    location : str
+        A WARC file (.warc or .warc.gz) or a directory containing such files.
+    """
+    if os.path.isdir(location):
+        paths = sorted(os.path.join(location, fn) for fn in os.listdir(location)
+            if fn.endswith(WARC_EXTENSIONS))
+    else:
+        paths = [location]
+
+    n_imported = 0
+    for path in paths:
+        with open(path, "rb") as f:
+            for header, payload in read_records(f):
+                url = header.get("warc-target-uri", "").strip("<>")
+                if header.get("warc-type") == "resource":
+                    resp_header = {"content-type" : header.get("content-type")}
+                elif header.get("warc-type") == "response":
+                    status, resp_header, payload = _parse_http_response(payload)
+                    if resp_header is None:
+                        logging(f"Not importing {url}: Unsupported HTTP response.",
+                            LOG_WARNING, where = "warc.import_warc")
+                        continue
+                    if not 200 <= status < 300:
+                        logging(f"Not importing {url}: HTTP status {status}.",
+                            LOG_WARNING, where = "warc.import_warc")
+                        continue
+                else:
+                    continue
+                try:
+                    profile = fetch_profile(extract_fully_qualified_domain_name(url))
+                except InputError:
+                    logging(f"Not importing record of {path}: Invalid target URI '{url}'.",
+                        LOG_ERROR, where = "warc.import_warc")
+                    continue
+                if get_file_type_from_response_header(resp_header, False)[0] == "text":
+                    payload = decode_content(payload, resp_header)
+                if profile.get_archive().save_content(url, resp_header, payload) is not None:
+                    profile._deregister_url(url) # pylint: disable=protected-access
+                    n_imported += 1
+    logging(f"Imported {n_imported} pages from {location}.", LOG_INFO)
+    return n_imported
+
+
+def _parse_http_response(payload : bytes) -> Tuple[int, Union[None, dict], bytes]:
+    """Split the block of a 'response' record into the status code, the header
+    (lower case names) and the decoded body. The status is 0 if the status line is
+    invalid. (status, None, b"") if the body cannot be decoded."""
+    head, _, body = payload.partition(b"\r\n\r\n")
+    status_line, *lines = head.split(b"\r\n")
+    try:
+        status = int(status_line.split()[1])
+    except (IndexError, ValueError):
+        status = 0
+    resp_header = {}
+    for line in lines:
+        key, _, value = line.decode("iso-8859-1").partition(":")
+        resp_header[key.strip().lower()] = value.strip()
+
+    if resp_header.get("transfer-encoding", "").lower() == "chunked":
+        body = _dechunk(body)
+    encoding = resp_header.get("content-encoding", "identity").lower()
+    if encoding in ("gzip", "x-gzip"):
+        body = gzip.decompress(body)
+    elif encoding == "deflate":
+        body = zlib.decompress(body)
+    elif encoding != "identity":
+        return status, None, b""
+    return status, resp_header, body
+
+
+def _dechunk(body : bytes) -> bytes:
+    chunks = []
+    pos = 0
+    while True:
+        end = body.find(b"\r\n", pos)
+        if end == -1:
+            break
+        size = int(body[pos:end].split(b";")[0] or b"0", 16)
+        if size == 0:
+            break
+        chunks.append(body[end + 2 : end + 2 + size])
+        pos = end + 2 + size + 2
+    return b"".join(chunks)
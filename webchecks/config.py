@@ -13,6 +13,10 @@ config = {
 
     KEYWORDS : [],
     DO_CRAWL : True,
+    LINK_EXTRACTOR : "auto", # see utils/linkextract.py
+    # search pages for links in other processes, see ParsePool. None: one per CPU
+    PARSE_IN_PROCESSES : False,
+    PARSE_PROCESSES : None,
 
     ## DEFAULT SECURITY POLICY
     ENABLE_JAVASCRIPT : True,
@@ -34,12 +38,43 @@ config = {
     # it by opening Firefox and then pasting 'about:profiles' into the url field
     PROFILE_FIREFOX_BROWSER : '',
     BROWSER_CLEAN_SHEET_SETUP : True,
+    BROWSER_HEADLESS : False,
+    # With Javascript: number of browsers rendering pages at the same time, see RequestJSPool
+    BROWSER_POOL_SIZE : 1,
+    # With Javascript: at most this many requests of a page are kept in memory, None: all
+    BROWSER_MAX_STORED_REQUESTS : None,
     DEFAULT_TIMEOUT_IN_SEC : 20,
+    # Without Javascript: keep many requests (to different domains) in flight at once
+    ENABLE_ASYNC_REQUESTS : False,
+    ASYNC_MAX_IN_FLIGHT : 256,
+    # Without Javascript: revalidate stored pages using ETag and Last-Modified,
+    # unchanged ones (304) are neither stored again nor searched for links
+    CONDITIONAL_REQUESTS : False,
+    CONDITIONAL_REQUESTS_EXTRACT_LINKS : False,
+    # keep the links waiting to be accessed in the project cache, such that the next run
+    # continues with them, see PersistentTimedQueue. At most FRONTIER_WINDOW per domain in memory
+    PERSISTENT_FRONTIER : False,
+    FRONTIER_WINDOW : 100,
 
     # allows other directories like /metadata for project-level metadata
     RESULT_STORAGE_LOCATION : "content",
     CACHE_STORAGE_LOCATION : "content/.cache",
     COMPRESS_CONTENT : True,
+    COMPRESSION_CODEC : "lzma", # see archive/compression.py
+    COMPRESSION_LEVEL : None, # None is the default level of the codec
+    # files: two files per page, pack: append to large segment files, see PackArchive
+    ARCHIVE_BACKEND : "files",
+    PACK_SEGMENT_SIZE : 1 << 30,
+    # store identical content only once per project
+    DEDUPLICATE_CONTENT : False,
+    # zstd only: train a dictionary per domain on its first pages
+    ZSTD_DICTIONARY : False,
+    ZSTD_DICTIONARY_SAMPLES : 100,
+    ZSTD_DICTIONARY_SIZE : 112640,
+    # group the writes to the project cache into transactions, see GlobalCache
+    CACHE_WRITE_BEHIND : False,
+    CACHE_COMMIT_BATCH_SIZE : 1000,
+    CACHE_COMMIT_INTERVAL : 5,
     ## these are defalt policies for profiles.
     ## per profile specifications can be made if required.
     DEFAULT_PER_PROFILE_CONTENT_STORAGE_LOCATION : "%PROFILE_DOMAIN_NAME",
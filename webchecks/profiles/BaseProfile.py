@@ -1,24 +1,27 @@
 """Provides the BaseProfile class."""
 
 import time
-from typing import Collection, Union
+from typing import Collection, FrozenSet, Tuple, Union
 from functools import partial
 from random import expovariate
 
-
-from bs4 import BeautifulSoup
-
 from webchecks.archive.FileArchive import FileArchive
+from webchecks.archive.PackArchive import PackArchive
 from webchecks.utils.Error import OptionsError
 from webchecks.utils.check import input_check
-from webchecks.utils.url import url_is_local,url_is_superlocal, url_is_referencial,\
-  merge_url, extract_fully_qualified_domain_name, merge_ref_url, strip_query_from_url
+from webchecks.utils.url import strip_query_from_url, strong_strip_query_from_url
 from webchecks.utils.messaging import logging
+from webchecks.utils.linkextract import find_links
 
 # pylint: disable=wildcard-import
 from webchecks.config import *
 from .ProfileConstants import *
 
+# config[ARCHIVE_BACKEND] -> archive class
+ARCHIVE_BACKENDS = {
+    "files" : FileArchive,
+    "pack" : PackArchive
+}
 
 
 class BaseProfile:
@@ -63,11 +66,16 @@ class BaseProfile:
         self._set_access_algorithm(ACCESS_EXPONENTIAL_RND_MIN, config[ACCESS_DEFAULT_INTERVAL],
             config[ACCESS_DEFAULT_MIN_WAIT])
         self._access_pattern_is_default = True
+        self.resource_policy = (RESOURCES_ALL, False)
+        self.captured_resources = RESOURCES_ALL
 
-        self.archive = FileArchive(self)
+        self.archive = ARCHIVE_BACKENDS[config[ARCHIVE_BACKEND]](self)
 
         self.links_visited = self.archive.load_links_visited()
         self.waiting_links = set([])
+        # canonical forms (see _url_key) of the links above, for constant time lookup
+        self._visited_keys = set(self._url_key(link) for link in self.links_visited)
+        self._waiting_keys = set([])
 
         self.archive.save_at_shutdown(self._get_links_visited)
 
@@ -78,6 +86,15 @@ class BaseProfile:
         self.archive.quiet_exit()
 
 
+    def update_archive_backend(self):
+        """Call if the archive backend (config[ARCHIVE_BACKEND]) is changed."""
+        archive_class = ARCHIVE_BACKENDS[config[ARCHIVE_BACKEND]]
+        if type(self.archive) is archive_class: # pylint: disable=unidiomatic-typecheck
+            return
+        self.archive.quiet_exit()
+        self.archive = archive_class(self)
+        self.archive.save_at_shutdown(self._get_links_visited)
+
     def get_domain(self) -> str:
         """Get the domain name."""
         return self.domain
@@ -102,6 +119,16 @@ class BaseProfile:
         """Get default http request header. Does not include cookies."""
         return self.headers
 
+    def get_resource_policy(self) -> Tuple[FrozenSet[str], bool]:
+        """Returns (resource types, first_party_only): What the browser may load for pages of
+        this domain if Javascript is enabled. See _set_resource_policy."""
+        return self.resource_policy
+
+    def get_captured_resources(self) -> FrozenSet[str]:
+        """Returns the resource types whose responses are kept (and archived) when a page of
+        this domain is loaded with Javascript enabled. See _set_captured_resources."""
+        return self.captured_resources
+
     def get_archive(self):
         """Returns the FileArchive Object that manages this domains 
         subdirectory in the project directory."""
@@ -130,25 +157,7 @@ class BaseProfile:
         html_source : str
             The page to be analyzed.
         """
-        html_soup = BeautifulSoup(html_source, 'html.parser')
-        links = []
-        atags = html_soup.find_all("a")
-        for tag in atags:
-            link = tag.get("href")
-            if link in (None, ""):
-                continue
-            if url_is_superlocal(link): ## means it just copies the protocol '//newpage.com'
-                link = link.replace("//", "")
-            elif url_is_referencial(link):
-                localref = url.split("#")[0]
-                link = merge_ref_url(localref, link)
-                continue
-            elif url_is_local(link):
-            	# rather than self.domain
-                link = merge_url(extract_fully_qualified_domain_name(url), link)
-            links.append(link)
-
-        return self._register_urls(links)
+        return self._register_urls(find_links(url, html_source, config[LINK_EXTRACTOR]))
 
     def consume_retreived_content(self, url : str, resp_header : dict, content : bytes):
         """After a webaccess happened, this function is called. The main purpose is to
@@ -177,6 +186,43 @@ class BaseProfile:
 
         self.headers[field] = value
 
+    def _set_resource_policy(self, resources : Collection[str],
+            first_party_only : bool = False):
+        """Restrict what the browser loads for pages of this domain if Javascript is
+        enabled. Requests for other resources are aborted before they are sent, which
+        saves time and memory. Pages themselves are always loaded. By default,
+        everything is loaded. Scripts disallowed by the security policy are never loaded.
+
+        Example, only the page, its scripts and the data they fetch:
+
+            self._set_resource_policy(RESOURCES_ESSENTIAL)
+
+        Parameters:
+        -------------
+        resources: collection of str
+            The resource types to load, RESOURCE_ constants from ProfileConstants,
+            e.g. RESOURCES_ESSENTIAL or RESOURCES_ALL.
+        first_party_only: bool
+            Whether to abort requests for resources from other domains (e.g. trackers).
+        """
+        input_check(set(resources) <= RESOURCES_ALL, "resources must be RESOURCE_ constants")
+        self.resource_policy = (frozenset(resources) | {RESOURCE_DOCUMENT}, first_party_only)
+
+    def _set_captured_resources(self, resources : Collection[str]):
+        """Choose which of the responses the browser received while loading a page of this
+        domain are kept, if Javascript is enabled. The others are dropped rather than
+        decoded and archived. The page itself is always kept. By default, all are kept.
+        Unlike _set_resource_policy, this does not change how the page is loaded.
+
+        Parameters:
+        -------------
+        resources: collection of str
+            The resource types to keep, RESOURCE_ constants from ProfileConstants.
+            E.g. (RESOURCE_DOCUMENT,) to only keep the page itself.
+        """
+        input_check(set(resources) <= RESOURCES_ALL, "resources must be RESOURCE_ constants")
+        self.captured_resources = frozenset(resources) | {RESOURCE_DOCUMENT}
+
     def _set_access_algorithm(self, algorithm, avg_wait_time : float = 1,
     		min_wait_time : float = 0.1) -> None:
         """Set the access algorithm that steers at what interval 
@@ -240,8 +286,10 @@ class BaseProfile:
         that this link is no longer in the waiting position. Depending on the policy
         this may start a timer after which this URL may be reaccessible."""
         self.links_visited.add(strip_query_from_url(url))
+        self._visited_keys.add(self._url_key(url))
         try:
             self.waiting_links.remove(url)
+            self._waiting_keys.discard(self._url_key(url))
         except KeyError:
             pass # seed_urls are not stored here.
 
@@ -251,27 +299,15 @@ class BaseProfile:
         It seperately also filters links that are currently in the gateway pipeline.
         The default policy does not allow any reaccessing which may be too restrictive
         for some applications."""
-        urls = list(set(urls))
-        ## avoid requeries within set TODO make this optional
-        for i in range(len(urls) - 1, -1, -1):
-            for j in range(i - 1, -1, -1):
-                try:
-                    link1 = urls[i]
-                    link2 = urls[j]
-                except IndexError: ## too many deletions
-                    break
-                if self.__match(strip_query_from_url(link1), strip_query_from_url(link2)):
-                    del urls[i]
-
-        links = set(urls)
-        links = (links - self.links_visited) - self.waiting_links # visit only new pages
-        urls = set([])
-        for link in links:
-            if self._not_redundant_url(link):
-                urls.add(link)
-        self.waiting_links |= urls
-
-        return list(urls)
+        new_urls = []
+        for link in urls:
+            ## also avoids requeries within the given links TODO make this optional
+            if not self._not_redundant_url(link):
+                continue
+            self._waiting_keys.add(self._url_key(link))
+            self.waiting_links.add(link)
+            new_urls.append(link)
+        return new_urls
 
     def _not_redundant_url(self, url):
         """Decides whether the link has already been accessed or is at least
@@ -280,17 +316,10 @@ class BaseProfile:
         Note that the query inside a link will be ignored to determine equality."""
         # For now a poor mans way... the thing is also that
         # sometimes a query can make a big difference...
-        url = strip_query_from_url(url)
-        for link in self.waiting_links:
-            if self.__match(strip_query_from_url(link), url):
-                return False
-
-        for link in self.links_visited:
-            if self.__match(link, url):
-                return False
-        return True
-
-    def __match(self, s, t):
-        if s == t or s[:-1] == t or s == t[:-1]:
-            return True
-        return False
+        key = self._url_key(url)
+        return key not in self._waiting_keys and key not in self._visited_keys
+
+    def _url_key(self, url : str) -> str:
+        """Canonical form of a link used to decide whether two links are the same:
+        Query and local reference are removed and a trailing '/' is ignored."""
+        return strong_strip_query_from_url(url)
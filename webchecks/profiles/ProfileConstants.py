@@ -4,3 +4,19 @@
 ACCESS_EQUISPACED = 0
 ACCESS_EXPONENTIAL_RND = 1
 ACCESS_EXPONENTIAL_RND_MIN = 2 # asserts a minimum of timeout time
+
+# RESOURCE TYPES a browser loads for a page if Javascript is enabled, see
+# BaseProfile._set_resource_policy
+RESOURCE_DOCUMENT = "document" # the page itself and its frames
+RESOURCE_SCRIPT = "script"
+RESOURCE_XHR = "xhr" # fetch and XMLHttpRequest
+RESOURCE_STYLESHEET = "stylesheet"
+RESOURCE_IMAGE = "image"
+RESOURCE_FONT = "font"
+RESOURCE_MEDIA = "media"
+RESOURCE_OTHER = "other"
+
+RESOURCES_ALL = frozenset((RESOURCE_DOCUMENT, RESOURCE_SCRIPT, RESOURCE_XHR,
+    RESOURCE_STYLESHEET, RESOURCE_IMAGE, RESOURCE_FONT, RESOURCE_MEDIA, RESOURCE_OTHER))
+# enough for most pages to render their content
+RESOURCES_ESSENTIAL = frozenset((RESOURCE_DOCUMENT, RESOURCE_SCRIPT, RESOURCE_XHR))
@@ -16,6 +16,17 @@ DEFAULT_PER_PROFILE_CONTENT_STORAGE_LOCATION = "default_per_profile_content_stor
 RESULT_STORAGE_LOCATION = "result_storage_location"
 CACHE_STORAGE_LOCATION = "cache_storage_location"
 COMPRESS_CONTENT = "compress_content"
+COMPRESSION_CODEC = "compression_codec"
+COMPRESSION_LEVEL = "compression_level"
+ARCHIVE_BACKEND = "archive_backend"
+DEDUPLICATE_CONTENT = "deduplicate_content"
+PACK_SEGMENT_SIZE = "pack_segment_size"
+ZSTD_DICTIONARY = "zstd_dictionary"
+ZSTD_DICTIONARY_SAMPLES = "zstd_dictionary_samples"
+ZSTD_DICTIONARY_SIZE = "zstd_dictionary_size"
+CACHE_WRITE_BEHIND = "cache_write_behind"
+CACHE_COMMIT_BATCH_SIZE = "cache_commit_batch_size"
+CACHE_COMMIT_INTERVAL = "cache_commit_interval"
 UNGUIDED_ACCESS_POLICY = "unguided_access_policy"
 DEFAULT_ROBOTS_TXT_POLICY = "default_robots_txt_policy"
 
@@ -29,7 +40,16 @@ ENABLE_JAVASCRIPT = "enable_javascript"
 LOCATION_FIREFOX_DRIVER = "location_firefox_driver"
 PROFILE_FIREFOX_BROWSER = "profile_firefox_browser"
 BROWSER_CLEAN_SHEET_SETUP = "browser_clean_sheet_setup"
+BROWSER_HEADLESS = "browser_headless"
+BROWSER_POOL_SIZE = "browser_pool_size"
+BROWSER_MAX_STORED_REQUESTS = "browser_max_stored_requests"
 DEFAULT_TIMEOUT_IN_SEC = "default_timeout_in_sec"
+ENABLE_ASYNC_REQUESTS = "enable_async_requests"
+ASYNC_MAX_IN_FLIGHT = "async_max_in_flight"
+CONDITIONAL_REQUESTS = "conditional_requests"
+CONDITIONAL_REQUESTS_EXTRACT_LINKS = "conditional_requests_extract_links"
+PERSISTENT_FRONTIER = "persistent_frontier"
+FRONTIER_WINDOW = "frontier_window"
 
 KEYWORDS = "keywords"
 LOGGING_LEVEL = "logging_level"
@@ -48,6 +68,9 @@ AGENT_NAME = "agent_name"
 USER_AGENT = "user_agent"
 
 DO_CRAWL = "do_crawl"
+LINK_EXTRACTOR = "link_extractor"
+PARSE_IN_PROCESSES = "parse_in_processes"
+PARSE_PROCESSES = "parse_processes"
 
 ACCESS_DEFAULT_INTERVAL = "avg_delay_between_accesses_to_same_domain"
 ACCESS_DEFAULT_MIN_WAIT = "min_delay_between_accesses_to_same_domain"
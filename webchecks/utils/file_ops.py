@@ -2,9 +2,14 @@
 
 
 import re
+import codecs
 from hashlib import md5
-from typing import Tuple
-from mimetypes import guess_all_extensions, guess_type, guess_extension
+from functools import lru_cache
+from typing import Tuple, Union, FrozenSet
+from mimetypes import guess_all_extensions, guess_type, guess_extension, types_map
+from webchecks.profiles.ProfileConstants import RESOURCE_DOCUMENT, RESOURCE_SCRIPT, \
+    RESOURCE_XHR, RESOURCE_STYLESHEET, RESOURCE_IMAGE, RESOURCE_FONT, RESOURCE_MEDIA, \
+    RESOURCE_OTHER
 from .Error import InputError
 from .url import extract_local_path_without_args, remove_args_from_url
 
@@ -17,6 +22,61 @@ def binary_to_text(text : bytes) -> str:
     """Convert bytes to UTF-8 encoded str"""
     return text.decode("utf-8")
 
+# how far into a page to look for <meta charset>, as browsers do
+CHARSET_SNIFF_BYTES = 4096
+_BOMS = ((codecs.BOM_UTF8, "utf-8-sig"), (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"))
+_META_CHARSET = re.compile(rb"<meta[^>]+charset\s*=\s*[\"']?\s*([a-zA-Z0-9_.:-]+)", re.IGNORECASE)
+
+def get_charset(content : bytes, header : dict) -> str:
+    """Determines the character encoding of a page: From its byte order mark, else the
+    charset in the Content-Type of the header, else a <meta> tag in the first
+    CHARSET_SNIFF_BYTES bytes. UTF-8 if none of them says anything usable.
+
+    Parameters:
+    -------------
+    content: bytes
+        The data retreived.
+    header: dict
+        Response header.
+    """
+    for bom, charset in _BOMS:
+        if content.startswith(bom):
+            return charset
+    candidates = []
+    content_type = header.get("content-type") if header else None
+    if isinstance(content_type, bytes):
+        content_type = binary_to_text(content_type)
+    if content_type:
+        for param in content_type.split(";")[1:]:
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "charset":
+                candidates.append(value.strip().strip("\"'"))
+    match = _META_CHARSET.search(content, 0, CHARSET_SNIFF_BYTES)
+    if match is not None:
+        candidates.append(match.group(1).decode("ascii"))
+    for charset in candidates:
+        try:
+            return codecs.lookup(charset).name
+        except LookupError:
+            continue
+    return "utf-8"
+
+def decode_content(content : Union[str, bytes], header : dict) -> str:
+    """Decode a page using the charset determined by get_charset. Bytes that are
+    invalid in that charset are replaced rather than raising an error.
+
+    Parameters:
+    -------------
+    content: bytes or str
+        The data retreived. Returned as is if already str.
+    header: dict
+        Response header.
+    """
+    if isinstance(content, str):
+        return content
+    return content.decode(get_charset(content, header), "replace")
+
 def get_file_name_from_url(url : str, fext : str = "") -> str:
     """Gets the file name of the webresource that is pointed to by the URL.
     Optionally will ensure that the file name ends with a specified file extension.
@@ -89,6 +149,70 @@ def hash_string(s : str) -> str:
     return md5(s).digest()
 
 
+@lru_cache(maxsize = 1 << 14)
+def is_script_url(url : str) -> bool:
+    """Whether the url likely refers to Javascript, judging by the url alone
+    (see refd_content_may_have_fileformat), with or without its query.
+    The result is cached, so asking again for the same url is cheap.
+
+    Parameters:
+    -------------
+    url: str
+        The URL of that resource.
+    """
+    return refd_content_may_have_fileformat(url, "js") or \
+        refd_content_may_have_fileformat(remove_args_from_url(url), "js")
+
+# Sec-Fetch-Dest request header -> resource type
+_FETCH_DEST = {
+    "document" : RESOURCE_DOCUMENT, "iframe" : RESOURCE_DOCUMENT, "frame" : RESOURCE_DOCUMENT,
+    "script" : RESOURCE_SCRIPT, "worker" : RESOURCE_SCRIPT, "sharedworker" : RESOURCE_SCRIPT,
+    "serviceworker" : RESOURCE_SCRIPT, "empty" : RESOURCE_XHR, "style" : RESOURCE_STYLESHEET,
+    "image" : RESOURCE_IMAGE, "font" : RESOURCE_FONT, "audio" : RESOURCE_MEDIA,
+    "video" : RESOURCE_MEDIA, "track" : RESOURCE_MEDIA,
+}
+# major mime type -> resource type, for requests without Sec-Fetch-Dest
+_MIME_MAJOR = {"image" : RESOURCE_IMAGE, "font" : RESOURCE_FONT, "audio" : RESOURCE_MEDIA,
+    "video" : RESOURCE_MEDIA}
+
+def get_resource_type(url : str, fetch_dest : str = None) -> str:
+    """Returns the type of resource a browser requests, one of the RESOURCE_ constants
+    from ProfileConstants. Determined by the Sec-Fetch-Dest header of the request
+    (sent by Firefox and Chrome) if given, otherwise guessed from the URL.
+
+    Parameters:
+    -------------
+    url: str
+        The URL requested.
+    fetch_dest: str or None
+        The value of the Sec-Fetch-Dest header of the request.
+    """
+    if fetch_dest:
+        return _FETCH_DEST.get(fetch_dest.lower(), RESOURCE_OTHER)
+    mime = guess_type(remove_args_from_url(url))[0]
+    if mime is None:
+        return RESOURCE_OTHER
+    if mime == "text/css":
+        return RESOURCE_STYLESHEET
+    if "javascript" in mime:
+        return RESOURCE_SCRIPT
+    if mime in ("text/html", "application/xhtml+xml"):
+        return RESOURCE_DOCUMENT
+    return _MIME_MAJOR.get(mime.split("/")[0], RESOURCE_OTHER)
+
+@lru_cache(maxsize = 64)
+def resource_extensions(resource_types : FrozenSet[str]) -> Tuple[str, ...]:
+    """File extensions (with the dot, lower case) of the urls get_resource_type guesses
+    to be of one of the given resource types, if there is no Sec-Fetch-Dest header.
+
+    Parameters:
+    -------------
+    resource_types: frozenset of str
+        RESOURCE_ constants from ProfileConstants.
+    """
+    return tuple(sorted(ext for ext in types_map
+        if get_resource_type("x" + ext) in resource_types))
+
 def get_file_type_from_response_header(header : dict, throw_error : bool = True) -> Tuple[str, str]:
     """Given the header, it will try to guess the file type of the data returned.
     If no data is there or the header is invalid, it optionally throws the error
@@ -0,0 +1,133 @@
+"""Provides extract_hrefs, which finds the targets of the links (<a href>) on a page,
+and find_links, which turns them into the links to be visited.
+
+Several backends are supported. The fastest one available is picked when this module
+is first imported: selectolax or lxml if installed, otherwise a tokenizer in pure Python
+that, unlike BeautifulSoup, does not build a tree of the document."""
+
+from html.parser import HTMLParser
+from typing import Callable, Dict, List, Tuple
+
+from webchecks.utils.Error import OptionsError
+from webchecks.utils.url import url_is_local, url_is_superlocal, url_is_referencial, \
+    merge_url, extract_fully_qualified_domain_name, merge_ref_url
+
+try:
+    from selectolax.parser import HTMLParser as SelectolaxParser
+except ImportError: # optional
+    SelectolaxParser = None
+
+try:
+    import lxml.html
+    from lxml.etree import ParserError
+except ImportError: # optional
+    lxml = None
+
+
+class _HrefTokenizer(HTMLParser):
+    """Collects the href attributes of <a> tags while the page is being tokenized."""
+
+    def __init__(self):
+        super().__init__()
+        self.hrefs = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "a":
+            self.hrefs.append(dict(attrs).get("href"))
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+
+
+def _extract_stream(html : str) -> List[str]:
+    tokenizer = _HrefTokenizer()
+    tokenizer.feed(html)
+    tokenizer.close()
+    return tokenizer.hrefs
+
+
+def _extract_bs4(html : str) -> List[str]:
+    # pylint: disable-next=import-outside-toplevel
+    from bs4 import BeautifulSoup # slowest, only imported if asked for
+    return [tag.get("href") for tag in BeautifulSoup(html, "html.parser").find_all("a")]
+
+
+def _extract_selectolax(html : str) -> List[str]:
+    return [node.attributes.get("href") for node in SelectolaxParser(html).css("a")]
+
+
+def _extract_lxml(html : str) -> List[str]:
+    try:
+        tree = lxml.html.document_fromstring(html.encode("utf-8"),
+            parser = lxml.html.HTMLParser(encoding = "utf-8"))
+    except ParserError: # empty document
+        return []
+    return [tag.get("href") for tag in tree.iter("a")]
+
+
+# name -> extractor, in order of preference
+_backends : Dict[str, Callable[[str], List[str]]] = {}
+if SelectolaxParser is not None:
+    _backends["selectolax"] = _extract_selectolax
+if lxml is not None:
+    _backends["lxml"] = _extract_lxml
+_backends["stream"] = _extract_stream
+_backends["bs4"] = _extract_bs4
+
+DEFAULT_BACKEND = next(iter(_backends))
+
+
+def available_backends() -> Tuple[str]:
+    """Names of the backends that can be used, the default one first."""
+    return tuple(_backends)
+
+
+def extract_hrefs(html : str, backend : str = "auto") -> List[str]:
+    """Returns the href attributes of all <a> tags of the page in document order.
+    None for tags without one. Raises OptionsError if the backend is not available.
+
+    Parameters:
+    -------------
+    html : str
+        The page.
+    backend : str
+        One of available_backends(). 'auto' means DEFAULT_BACKEND.
+    """
+    if backend == "auto":
+        backend = DEFAULT_BACKEND
+    try:
+        extractor = _backends[backend]
+    except KeyError:
+        raise OptionsError("link extractor", ("auto",) + available_backends()) from None
+    return extractor(html)
+
+
+def find_links(url : str, html : str, backend : str = "auto") -> List[str]:
+    """Returns the links on the page, local ones made absolute and references within the
+    page left out. This is what BaseProfile.get_links finds, before filtering the links
+    visited already. Depends on nothing but its arguments, thus can run in another process.
+
+    Parameters:
+    -------------
+    url : str
+        The url of the page. Needed for local links on that page.
+    html : str
+        The page.
+    backend : str
+        See extract_hrefs.
+    """
+    links = []
+    for link in extract_hrefs(html, backend):
+        if link in (None, ""):
+            continue
+        if url_is_superlocal(link): ## means it just copies the protocol '//newpage.com'
+            link = link.replace("//", "")
+        elif url_is_referencial(link):
+            localref = url.split("#")[0]
+            link = merge_ref_url(localref, link)
+            continue
+        elif url_is_local(link):
+            # rather than the domain of the profile
+            link = merge_url(extract_fully_qualified_domain_name(url), link)
+        links.append(link)
+    return links
@@ -1,6 +1,11 @@
-"""Procides the logging utilities."""
+"""Procides the logging utilities.
+
+Log files are kept open and written to in blocks rather than opened for every message,
+use flush_logs to write out everything logged so far."""
 
 import time
+import atexit
+import threading
 from webchecks.config import config, LOGGING_FILE, LOGGING_LEVEL, \
     LOG_DEBUG, LOG_ERROR, LOG_INFO, LOG_WARNING, LOGGING_LINKS
 from webchecks.utils.check import input_check
@@ -17,6 +22,45 @@ def log_level_to_string(log_level):
         return "error"
     return f"log_level-{log_level}"
 
+# log files are kept open and written in blocks, see _write
+LOG_FLUSH_INTERVAL = 1 # seconds
+_files = {} # path -> file
+_files_lock = threading.Lock() # logging happens from several threads, e.g. in RequestAsync
+_last_flush = time.time()
+
+def _write(path : str, text : str, flush : bool = False):
+    """Append to the file. Written to disk once the buffer is full, LOG_FLUSH_INTERVAL
+    seconds passed since the last flush, flush is set or at shutdown."""
+    global _last_flush # pylint: disable=global-statement
+    with _files_lock:
+        try:
+            f = _files[path]
+        except KeyError:
+            # pylint: disable-next=consider-using-with
+            f = _files[path] = open(path, "a", buffering = 1 << 16)
+        f.write(text)
+        now = time.time()
+        if flush or now - _last_flush >= LOG_FLUSH_INTERVAL:
+            for g in _files.values():
+                g.flush()
+            _last_flush = now
+
+def flush_logs():
+    """Write everything logged so far to the log files. Done at shutdown too."""
+    with _files_lock:
+        for f in _files.values():
+            f.flush()
+
+def close_logs():
+    """Write everything logged so far to the log files and close them.
+    They are opened again when logging next."""
+    with _files_lock:
+        for f in _files.values():
+            f.close()
+        _files.clear()
+
+atexit.register(close_logs)
+
 def logging(string, log_level : int = LOG_DEBUG, tofile : bool = False, where : str = ""):
     """Logging utility. 
 
@@ -34,22 +78,26 @@ def logging(string, log_level : int = LOG_DEBUG, tofile : bool = False, where :
     input_check(log_level in range(4),
         "Bad input to logging: Check constants in the constants.py file.")
 
+    to_file = (tofile or log_level != LOG_DEBUG) and config[LOGGING_FILE] != ""
+    to_console = config[LOGGING_LEVEL] <= log_level
+    if not (to_file or to_console):
+        return
+
     logtype = log_level_to_string(log_level)
     if where == "":
         where = logging_get_where()
     msg = f"[{logtype}] {where}: {string}"
-    if (tofile or log_level != LOG_DEBUG) and config[LOGGING_FILE] != "":
-        with open(config[LOGGING_FILE], "a") as f:
-            f.write("".join((time.asctime(), " ", msg, "\n")))
+    if to_file: # errors are written right away, as they may precede a crash
+        _write(config[LOGGING_FILE], "".join((time.asctime(), " ", msg, "\n")),
+            log_level == LOG_ERROR)
 
-    if config[LOGGING_LEVEL] <= log_level:
+    if to_console:
         print(msg)
 
 def log_link(url : str):
     """Special utility to log an accessed link. Writes the link down into the appropriate file."""
     if config[LOGGING_LINKS] != "":
-        with open(config[LOGGING_LINKS], "a") as f:
-            f.write(url + "\n")
+        _write(config[LOGGING_LINKS], url + "\n")
     #logging(f"Accessing link {url}", log_level)
 
 
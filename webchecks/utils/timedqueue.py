@@ -1,5 +1,12 @@
-"""Provides the TimedQueue class."""
+"""Provides the TimedQueue class and its persistent variant PersistentTimedQueue."""
 
+import time
+import json
+import heapq
+import atexit
+import sqlite3
+from itertools import count
+from collections import deque
 from typing import Union, Any
 
 class TimedQueue:
@@ -11,18 +18,26 @@ class TimedQueue:
     Note that the notion of time is arbitrary: The user passes the current time in each call.
     Thus, this may not be literal time but may be some counter.
 
+    Internally, every nonempty queue has exactly one entry in a min-heap holding the time
+    at which its first element becomes ready. Dequeueing thus costs O(log k) for k nonempty
+    queues and checking for emptiness is O(1).
     """
 
     def __init__(self):
         self.queue = {}
-        self.timestamp = 0
-        self.value = 1
+        self.ready = [] # heap of (ready_time, tiebreak, key), one per nonempty queue
+        self.size = 0
+        self._tiebreak = count() # keys need not be comparable
+
+    def __len__(self):
+        return self.size
 
     def enqueue(self, key, value : Any, delay : Union[int, float],
-            current_time : Union[int, float]):
+            current_time : Union[int, float]) -> bool:
         """
-        Add an element to the queue. Note that if the specified queue is empty, 
-        that new element will be delayed by the specified amount too. Return is void.
+        Add an element to the queue. Note that if the specified queue is empty,
+        that new element will be delayed by the specified amount too. Returns True,
+        it was added (see PersistentTimedQueue.enqueue).
 
         Parameters:
         -------------
@@ -39,41 +54,258 @@ class TimedQueue:
         Thus, this may not be literal time but may be some counter.
         """
         try:
-            if len(self.queue[key]) > 0:
-                self.queue[key].append((delay, value))
-            else:
-                self.queue[key].append((current_time + delay, value))
+            domain_queue = self.queue[key]
         except KeyError:
-            self.queue[key] = [(current_time + delay, value)]
+            domain_queue = self.queue[key] = deque()
+
+        if len(domain_queue) == 0:
+            heapq.heappush(self.ready, (current_time + delay, next(self._tiebreak), key))
+        domain_queue.append((delay, value))
+        self.size += 1
+        return True
 
     def dequeue(self, current_time: Union[str, int]) -> Any:
         """
         Pop an element who has been long enough in the queue and has passed its delay requirement.
+        If several queues are ready, the one that has been ready for the longest time is served.
 
         Parameters:
         -------------
         current_time: int or float
             The current timestamp. This may e.g. be Nanoseconds after program start.
         """
-        for key in self.queue:
-            if len(self.queue[key]) == 0:
-                continue
+        if not self.ready or self.ready[0][0] > current_time:
+            return None
 
-            ## first entry is ready to go
-            if self.queue[key][0][self.timestamp] <= current_time:
-                ret = self.queue[key][0] # the first element
-                self.queue[key] = self.queue[key][1:] # all other elements remain
-                if len(self.queue[key]) > 0: # make sure first element has nonrelative timestamp
-                    self.queue[key][0] = (self.queue[key][0][0] + current_time,
-                        self.queue[key][0][1])
-                return ret[1]
-        return None
+        _, _, key = heapq.heappop(self.ready)
+        domain_queue = self.queue[key]
+        _, value = domain_queue.popleft()
+        self.size -= 1
+        if len(domain_queue) > 0: # delay of the next element is relative to now
+            heapq.heappush(self.ready,
+                (current_time + domain_queue[0][0], next(self._tiebreak), key))
+        else:
+            del self.queue[key]
+        return value
 
     def isempty(self):
         """
         Returns boolean, signaling whether the queue is empty.
         """
-        for (_, domain_queue) in self.queue.items():
-            if len(domain_queue) > 0:
-                return False
+        return self.size == 0
+
+    def done(self, key, value : Any):
+        """
+        Tell that an element dequeued was handled. Nothing to do here,
+        see PersistentTimedQueue.done.
+
+        Parameters:
+        -------------
+        key: Hashable Object
+            The queue the element was dequeued from.
+        value: Object
+            The element.
+        """
+
+    def next_ready_time(self) -> Union[None, int, float]:
+        """
+        Returns the time at which the next element becomes ready,
+        or None if the queue is empty.
+        """
+        if not self.ready:
+            return None
+        return self.ready[0][0]
+
+    def time_until_ready(self, current_time : Union[int, float]) -> Union[None, int, float]:
+        """
+        Returns how long it takes from current_time until the next element can be dequeued.
+        That is 0 if an element is ready already and None if the queue is empty.
+
+        Parameters:
+        -------------
+        current_time: int or float
+            The current timestamp.
+        """
+        ready_time = self.next_ready_time()
+        if ready_time is None:
+            return None
+        return max(0, ready_time - current_time)
+
+
+class PersistentTimedQueue(TimedQueue):
+    """
+    TimedQueue that keeps its elements in an SQLite database, such that they survive the end
+    of the program and the queue may hold more elements than fit into memory.
+    Opening the same database again resumes the queue: Every nonempty queue becomes ready
+    after the delay of its first element, as if that one had just been enqueued.
+
+    Only the first few elements of each queue (at most window) are held in memory,
+    the rest is loaded as they are needed. Writes are grouped into transactions of at most
+    commit_batch_size writes or commit_interval seconds, use flush to commit explicitly.
+    This is done by close and at shutdown too.
+
+    Elements dequeued stay in the database until done is called for them. Those that were
+    not done (e.g. still being processed when the program stopped) are dequeued again
+    when the queue is resumed.
+
+    Keys must be str or int and elements JSON serializable, they come back as decoded by
+    json (e.g. a list rather than a tuple). An element that is waiting in the queue of
+    that key already (or was dequeued but is not done) is not added again, enqueue
+    returns whether it was added.
+
+    Parameters:
+    -------------
+    path: str
+        The database file. Created if it does not exist.
+    current_time: int or float
+        The current timestamp, for the queues resumed.
+    window: int
+        Maximum number of elements per queue held in memory.
+    commit_batch_size: int
+        Maximum number of writes per transaction.
+    commit_interval: int or float
+        Maximum number of seconds (actual time) between two commits.
+    """
+
+    def __init__(self, path : str, current_time : Union[int, float] = 0, window : int = 100,
+            commit_batch_size : int = 1000, commit_interval : Union[int, float] = 5):
+        super().__init__()
+        self.window = window
+        self.commit_batch_size = commit_batch_size
+        self.commit_interval = commit_interval
+        self.on_disk = {} # key -> number of elements of that queue not loaded into memory
+        self.loaded_until = {} # key -> id of the last element loaded into memory
+        self.pending_writes = 0
+        self.last_commit = time.time()
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        with self.db:
+            self.db.execute("CREATE TABLE IF NOT EXISTS frontier"
+                "(id INTEGER PRIMARY KEY, key, value, delay, UNIQUE(key, value))")
+            self.db.execute("CREATE INDEX IF NOT EXISTS frontier_key ON frontier(key, id)")
+        for key, n in self.db.execute("SELECT key, COUNT(*) FROM frontier GROUP BY key"):
+            self.size += n
+            self.on_disk[key] = n
+            self.loaded_until[key] = -1
+            self.queue[key] = deque()
+            self._load(key)
+            heapq.heappush(self.ready,
+                (current_time + self.queue[key][0][0], next(self._tiebreak), key))
+        atexit.register(self.close)
+
+    def enqueue(self, key, value : Any, delay : Union[int, float],
+            current_time : Union[int, float]) -> bool:
+        """
+        Add an element to the queue, see TimedQueue.enqueue. Returns whether it was added,
+        i.e. False if it is waiting in that queue already or was dequeued but is not done.
+
+        Parameters:
+        -------------
+        key: str or int
+            Specifies the queue.
+        value: Object
+            The element to be added, JSON serializable.
+        delay: int or float
+            Delay of that element
+        current_time: int or float
+            The current timestamp.
+        """
+        cu = self.db.execute("INSERT OR IGNORE INTO frontier(key, value, delay) VALUES (?, ?, ?)",
+            (key, json.dumps(value), delay))
+        if cu.rowcount == 0:
+            return False
+        self._commit()
+
+        domain_queue = self.queue.get(key)
+        if domain_queue is None:
+            domain_queue = self.queue[key] = deque()
+            self.on_disk[key] = 0
+        if len(domain_queue) == 0 and self.on_disk[key] == 0:
+            heapq.heappush(self.ready, (current_time + delay, next(self._tiebreak), key))
+        if self.on_disk[key] == 0 and len(domain_queue) < self.window:
+            domain_queue.append((delay, value, cu.lastrowid))
+            self.loaded_until[key] = cu.lastrowid
+        else:
+            self.on_disk[key] += 1
+        self.size += 1
         return True
+
+    def dequeue(self, current_time: Union[str, int]) -> Any:
+        """
+        Pop an element who has been long enough in the queue, see TimedQueue.dequeue.
+
+        Parameters:
+        -------------
+        current_time: int or float
+            The current timestamp.
+        """
+        if not self.ready or self.ready[0][0] > current_time:
+            return None
+
+        _, _, key = heapq.heappop(self.ready)
+        domain_queue = self.queue[key]
+        _, value, _ = domain_queue.popleft() # kept in the database until done
+        self.size -= 1
+        if len(domain_queue) == 0 and self.on_disk[key] > 0:
+            self._load(key)
+        if len(domain_queue) > 0: # delay of the next element is relative to now
+            heapq.heappush(self.ready,
+                (current_time + domain_queue[0][0], next(self._tiebreak), key))
+        else:
+            del self.queue[key]
+            del self.on_disk[key]
+            del self.loaded_until[key]
+        return value
+
+    def done(self, key, value : Any):
+        """
+        Remove an element dequeued from the database, once it was handled. Otherwise it is
+        dequeued again when the queue is resumed.
+
+        Parameters:
+        -------------
+        key: str or int
+            The queue the element was dequeued from.
+        value: Object
+            The element.
+        """
+        self.db.execute("DELETE FROM frontier WHERE key = ? AND value = ?",
+            (key, json.dumps(value)))
+        self._commit()
+
+    def flush(self):
+        """
+        Commit all pending writes.
+        """
+        self.db.commit()
+        self.pending_writes = 0
+        self.last_commit = time.time()
+
+    def close(self):
+        """
+        Commit all pending writes and close the database. The queue cannot be used afterwards.
+        """
+        if self.db is None:
+            return
+        self.flush()
+        self.db.close()
+        self.db = None
+        atexit.unregister(self.close)
+
+    def _commit(self):
+        self.pending_writes += 1
+        if self.pending_writes >= self.commit_batch_size or \
+                time.time() - self.last_commit >= self.commit_interval:
+            self.flush()
+
+    def _load(self, key):
+        """Load the next elements of the queue of that key into memory."""
+        rows = self.db.execute("SELECT id, value, delay FROM frontier "
+            "WHERE key = ? AND id > ? ORDER BY id LIMIT ?",
+            (key, self.loaded_until[key], self.window)).fetchall()
+        for rowid, value, delay in rows:
+            self.queue[key].append((delay, json.loads(value), rowid))
+        self.on_disk[key] -= len(rows)
+        if rows:
+            self.loaded_until[key] = rows[-1][0]
@@ -1,6 +1,7 @@
 """Provides utilities to extract information and modify URLs."""
 
 import re
+from functools import lru_cache
 from typing import Collection
 from mimetypes import guess_type
 
@@ -8,14 +9,52 @@ from .Error import InputError
 
 URL = re.compile(r"^(([a-z]*)://)?(([a-zA-Z0-9\-]+\.)*)([a-zA-Z0-9\-]+)\.([a-z]+)(/.*)?$")
 
-def __extract(url : str):
+# number of distinct URLs whose parsed form is kept around
+PARSE_CACHE_SIZE = 1 << 16
+
+
+class ParsedURL:
+    """The components of an URL. Do not create it yourself, use parse_url.
+
+    Example for 'https://en.wiki.org/page?q=1':
+        protocol 'https', subdomains 'en.', domain_name 'wiki', tld 'org',
+        domain 'wiki.org', fqdn 'en.wiki.org', path_and_args '/page?q=1', path '/page'
+    """
+    __slots__ = ("url", "protocol", "subdomains", "domain_name", "tld", "domain", "fqdn",
+        "path_and_args", "path")
+
+    def __init__(self, url : str, match : re.Match):
+        self.url = url
+        self.protocol = match.group(2)
+        self.subdomains = match.group(3)
+        self.domain_name = match.group(5)
+        self.tld = match.group(6)
+        self.domain = "".join((self.domain_name, ".", self.tld))
+        self.fqdn = self.subdomains + self.domain
+        path_and_args = match.group(7)
+        self.path_and_args = "" if path_and_args is None else path_and_args
+        self.path = remove_args_from_url(self.path_and_args)
+
+    def __repr__(self):
+        return f"ParsedURL({self.url!r})"
+
+
+def parse_url(url : str) -> ParsedURL:
+    """Parses the url once and returns its components as ParsedURL.
+    The result is cached, so asking again for the same url is cheap.
+    If the string passed in is not an url, it will raise an InputError.
+    """
     if not isinstance(url, str):
         raise InputError("URL is not string type thus not a url.")
-    m = re.match(URL, url)
+    return _parse_url(url)
+
+@lru_cache(maxsize = PARSE_CACHE_SIZE)
+def _parse_url(url : str) -> ParsedURL:
+    m = URL.match(url)
     if not m:
         raise InputError(f"Tried to extract url information from {url}"
             " which appears to be no valid url.")
-    return m
+    return ParsedURL(url, m)
 
 def extract_protocol(url : str) -> str:
     """Returns, given some url, the protocol that it uses.
@@ -23,7 +62,7 @@ def extract_protocol(url : str) -> str:
     If the string passed in is not an url, it will raise an InputError.
     """
 
-    return __extract(url).group(2)
+    return parse_url(url).protocol
 
 def extract_domain_name(url : str) -> str:
     """Returns, given some url, the domain name.
@@ -35,16 +74,13 @@ def extract_domain_name(url : str) -> str:
     extract_domain_name('hello.world.com/ok') == 'world'
     """
 
-    return __extract(url).group(5)
+    return parse_url(url).domain_name
 
 def extract_fully_qualified_domain_name(url : str) -> str:
     """Returns the FQDN.
     If the string passed in is not an url, it will raise an InputError.
     """
-    subdom = __extract(url).group(3)
-    if subdom is None:
-        subdom = ""
-    return subdom + extract_domain(url)
+    return parse_url(url).fqdn
 
 def extract_domain(url : str) -> str:
     """Returns for given url, the domain.
@@ -53,7 +89,7 @@ def extract_domain(url : str) -> str:
     extract_domain('https://ok.world.go') == 'world.go'
     """
 
-    return "".join([extract_domain_name(url), ".", extract_tld(url)])
+    return parse_url(url).domain
 
 def extract_tld(url : str) -> str:
     """Returns, given some url, the top level domain name.
@@ -61,7 +97,7 @@ def extract_tld(url : str) -> str:
     If the string passed in is not an url, it will raise an InputError.
     """
 
-    return __extract(url).group(6)
+    return parse_url(url).tld
 
 def extract_local_path_and_args(url : str) -> str:
     """Given url, it returns the local path and arguments in the url.
@@ -69,10 +105,7 @@ def extract_local_path_and_args(url : str) -> str:
     If the string passed in is not an url, it will raise an InputError.
     """
 
-    s = __extract(url).group(7)
-    if s is None:
-        return ""
-    return s
+    return parse_url(url).path_and_args
 
 def add_protocol(protocol : str, url : str) -> str:
     """Adds a protocol to an url that has no protocol yet specified.
@@ -80,21 +113,18 @@ def add_protocol(protocol : str, url : str) -> str:
     If the string passed in is not an url, it will raise an InputError.
     """
 
-    m = __extract(url)
-    if m.group(2) is not None:
+    p = parse_url(url)
+    if p.protocol is not None:
         raise ValueError(f"Url {url} to add protocol {protocol} \
-        already has a protocol, {m.group(2)}.")
+        already has a protocol, {p.protocol}.")
     return "".join([protocol, "//:", url])
 
 def change_protocol(protocol : str, url : str) -> str:
     """Changes the protocol (if any present) to the given protocol.
     """
 
-    m = __extract(url)
-
-    after = "" if m.group(7) is None else m.group(7)
-    return "".join([f"{protocol}://", m.group(3), m.group(5), ".",
-        m.group(6), after])
+    p = parse_url(url)
+    return "".join([f"{protocol}://", p.fqdn, p.path_and_args])
 
 def is_url(url : str) -> bool:
     """For a given string returns whether it has the format of an url.
@@ -103,9 +133,8 @@ def is_url(url : str) -> bool:
     """
 
     try:
-        if __extract(url):
-            return True
-        return False
+        parse_url(url)
+        return True
     except InputError:
         return False
 
@@ -206,10 +235,7 @@ def remove_args_from_url(link : str) -> str:
 
 def extract_local_path_without_args(link : str) -> str:
     """Remove domain name, query and local reference from the URL."""
-    l = extract_local_path_and_args(link)
-    if l == "":
-        return ""
-    return remove_args_from_url(l)
+    return parse_url(link).path
 
 def strip_query_from_url(url : str) -> str:
     """Deprecated, uses the remove_args_from_url."""